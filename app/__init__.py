@@ -6,11 +6,55 @@ def create_app(config_class=Config):
     app = Flask(__name__)
     app.config.from_object(config_class)
     
+    # Chart figures are serialized once and embedded verbatim in responses
+    from app.utils.raw_json import RawJSONProvider
+    app.json = RawJSONProvider(app)
+    
     # Ensure upload directory exists
     os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
     
-    # Ensure exports/charts directory exists
-    os.makedirs('exports/charts', exist_ok=True)
+    # Keep session data server-side; the cookie only carries a signed id.
+    # Expired sessions release their upload references.
+    from app.utils.session_store import ServerSideSessionInterface, create_session_store
+    from app.utils.upload_store import UploadStore
+    upload_store = UploadStore(app.config['UPLOAD_FOLDER'])
+    app.session_interface = ServerSideSessionInterface(
+        create_session_store(app.config), on_expire=upload_store.release_session
+    )
+    
+    # Ensure exports/charts directory exists and old chart images are pruned
+    from app.utils.chart_artifacts import CHART_DIRECTORY, chart_retention
+    os.makedirs(CHART_DIRECTORY, exist_ok=True)
+    chart_retention.configure(
+        directory=CHART_DIRECTORY,
+        max_age=app.config['CHART_RETENTION_SECONDS'],
+        max_files=app.config['CHART_MAX_FILES'],
+        interval=app.config['CHART_PRUNE_INTERVAL']
+    )
+    
+    # Size the shared DataFrame cache from config
+    from app.utils.dataframe_cache import dataframe_cache
+    dataframe_cache.configure(app.config['DATAFRAME_CACHE_MAX_BYTES'])
+    
+    # Point the query result, generated-code and chart caches at their on-disk tiers
+    from app.utils.query_cache import query_cache, generated_code_cache, chart_cache
+    for cache, cache_dir in ((query_cache, app.config['QUERY_CACHE_DIR']),
+                             (generated_code_cache, app.config['GENERATED_CODE_CACHE_DIR']),
+                             (chart_cache, app.config['CHART_CACHE_DIR'])):
+        cache.configure(
+            cache_dir=cache_dir,
+            ttl=app.config['QUERY_CACHE_TTL'],
+            max_entries=app.config['QUERY_CACHE_MAX_ENTRIES'],
+            max_disk_entries=app.config['QUERY_CACHE_MAX_DISK_ENTRIES']
+        )
+    
+    # Size the background job pool used by async queries
+    from app.utils.job_queue import job_queue
+    job_queue.configure(
+        max_workers=app.config['JOB_WORKERS'],
+        max_pending=app.config['JOB_MAX_PENDING'],
+        result_ttl=app.config['JOB_RESULT_TTL']
+    )
     
     # Register blueprints
     from app.routes import main
@@ -1,9 +1,17 @@
-from flask import Blueprint, render_template, request, jsonify, session, flash, redirect, url_for
+from flask import Blueprint, render_template, request, jsonify, session, flash, redirect, url_for, current_app, Response, abort, send_from_directory
 from app.utils.data_processor import DataProcessor
 from app.utils.query_processor import QueryProcessor
-from app.utils.visualization_processor import VisualizationProcessor
+from app.utils.visualization_processor import CHART_SPEC_KEYS, VisualizationProcessor
+from app.utils.data_preview import PREVIEW_PAGE_SIZE, PreviewError, parse_filter
+from app.utils.job_queue import job_queue, QueueFullError
+from app.utils import raw_json
+from app.utils.chart_artifacts import (CHART_ASSET_MAX_AGE, CHART_DIGEST_PATTERN, CHART_DIRECTORY,
+                                      PINNED_CHART_PATTERN, PINNED_CHART_SUBDIRECTORY, pin_chart,
+                                      recorded_chart_digest)
+from app.utils.query_cache import chart_cache
 from datetime import datetime
 import os
+import uuid
 
 main = Blueprint('main', __name__)
 data_processor = DataProcessor()
@@ -17,7 +25,11 @@ def index():
 
 @main.route('/upload', methods=['POST'])
 def upload_file():
-    """Handle file upload"""
+    """Handle file upload
+    
+    With an ``append_to`` form field naming an uploaded file, the rows of
+    the uploaded CSV are appended to that dataset instead.
+    """
     if 'file' not in request.files:
         return jsonify({'success': False, 'error': 'No file provided'})
     
@@ -26,6 +38,27 @@ def upload_file():
     if file.filename == '':
         return jsonify({'success': False, 'error': 'No file selected'})
     
+    append_to = request.form.get('append_to')
+    if append_to:
+        result = data_processor.append_file_to_session(file, append_to, session)
+        if not result['success']:
+            return jsonify({'success': False, 'error': result['error']})
+        
+        updated_charts = _follow_appended_dataset(result['previous_file_info'], result['file_info'])
+        session.modified = True
+        message = f"Appended {result['appended_rows']} rows from {file.filename} to {append_to}"
+        if result['widened_columns']:
+            message += f"; column type changed for {', '.join(result['widened_columns'])}"
+        return jsonify({
+            'success': True,
+            'message': message,
+            'file_info': result['file_info'],
+            'malformed_lines': result['malformed_lines'],
+            'appended_rows': result['appended_rows'],
+            'widened_columns': result['widened_columns'],
+            'updated_charts': updated_charts
+        })
+    
     # Check if we already have 2 files uploaded
     if 'uploaded_files' in session and len(session['uploaded_files']) >= 2:
         return jsonify({'success': False, 'error': 'Maximum 2 files allowed'})
@@ -38,11 +71,29 @@ def upload_file():
         return jsonify({
             'success': True,
             'message': f'File {file.filename} uploaded successfully',
-            'file_info': result['file_info']
+            'file_info': result['file_info'],
+            'malformed_lines': result['malformed_lines']
         })
     else:
         return jsonify({'success': False, 'error': result['error']})
 
+def _follow_appended_dataset(previous, current):
+    """Point dashboard charts of an appended dataset at the combined data
+    
+    Charts backed by per-category aggregates are updated from the new rows
+    right away; the others re-render on their next fetch.
+    """
+    specs = []
+    for pin in session.get('dashboard_charts', []):
+        spec = pin.get('spec') or {}
+        if (spec.get('kind') == 'visualization' and spec['filename'] == current['filename']
+                and spec['content_hash'] == previous['content_hash']):
+            specs.append(spec)
+            pin['spec'] = dict(spec, content_hash=current['content_hash'])
+    if not specs:
+        return 0
+    return visualization_processor.update_appended_charts(specs, session, previous)
+
 @main.route('/files')
 def get_files():
     """Get list of uploaded files"""
@@ -51,16 +102,36 @@ def get_files():
 
 @main.route('/preview/<filename>')
 def preview_file(filename):
-    """Preview a specific file's data"""
-    df = data_processor.load_dataframe(filename, session)
-    if df is not None:
-        return jsonify({
-            'success': True,
-            'data': df.head(10).to_dict('records'),
-            'columns': df.columns.tolist()
-        })
-    else:
+    """Preview a page of a file's data
+    
+    Query parameters: ``offset`` and ``limit`` (rows), ``columns``
+    (comma-separated projection), ``sort`` and ``desc=1``, and any number
+    of ``filter=COLUMN:op[:value]`` (op: eq, ne, lt, le, gt, ge, contains,
+    null, notnull), all combined.
+    """
+    offset = max(request.args.get('offset', 0, type=int), 0)
+    limit = request.args.get('limit', PREVIEW_PAGE_SIZE, type=int)
+    limit = min(max(limit, 1), current_app.config.get('PREVIEW_MAX_ROWS', 500))
+    columns = [col for col in request.args.get('columns', '').split(',') if col] or None
+    try:
+        filters = [parse_filter(text) for text in request.args.getlist('filter')]
+        preview = data_processor.get_file_preview(
+            filename, session, offset=offset, limit=limit, columns=columns,
+            sort=request.args.get('sort') or None,
+            descending=request.args.get('desc', '').lower() in ('1', 'true'), filters=filters
+        )
+    except PreviewError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        print(f"Preview of {filename} failed: {e}")
+        return jsonify({'success': False, 'error': 'File not found'})
+    
+    if preview is None:
         return jsonify({'success': False, 'error': 'File not found'})
+    if offset == 0:
+        # The column profile is shown above the first page
+        preview['profile'] = data_processor.get_file_profile(filename, session)
+    return jsonify(dict(preview, success=True))
 
 @main.route('/clear-session', methods=['POST'])
 def clear_session():
@@ -75,12 +146,8 @@ def remove_file(filename):
     if 'uploaded_files' in session:
         for i, file_info in enumerate(session['uploaded_files']):
             if file_info['filename'] == filename:
-                # Remove file from disk
-                try:
-                    if os.path.exists(file_info['file_path']):
-                        os.remove(file_info['file_path'])
-                except Exception:
-                    pass
+                # Release the upload; shared content stays for other sessions
+                data_processor.remove_file(file_info)
                 
                 # Remove from session
                 session['uploaded_files'].pop(i)
@@ -102,15 +169,21 @@ def process_query():
     if not query:
         return jsonify({'success': False, 'error': 'Query cannot be empty'})
     
+    if data.get('async'):
+        if 'uploaded_files' not in session or not session['uploaded_files']:
+            return jsonify({'success': False, 'error': 'No data uploaded. Please upload CSV files first.'})
+        return _submit_job('query', query_processor.process_query, query)
+    
     # Process the query
     result = query_processor.process_query(query, session)
     
     return jsonify(result)
 
-@main.route('/visualize', methods=['POST'])
+@main.route('/visualize', methods=['GET', 'POST'])
 def generate_visualization():
     """Generate visualization from natural language query"""
-    data = request.get_json()
+    # GET lets browsers revalidate cached charts with If-None-Match natively
+    data = request.get_json() if request.method == 'POST' else request.args
     
     if not data or 'query' not in data:
         return jsonify({'success': False, 'error': 'No query provided'})
@@ -125,41 +198,192 @@ def generate_visualization():
     if 'uploaded_files' not in session or not session['uploaded_files']:
         return jsonify({'success': False, 'error': 'No data uploaded. Please upload CSV files first.'})
     
+    if data.get('async'):
+        return _submit_job('visualize', visualization_processor.generate_chart, query, chart_type)
+    
     # Generate visualization
     result = visualization_processor.generate_chart(query, session, chart_type)
     
-    return jsonify(result)
+    return _chart_response(result)
+
+def _chart_response(result):
+    """JSON chart response tagged with the chart's ETag (304 when the client has it)"""
+    etag = result.get('etag')
+    if etag and request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+    else:
+        response = jsonify(result)
+    if etag:
+        response.set_etag(etag, weak=True)
+        response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+def _queue_job(kind, func, query, *args):
+    """Queue a processor call on the job pool for this session, returning its id"""
+    app = current_app._get_current_object()
+    # Workers get a snapshot of what the processors read from the session
+    session_data = {'uploaded_files': list(session.get('uploaded_files', []))}
+    
+    def run(progress=None):
+        with app.app_context():
+            return func(query, session_data, *args, progress=progress)
+    
+    return job_queue.submit(session.sid, kind, run)
+
+def _submit_job(kind, func, query, *args):
+    """Queue a processor call and return its id and status URLs (202)"""
+    try:
+        job_id = _queue_job(kind, func, query, *args)
+    except QueueFullError as e:
+        return jsonify({'success': False, 'error': str(e)}), 503
+    
+    return jsonify({
+        'success': True,
+        'job_id': job_id,
+        'status': 'queued',
+        'status_url': url_for('main.get_job', job_id=job_id),
+        'events_url': url_for('main.stream_job_events', job_id=job_id)
+    }), 202
+
+def _job_event_stream(job_id, owner):
+    """Yield a job's events as Server-Sent Events until it finishes"""
+    seen = 0
+    while True:
+        events = job_queue.wait_for_events(job_id, owner, seen)
+        if events is None:
+            return
+        if not events:
+            yield ': keep-alive\n\n'
+            continue
+        seen += len(events)
+        for event in events:
+            if event['stage'] in ('done', 'failed'):
+                event = dict(event, result=job_queue.get(job_id, owner)['result'])
+            yield f"event: {event['stage']}\ndata: {raw_json.dumps(event, default=str)}\n\n"
+        if job_queue.is_finished(job_id):
+            return
+
+def _event_stream_response(stream):
+    return Response(stream, mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@main.route('/query/stream', methods=['POST'])
+def stream_query():
+    """Process a query, streaming progress and report chunks as Server-Sent Events"""
+    data = request.get_json()
+    
+    if not data or 'query' not in data:
+        return jsonify({'success': False, 'error': 'No query provided'})
+    
+    query = data['query'].strip()
+    
+    if not query:
+        return jsonify({'success': False, 'error': 'Query cannot be empty'})
+    
+    if 'uploaded_files' not in session or not session['uploaded_files']:
+        return jsonify({'success': False, 'error': 'No data uploaded. Please upload CSV files first.'})
+    
+    try:
+        job_id = _queue_job('query', query_processor.process_query, query)
+    except QueueFullError as e:
+        return jsonify({'success': False, 'error': str(e)}), 503
+    
+    response = _event_stream_response(_job_event_stream(job_id, session.sid))
+    response.headers['X-Job-Id'] = job_id
+    return response
+
+@main.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Poll the status (and, once finished, the result) of a queued job"""
+    job = job_queue.get(job_id, getattr(session, 'sid', None))
+    if job is None:
+        return jsonify({'success': False, 'error': 'Job not found'}), 404
+    
+    return jsonify({'success': True, **job})
+
+@main.route('/jobs/<job_id>/events', methods=['GET'])
+def stream_job_events(job_id):
+    """Stream a job's status events as Server-Sent Events"""
+    owner = getattr(session, 'sid', None)
+    if job_queue.get(job_id, owner) is None:
+        return jsonify({'success': False, 'error': 'Job not found'}), 404
+    
+    return _event_stream_response(_job_event_stream(job_id, owner))
 
 @main.route('/dashboard', methods=['GET'])
 def get_dashboard():
-    """Get current dashboard with pinned charts"""
+    """Get current dashboard: pinned chart references, not figures"""
     if 'dashboard_charts' not in session:
         session['dashboard_charts'] = []
     
     print(f"Dashboard requested. Total charts in session: {len(session['dashboard_charts'])}")
-    print(f"Dashboard charts: {session['dashboard_charts']}")
     
     return jsonify({
         'success': True,
-        'charts': session['dashboard_charts']
+        'charts': [_dashboard_entry(pin) for pin in session['dashboard_charts']]
     })
 
+@main.route('/dashboard/charts/<chart_id>', methods=['GET'])
+def get_dashboard_chart(chart_id):
+    """Render one pinned chart on demand"""
+    pin = next((pin for pin in session.get('dashboard_charts', []) if pin['id'] == chart_id), None)
+    if pin is None:
+        return jsonify({'success': False, 'error': 'Chart not found on dashboard'}), 404
+    
+    result = _render_dashboard_chart(pin)
+    result.update({'id': pin['id'], 'title': pin['title']})
+    return _chart_response(result)
+
+@main.route('/dashboard/refresh', methods=['POST'])
+def refresh_dashboard():
+    """Re-evaluate pinned charts against the current uploads in one request
+    
+    Optional JSON ``chart_ids`` limits the refresh to some pins. Chart specs
+    are rendered together so each dataset is read once.
+    """
+    data = request.get_json(silent=True) or {}
+    chart_ids = data.get('chart_ids')
+    pins = [pin for pin in session.get('dashboard_charts', [])
+            if chart_ids is None or pin['id'] in chart_ids]
+    
+    spec_pins = [pin for pin in pins if (pin.get('spec') or {}).get('kind') == 'visualization']
+    rendered = visualization_processor.render_chart_specs([pin['spec'] for pin in spec_pins], session)
+    results = {pin['id']: result for pin, result in zip(spec_pins, rendered)}
+    
+    charts = []
+    for pin in pins:
+        result = results.get(pin['id'])
+        if result is None:
+            result = _render_dashboard_chart(pin)
+        elif result.get('spec'):
+            # Follow the data the chart was re-rendered from
+            pin['spec'] = {key: result['spec'][key] for key in ('kind',) + CHART_SPEC_KEYS}
+        charts.append(dict(result, id=pin['id'], title=pin['title']))
+    session.modified = True
+    
+    print(f"Refreshed {len(charts)} dashboard chart(s), {len(spec_pins)} from chart specs")
+    return jsonify({'success': True, 'charts': charts})
+
 @main.route('/dashboard/pin', methods=['POST'])
 def pin_chart_to_dashboard():
     """Pin a chart to the dashboard"""
     data = request.get_json()
     
-    if not data or 'chart' not in data:
+    if not data or ('chart' not in data and 'spec' not in data):
         return jsonify({'success': False, 'error': 'No chart data provided'})
     
+    spec = _dashboard_spec(data)
+    if spec is None:
+        return jsonify({'success': False, 'error': 'Invalid chart data'})
+    
     if 'dashboard_charts' not in session:
         session['dashboard_charts'] = []
     
     # Add chart to dashboard
     chart_info = {
-        'id': f"chart_{len(session['dashboard_charts']) + 1}",
+        'id': f"chart_{uuid.uuid4().hex[:12]}",
         'title': data.get('title', 'Chart'),
-        'chart': data['chart'],
+        'spec': spec,
         'timestamp': datetime.now().isoformat()
     }
     
@@ -168,8 +392,7 @@ def pin_chart_to_dashboard():
     # Mark session as modified
     session.modified = True
     
-    print(f"Pinned chart to dashboard. Total charts: {len(session['dashboard_charts'])}")
-    print(f"Chart info: {chart_info}")
+    print(f"Pinned chart {chart_info['id']} to dashboard. Total charts: {len(session['dashboard_charts'])}")
     
     return jsonify({
         'success': True,
@@ -177,19 +400,122 @@ def pin_chart_to_dashboard():
         'chart_id': chart_info['id']
     })
 
+def _dashboard_spec(data):
+    """Lightweight reference to a pinned chart
+    
+    Charts from /visualize are pinned by their spec and re-rendered through
+    the chart cache; PNG charts (with an ``image`` spec from /query, or the
+    chart itself) are copied to the pinned chart store and referenced by
+    URL. Any other figure is serialized into the pin itself, so it lasts
+    as long as the dashboard rather than a cache entry.
+    """
+    spec = data.get('spec')
+    if isinstance(spec, dict) and spec.get('kind') == 'visualization':
+        if any(key not in spec for key in CHART_SPEC_KEYS):
+            return None
+        return {key: spec[key] for key in ('kind',) + CHART_SPEC_KEYS}
+    
+    chart = spec if isinstance(spec, dict) and spec.get('kind') == 'image' else data.get('chart')
+    if not isinstance(chart, dict):
+        return None
+    if chart.get('chart_type') == 'png' and chart.get('image_path'):
+        # A copy that chart pruning never removes
+        pinned = pin_chart(os.path.basename(chart['image_path']))
+        if pinned is None:
+            return None
+        return dict(pinned, kind='image', chart_type='png')
+    
+    return {'kind': 'stored', 'chart_type': chart.get('chart_type', 'chart'),
+            'chart_json': raw_json.dumps(chart, default=str)}
+
+def _dashboard_entry(pin):
+    """What the dashboard list shows for a pin; the chart itself is fetched per chart"""
+    spec = pin.get('spec') or {'kind': 'embedded', 'chart_type': (pin.get('chart') or {}).get('chart_type')}
+    return {
+        'id': pin['id'],
+        'title': pin['title'],
+        'timestamp': pin['timestamp'],
+        'kind': spec['kind'],
+        'chart_type': spec.get('chart_type') or 'chart',
+        'chart_url': url_for('main.get_dashboard_chart', chart_id=pin['id'])
+    }
+
+def _render_dashboard_chart(pin):
+    spec = pin.get('spec')
+    if spec is None:
+        # Pinned before charts were stored as references
+        return {'success': True, 'chart': pin.get('chart')}
+    if spec['kind'] == 'visualization':
+        return visualization_processor.render_chart_spec(spec, session)
+    if spec['kind'] == 'image':
+        chart = {key: spec[key] for key in ('chart_type', 'image_path', 'image_url')}
+        return {'success': True, 'chart': chart, 'chart_type': 'png'}
+    
+    if 'chart_json' in spec:
+        return {'success': True, 'chart': raw_json.RawJSON(spec['chart_json']), 'chart_type': spec['chart_type']}
+    # Pinned while figures were kept in the chart cache
+    stored = chart_cache.get(spec['cache_key'])
+    if stored is None:
+        return {'success': False, 'error': 'This chart is no longer available; please create it again.'}
+    return {'success': True, 'chart': raw_json.RawJSON(stored['chart_json']), 'chart_type': spec['chart_type']}
+
 @main.route('/chart-image/<path:filename>')
 def serve_chart_image(filename):
-    """Serve chart images from the exports/charts directory"""
-    from flask import send_from_directory
-    import os
-    # Use absolute path to the exports/charts directory
-    chart_dir = os.path.join(os.getcwd(), 'exports', 'charts')
-    print(f"Serving chart image: {filename}")
-    print(f"Chart directory: {chart_dir}")
-    print(f"Directory exists: {os.path.exists(chart_dir)}")
-    if os.path.exists(chart_dir):
-        print(f"Files in directory: {os.listdir(chart_dir)}")
-    return send_from_directory(chart_dir, filename)
+    """Serve chart images from the exports/charts directory (revalidated by ETag)"""
+    response = _send_chart(filename)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+@main.route('/charts/<digest>/<filename>')
+def serve_chart_asset(digest, filename):
+    """Serve a chart under its content hash; the URL's content never changes
+    
+    Only the digest recorded when the URL was made is served, so a wrong
+    or stale digest is a 404 rather than a year-long cache entry.
+    """
+    if not CHART_DIGEST_PATTERN.match(digest) or recorded_chart_digest(filename) != digest:
+        abort(404)
+    # The digest is the ETag, so revalidation needs no read of the chart itself
+    if request.if_none_match.contains(digest):
+        response = Response(status=304)
+    else:
+        response = _send_chart(filename)
+    response.set_etag(digest)
+    response.headers['Cache-Control'] = f'public, max-age={CHART_ASSET_MAX_AGE}, immutable'
+    return response
+
+@main.route(f'/charts/{PINNED_CHART_SUBDIRECTORY}/<filename>')
+def serve_pinned_chart(filename):
+    """Serve a dashboard pin's copy of a chart, named by its content hash"""
+    if not PINNED_CHART_PATTERN.match(filename):
+        abort(404)
+    digest = filename[:-len('.png')]
+    if request.if_none_match.contains(digest):
+        response = Response(status=304)
+    else:
+        response = _send_chart(filename, PINNED_CHART_SUBDIRECTORY)
+    response.set_etag(digest)
+    response.headers['Cache-Control'] = f'public, max-age={CHART_ASSET_MAX_AGE}, immutable'
+    return response
+
+def _send_chart(filename, subdirectory=None):
+    """Chart file response, handed to the front proxy when one is configured
+    
+    With CHART_ACCEL_REDIRECT_PREFIX set, nginx serves the file via
+    X-Accel-Redirect; with USE_X_SENDFILE, Flask emits X-Sendfile instead.
+    """
+    accel_prefix = current_app.config.get('CHART_ACCEL_REDIRECT_PREFIX')
+    if accel_prefix:
+        if os.path.basename(filename) != filename or filename.startswith('.'):
+            abort(404)
+        location = f"{subdirectory}/{filename}" if subdirectory else filename
+        response = Response(mimetype='image/png')
+        response.headers['X-Accel-Redirect'] = f"{accel_prefix.rstrip('/')}/{location}"
+        return response
+    directory = os.path.abspath(CHART_DIRECTORY)
+    if subdirectory:
+        directory = os.path.join(directory, subdirectory)
+    return send_from_directory(directory, filename)
 
 @main.route('/dashboard/remove/<chart_id>', methods=['DELETE'])
 def remove_chart_from_dashboard(chart_id):
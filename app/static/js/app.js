@@ -37,6 +37,10 @@ async function handleFileUpload(event) {
     }
     
     formData.append('file', file);
+    const appendTarget = document.getElementById('appendTarget');
+    if (appendTarget && appendTarget.value) {
+        formData.append('append_to', appendTarget.value);
+    }
     
     // Show loading
     showLoading(true);
@@ -50,9 +54,22 @@ async function handleFileUpload(event) {
         const result = await response.json();
         
         if (result.success) {
-            showAlert(result.message, 'success');
+            if (result.malformed_lines && result.malformed_lines.length > 0) {
+                const lines = result.malformed_lines.map(item => item.line).join(', ');
+                const skipped = result.file_info.malformed_line_count;
+                showAlert(`${escapeHtml(result.message)}. Skipped ${skipped} malformed line${skipped > 1 ? 's' : ''} (line ${lines}).`, 'warning');
+            } else if (result.widened_columns && result.widened_columns.length > 0) {
+                // Appended values changed a column's type (e.g. text in a numeric column)
+                showAlert(result.message, 'warning');
+            } else {
+                showAlert(result.message, 'success');
+            }
             fileInput.value = ''; // Clear the input
             loadUploadedFiles(); // Refresh the file list
+            if (result.appended_rows !== undefined) {
+                // Pinned charts of this dataset now follow the appended data
+                refreshDashboard();
+            }
         } else {
             showAlert(result.error, 'danger');
         }
@@ -72,6 +89,8 @@ async function loadUploadedFiles() {
         
         const filesList = document.getElementById('filesList');
         
+        updateAppendTargets(result.files);
+        
         if (result.files.length === 0) {
             filesList.innerHTML = '<p class="text-muted">No files uploaded yet.</p>';
             return;
@@ -104,32 +123,125 @@ async function loadUploadedFiles() {
     }
 }
 
+// Offer each uploaded dataset as a target for appending rows
+function updateAppendTargets(files) {
+    const appendTarget = document.getElementById('appendTarget');
+    if (!appendTarget) {
+        return;
+    }
+    const selected = appendTarget.value;
+    appendTarget.innerHTML = '<option value="">New dataset</option>' + files.map(file =>
+        `<option value="${escapeHtml(file.filename)}">Append rows to ${escapeHtml(file.filename)}</option>`
+    ).join('');
+    appendTarget.value = files.some(file => file.filename === selected) ? selected : '';
+}
+
+// Rows fetched per preview request; the virtual scroller only renders rows near the viewport
+const PREVIEW_PAGE_SIZE = 100;
+// Fixed row height (px) the scroller positions rows with; matches .preview-scroll td
+const PREVIEW_ROW_HEIGHT = 33;
+const PREVIEW_OVERSCAN = 10;
+
+// Filename, columns, sort, filters and fetched pages of the file being previewed
+let previewState = null;
+
 // Preview file data
 async function previewFile(filename) {
+    previewState = {
+        filename: filename,
+        columns: [],
+        profile: null,
+        sort: null,
+        descending: false,
+        filters: {},
+        pages: new Map(),
+        pending: new Set(),
+        totalRows: 0,
+        matchedRows: 0,
+        generation: 0
+    };
     showLoading(true);
     
     try {
-        const response = await fetch(`/preview/${filename}`);
+        await loadPreviewPage(0);
+    } finally {
+        showLoading(false);
+    }
+}
+
+// Query string of one page under the current sort and filters
+function previewPageUrl(pageIndex) {
+    const params = new URLSearchParams({offset: pageIndex * PREVIEW_PAGE_SIZE, limit: PREVIEW_PAGE_SIZE});
+    if (previewState.sort) {
+        params.set('sort', previewState.sort);
+        if (previewState.descending) {
+            params.set('desc', '1');
+        }
+    }
+    Object.entries(previewState.filters).forEach(([column, text]) => {
+        params.append('filter', previewFilterParam(column, text));
+    });
+    return `/preview/${encodeURIComponent(previewState.filename)}?${params}`;
+}
+
+// Filter box text to COLUMN:op:value, e.g. ">120" -> gt, "=PULSE" -> eq, "blood" -> contains
+function previewFilterParam(column, text) {
+    const operators = [['>=', 'ge'], ['<=', 'le'], ['!=', 'ne'], ['>', 'gt'], ['<', 'lt'], ['=', 'eq']];
+    const trimmed = text.trim();
+    if (trimmed === 'empty') {
+        return `${column}:null`;
+    }
+    for (const [symbol, op] of operators) {
+        if (trimmed.startsWith(symbol)) {
+            return `${column}:${op}:${trimmed.slice(symbol.length).trim()}`;
+        }
+    }
+    return `${column}:contains:${trimmed}`;
+}
+
+async function loadPreviewPage(pageIndex) {
+    const state = previewState;
+    if (!state || state.pages.has(pageIndex) || state.pending.has(pageIndex)) {
+        return;
+    }
+    const generation = state.generation;
+    state.pending.add(pageIndex);
+    
+    try {
+        const response = await fetch(previewPageUrl(pageIndex));
         const result = await response.json();
+        if (state !== previewState || generation !== state.generation) {
+            return; // another file, sort or filter was chosen meanwhile
+        }
+        if (!result.success) {
+            showAlert(result.error, 'danger');
+            return;
+        }
         
-        if (result.success) {
-            displayDataPreview(result.data, result.columns, filename);
+        state.pages.set(pageIndex, result.data);
+        state.totalRows = result.total_rows;
+        state.matchedRows = result.matched_rows;
+        if (state.columns.length === 0) {
+            state.columns = result.columns;
+            state.profile = result.profile;
+            displayDataPreview();
         } else {
-            showAlert(result.error, 'danger');
+            renderPreviewRows();
         }
     } catch (error) {
         console.error('Preview error:', error);
         showAlert('Error previewing file.', 'danger');
     } finally {
-        showLoading(false);
+        state.pending.delete(pageIndex);
     }
 }
 
-// Display data preview
-function displayDataPreview(data, columns, filename) {
+// Display data preview: a scrollable table whose rows are fetched page by page
+function displayDataPreview() {
     const previewContainer = document.getElementById('dataPreview');
+    const {columns, profile, filename} = previewState;
     
-    if (data.length === 0) {
+    if (previewState.totalRows === 0) {
         previewContainer.innerHTML = `
             <div class="text-center text-muted">
                 <i class="fas fa-exclamation-triangle fa-3x mb-3"></i>
@@ -139,42 +251,150 @@ function displayDataPreview(data, columns, filename) {
         return;
     }
     
-    // Create table header
-    let tableHTML = `
+    previewContainer.innerHTML = `
         <div class="preview-table">
-            <div class="table-responsive">
+            <div class="preview-scroll" id="previewScroll">
                 <table class="table table-hover">
                     <thead>
                         <tr>
-                            ${columns.map(col => `<th>${col}</th>`).join('')}
+                            ${columns.map((col, i) => `<th class="preview-sort" data-column="${i}">${escapeHtml(col)}<span class="sort-indicator"></span></th>`).join('')}
+                        </tr>
+                        ${profile ? `<tr class="column-profile">
+                            ${columns.map(col => createColumnProfileHTML(profile.columns[col])).join('')}
+                        </tr>` : ''}
+                        <tr class="preview-filters">
+                            ${columns.map((col, i) => `<th><input type="text" class="form-control form-control-sm" data-column="${i}" placeholder="Filter"></th>`).join('')}
                         </tr>
                     </thead>
-                    <tbody>
-    `;
-    
-    // Create table rows
-    data.forEach(row => {
-        tableHTML += '<tr>';
-        columns.forEach(col => {
-            const value = row[col] !== null && row[col] !== undefined ? row[col] : '';
-            tableHTML += `<td>${value}</td>`;
-        });
-        tableHTML += '</tr>';
-    });
-    
-    tableHTML += `
-                    </tbody>
+                    <tbody id="previewBody"></tbody>
                 </table>
             </div>
         </div>
         <div class="mt-3">
-            <small class="text-muted">
-                Showing first 10 rows of ${filename} (${data.length} total rows)
-            </small>
+            <small class="text-muted" id="previewStatus" data-filename="${escapeHtml(filename)}"></small>
         </div>
     `;
     
-    previewContainer.innerHTML = tableHTML;
+    previewContainer.querySelectorAll('.preview-sort').forEach(th => {
+        th.addEventListener('click', () => sortPreview(columns[th.dataset.column]));
+    });
+    let filterTimer = null;
+    previewContainer.querySelectorAll('.preview-filters input').forEach(input => {
+        input.addEventListener('input', () => {
+            clearTimeout(filterTimer);
+            filterTimer = setTimeout(() => filterPreview(columns[input.dataset.column], input.value), 300);
+        });
+    });
+    
+    let frameRequested = false;
+    document.getElementById('previewScroll').addEventListener('scroll', () => {
+        if (!frameRequested) {
+            frameRequested = true;
+            requestAnimationFrame(() => {
+                frameRequested = false;
+                renderPreviewRows();
+            });
+        }
+    });
+    renderPreviewRows();
+}
+
+// Render only the rows in (or near) view, between spacer rows standing in for the rest
+function renderPreviewRows() {
+    const scroller = document.getElementById('previewScroll');
+    const body = document.getElementById('previewBody');
+    if (!scroller || !body || !previewState) {
+        return;
+    }
+    const {columns, pages, matchedRows, totalRows} = previewState;
+    const headerHeight = scroller.querySelector('thead').offsetHeight;
+    const scrolled = Math.max(0, scroller.scrollTop - headerHeight);
+    const first = Math.max(0, Math.floor(scrolled / PREVIEW_ROW_HEIGHT) - PREVIEW_OVERSCAN);
+    const last = Math.min(matchedRows,
+        first + Math.ceil(scroller.clientHeight / PREVIEW_ROW_HEIGHT) + 2 * PREVIEW_OVERSCAN);
+    
+    let rowsHTML = `<tr class="preview-spacer" style="height: ${first * PREVIEW_ROW_HEIGHT}px"></tr>`;
+    for (let i = first; i < last; i++) {
+        const pageIndex = Math.floor(i / PREVIEW_PAGE_SIZE);
+        const page = pages.get(pageIndex);
+        if (!page) {
+            loadPreviewPage(pageIndex);
+            rowsHTML += `<tr><td colspan="${columns.length}" class="text-muted">Loading…</td></tr>`;
+            continue;
+        }
+        const row = page[i % PREVIEW_PAGE_SIZE] || {};
+        rowsHTML += '<tr>' + columns.map(col => {
+            const value = row[col] !== null && row[col] !== undefined ? row[col] : '';
+            return `<td>${escapeHtml(String(value))}</td>`;
+        }).join('') + '</tr>';
+    }
+    rowsHTML += `<tr class="preview-spacer" style="height: ${(matchedRows - last) * PREVIEW_ROW_HEIGHT}px"></tr>`;
+    body.innerHTML = rowsHTML;
+    
+    document.querySelectorAll('#previewScroll .preview-sort').forEach(th => {
+        const active = columns[th.dataset.column] === previewState.sort;
+        th.querySelector('.sort-indicator').textContent = active ? (previewState.descending ? ' ▼' : ' ▲') : '';
+    });
+    
+    const status = document.getElementById('previewStatus');
+    const filtered = matchedRows !== totalRows ? ` (filtered from ${totalRows})` : '';
+    status.textContent = matchedRows === 0
+        ? `No rows of ${previewState.filename} match the filters`
+        : `Rows ${first + 1}–${last} of ${matchedRows}${filtered} in ${previewState.filename}`;
+}
+
+// Click a column header: sort ascending, then descending, then back to file order
+function sortPreview(column) {
+    if (previewState.sort !== column) {
+        previewState.sort = column;
+        previewState.descending = false;
+    } else if (!previewState.descending) {
+        previewState.descending = true;
+    } else {
+        previewState.sort = null;
+        previewState.descending = false;
+    }
+    resetPreviewPages();
+}
+
+function filterPreview(column, text) {
+    if (text.trim()) {
+        previewState.filters[column] = text;
+    } else {
+        delete previewState.filters[column];
+    }
+    resetPreviewPages();
+}
+
+// Drop fetched pages after a sort or filter change and start again from the top
+function resetPreviewPages() {
+    previewState.generation += 1;
+    previewState.pages.clear();
+    previewState.pending.clear();
+    document.getElementById('previewScroll').scrollTop = 0;
+    loadPreviewPage(0);
+}
+
+// Compact per-column statistics from the upload-time dataset profile
+function createColumnProfileHTML(columnProfile) {
+    if (!columnProfile) {
+        return '<th></th>';
+    }
+
+    const details = [`${columnProfile.unique_values} distinct`];
+    if (columnProfile.null_count > 0) {
+        details.push(`${columnProfile.null_count} missing`);
+    }
+    let tooltip = '';
+    if (columnProfile.numeric && columnProfile.min !== undefined && columnProfile.min !== null) {
+        tooltip = `min ${columnProfile.min}, max ${columnProfile.max}, mean ${Number(columnProfile.mean).toFixed(2)}`;
+    } else if (columnProfile.top_values.length > 0) {
+        tooltip = 'Top: ' + columnProfile.top_values.slice(0, 5).map(([value, count]) => `${value} (${count})`).join(', ');
+    }
+
+    return `<th class="small text-muted fw-normal" title="${escapeHtml(tooltip).replace(/"/g, '&quot;')}">
+        ${escapeHtml(columnProfile.type)}<br>${details.join(', ')}
+    </th>`;
 }
 
 // Remove file
@@ -500,6 +720,26 @@ async function loadDashboard() {
     }
 }
 
+// Re-render pinned charts against the current uploads (e.g. after an append), then redraw them
+async function refreshDashboard() {
+    try {
+        const response = await fetch('/dashboard/refresh', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+            },
+            body: JSON.stringify({})
+        });
+        const result = await response.json();
+        if (!result.success) {
+            console.error('Dashboard refresh failed:', result.error);
+        }
+    } catch (error) {
+        console.error('Error refreshing dashboard:', error);
+    }
+    loadDashboard();
+}
+
 function displayDashboardCharts(charts) {
     console.log('Displaying dashboard charts:', charts);
     const dashboardCharts = document.getElementById('dashboardCharts');
@@ -523,31 +763,125 @@ function displayDashboardCharts(charts) {
     
     dashboardCharts.innerHTML = charts.map(chart => createChartHTML(chart)).join('');
     
-    // Render charts
-    charts.forEach(chart => {
-        console.log('Rendering chart:', chart);
-        const chartDiv = document.getElementById(`chart-${chart.id}`);
-        console.log('Chart div found:', chartDiv);
-        if (chartDiv && chart.chart) {
-            if (chart.chart.chart_type === 'png' && chart.chart.image_path) {
-                // Display PNG image
-                const filename = chart.chart.image_path;
-                console.log('Displaying PNG in dashboard:', filename);
-                chartDiv.innerHTML = `<img src="/chart-image/${filename}" alt="Chart" style="max-width: 100%; height: auto;" />`;
-            } else if (chart.chart.data) {
-                // Display Plotly chart
-                console.log('Displaying Plotly in dashboard');
-                Plotly.newPlot(chartDiv, chart.chart.data.data, chart.chart.layout);
+    // Charts are fetched and drawn only as they scroll into view
+    observeDashboardCharts(charts);
+}
+
+// Fetch a chart when it comes within this distance of the viewport...
+const DASHBOARD_RENDER_MARGIN = '300px 0px';
+// ...and free its Plotly instance once it is this far away again
+const DASHBOARD_PURGE_MARGIN = '1500px 0px';
+
+let dashboardRenderObserver = null;
+let dashboardPurgeObserver = null;
+
+function observeDashboardCharts(charts) {
+    if (dashboardRenderObserver) dashboardRenderObserver.disconnect();
+    if (dashboardPurgeObserver) dashboardPurgeObserver.disconnect();
+    
+    if (!('IntersectionObserver' in window)) {
+        charts.forEach(chart => renderDashboardChart(chart));
+        return;
+    }
+    
+    const chartsById = new Map(charts.map(chart => [`chart-${chart.id}`, chart]));
+    
+    dashboardRenderObserver = new IntersectionObserver(entries => {
+        entries.forEach(entry => {
+            if (entry.isIntersecting && entry.target.dataset.state === 'placeholder') {
+                renderDashboardChart(chartsById.get(entry.target.id));
             }
-        } else {
-            console.log('Chart div or chart data not found for chart:', chart.id);
+        });
+    }, { rootMargin: DASHBOARD_RENDER_MARGIN });
+    
+    dashboardPurgeObserver = new IntersectionObserver(entries => {
+        entries.forEach(entry => {
+            if (!entry.isIntersecting && entry.target.dataset.state !== 'placeholder') {
+                purgeDashboardChart(entry.target);
+            }
+        });
+    }, { rootMargin: DASHBOARD_PURGE_MARGIN });
+    
+    chartsById.forEach((chart, elementId) => {
+        const chartDiv = document.getElementById(elementId);
+        if (chartDiv) {
+            dashboardRenderObserver.observe(chartDiv);
+            dashboardPurgeObserver.observe(chartDiv);
         }
     });
 }
 
+function dashboardPlaceholderHTML(chart) {
+    return `
+        <div class="chart-placeholder">
+            <i class="fas fa-chart-bar fa-2x mb-2"></i>
+            <span>${escapeHtml(chart.chart_type || 'chart')} chart</span>
+        </div>
+    `;
+}
+
+function purgeDashboardChart(chartDiv) {
+    // Keep the rendered height so the page does not jump when it is redrawn
+    chartDiv.style.minHeight = `${chartDiv.offsetHeight}px`;
+    if (chartDiv.dataset.state === 'plotly') {
+        Plotly.purge(chartDiv);
+    }
+    chartDiv.dataset.state = 'placeholder';
+    chartDiv.innerHTML = dashboardPlaceholderHTML({ chart_type: chartDiv.dataset.chartType });
+}
+
+async function renderDashboardChart(chart) {
+    const chartDiv = document.getElementById(`chart-${chart.id}`);
+    if (!chartDiv) {
+        console.log('Chart div not found for chart:', chart.id);
+        return;
+    }
+    chartDiv.dataset.state = 'loading';
+    
+    try {
+        // Revalidated by ETag, so re-showing a purged chart is usually a 304
+        const response = await fetch(chart.chart_url);
+        const result = await response.json();
+        
+        if (chartDiv.dataset.state !== 'loading') {
+            return; // scrolled away and purged while the request was in flight
+        }
+        
+        if (!result.success || !result.chart) {
+            chartDiv.dataset.state = 'error';
+            chartDiv.innerHTML = `<p class="text-muted">${escapeHtml(result.error || 'Chart unavailable')}</p>`;
+            return;
+        }
+        
+        if (result.chart.chart_type === 'png' && result.chart.image_path) {
+            // Display PNG image
+            const src = chartImageSrc(result.chart);
+            console.log('Displaying PNG in dashboard:', src);
+            chartDiv.dataset.state = 'image';
+            chartDiv.innerHTML = `<img src="${src}" alt="Chart" loading="lazy" style="max-width: 100%; height: auto;" />`;
+        } else if (result.chart.data) {
+            // Display Plotly chart
+            console.log('Displaying Plotly in dashboard');
+            chartDiv.dataset.state = 'plotly';
+            chartDiv.innerHTML = '';
+            Plotly.newPlot(chartDiv, result.chart.data.data, result.chart.data.layout);
+        } else {
+            chartDiv.dataset.state = 'error';
+        }
+    } catch (error) {
+        console.error('Error loading dashboard chart:', chart.id, error);
+        chartDiv.dataset.state = 'placeholder';
+    }
+}
+
+// Content-hashed URLs are cached by the browser for good; older results only have the filename
+function chartImageSrc(chart) {
+    return chart.image_url || `/chart-image/${chart.image_path}`;
+}
+
 function createChartHTML(chart) {
     console.log('Creating HTML for chart:', chart);
-    const chartType = chart.chart.chart_type || chart.chart.type || 'chart';
+    const chartType = chart.chart_type || 'chart';
     return `
         <div class="chart-container">
             <div class="chart-header">
@@ -560,7 +894,9 @@ function createChartHTML(chart) {
                 </div>
             </div>
             <div class="chart-content">
-                <div id="chart-${chart.id}"></div>
+                <div id="chart-${chart.id}" data-state="placeholder" data-chart-type="${escapeHtml(chartType)}">
+                    ${dashboardPlaceholderHTML(chart)}
+                </div>
             </div>
         </div>
     `;
@@ -581,23 +917,20 @@ async function removeChartFromDashboard(chartId) {
     }
 }
 
-async function pinChartToDashboard(chartData, title, buttonElement) {
+// Charts shown in the chat that can be pinned, by chart element id
+const pinnableCharts = new Map();
+
+async function pinChartToDashboard(chartData, title, buttonElement, spec) {
     try {
-        console.log('Pinning chart:', { chartData, title });
-        console.log('Request body:', JSON.stringify({
-            chart: chartData,
-            title: title
-        }));
+        console.log('Pinning chart:', { title, spec });
         
+        // Charts with a spec are pinned by reference and re-rendered server-side
         const response = await fetch('/dashboard/pin', {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json',
             },
-            body: JSON.stringify({
-                chart: chartData,
-                title: title
-            })
+            body: JSON.stringify(spec ? { spec: spec, title: title } : { chart: chartData, title: title })
         });
         
         console.log('Response status:', response.status);
@@ -626,6 +959,177 @@ async function pinChartToDashboard(chartData, title, buttonElement) {
     }
 }
 
+// Event names a job can emit, in the order they normally arrive
+const JOB_EVENT_STAGES = [
+    'queued', 'running', 'data_loaded', 'generating_code', 'code_generated',
+    'executing_code', 'result_ready', 'report_chunk', 'done', 'failed'
+];
+
+// Human-readable labels for query progress events
+const PROGRESS_LABELS = {
+    queued: 'Waiting for a free worker',
+    running: 'Starting analysis',
+    data_loaded: 'Data loaded',
+    generating_code: 'Generating analysis code',
+    code_generated: 'Code generated',
+    executing_code: 'Running analysis',
+    result_ready: 'Result ready, writing report'
+};
+
+// POST a query to the streaming endpoint, passing each event to onEvent
+// and resolving with the final result. Falls back to a polled job when
+// the browser cannot read response streams.
+async function streamQuery(payload, onEvent) {
+    if (!window.ReadableStream || !window.TextDecoder) {
+        return runJob('/query', payload, onEvent);
+    }
+
+    const response = await fetch('/query/stream', {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+        },
+        body: JSON.stringify(payload)
+    });
+
+    if (!(response.headers.get('Content-Type') || '').startsWith('text/event-stream')) {
+        return response.json();
+    }
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) {
+            break;
+        }
+        buffer += decoder.decode(value, { stream: true });
+
+        // Events are separated by a blank line; keep any partial event buffered
+        const blocks = buffer.split('\n\n');
+        buffer = blocks.pop();
+        for (const block of blocks) {
+            const dataLine = block.split('\n').find(line => line.startsWith('data: '));
+            if (!dataLine) {
+                continue;
+            }
+            const event = JSON.parse(dataLine.slice(6));
+            if (onEvent) {
+                onEvent(event);
+            }
+            if (event.stage === 'done' || event.stage === 'failed') {
+                reader.cancel();
+                return event.result;
+            }
+        }
+    }
+
+    throw new Error('Query stream closed before a result arrived');
+}
+
+// Submit a request as a background job and resolve with its result.
+// Progress arrives over Server-Sent Events; polling is the fallback.
+async function runJob(url, payload, onEvent) {
+    const response = await fetch(url, {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+        },
+        body: JSON.stringify({ ...payload, async: true })
+    });
+
+    const submitted = await response.json();
+    if (!submitted.job_id) {
+        return submitted;
+    }
+
+    if (window.EventSource) {
+        try {
+            return await streamJob(submitted.events_url, onEvent);
+        } catch (error) {
+            console.warn('Job stream interrupted, polling instead:', error);
+        }
+    }
+    return pollJob(submitted.status_url, onEvent);
+}
+
+function streamJob(eventsUrl, onEvent) {
+    return new Promise((resolve, reject) => {
+        const source = new EventSource(eventsUrl);
+        let finished = false;
+
+        JOB_EVENT_STAGES.forEach(stage => {
+            source.addEventListener(stage, function(message) {
+                const event = JSON.parse(message.data);
+                if (onEvent) {
+                    onEvent(event);
+                }
+                if (stage === 'done' || stage === 'failed') {
+                    finished = true;
+                    source.close();
+                    resolve(event.result);
+                }
+            });
+        });
+
+        source.onerror = function() {
+            source.close();
+            if (!finished) {
+                reject(new Error('Event stream closed before the job finished'));
+            }
+        };
+    });
+}
+
+async function pollJob(statusUrl, onEvent, interval = 1000) {
+    let seen = 0;
+    while (true) {
+        const response = await fetch(statusUrl);
+        const job = await response.json();
+        if (!job.success) {
+            return job;
+        }
+        if (onEvent) {
+            job.events.slice(seen).forEach(onEvent);
+        }
+        seen = job.events.length;
+        if (job.status === 'done' || job.status === 'failed') {
+            return job.result;
+        }
+        await new Promise(resolve => setTimeout(resolve, interval));
+    }
+}
+
+// Show a query's latest step and the report text received so far
+function updateQueryProgress(messageId, event) {
+    const message = document.getElementById(messageId);
+    if (!message) {
+        return;
+    }
+    const content = message.querySelector('.message-content');
+
+    if (event.stage === 'report_chunk') {
+        let report = content.querySelector('.streamed-report');
+        if (!report) {
+            content.innerHTML = '<div class="streamed-report"></div>';
+            report = content.querySelector('.streamed-report');
+        }
+        report.textContent += (report.textContent ? ' ' : '') + event.text;
+    } else if (PROGRESS_LABELS[event.stage] && !content.querySelector('.streamed-report')) {
+        let label = PROGRESS_LABELS[event.stage];
+        if (event.stage === 'data_loaded') {
+            label += event.table ? ` from ${event.table}` : '';
+            label += ` (${event.rows} rows, ${event.columns} columns)`;
+        }
+        content.innerHTML = `${escapeHtml(label)}<span class="loading-dots"></span>`;
+    }
+
+    const chatMessages = document.getElementById('chatMessages');
+    chatMessages.scrollTop = chatMessages.scrollHeight;
+}
+
 // Enhanced query handler to detect visualization requests
 async function handleQuery(event) {
     event.preventDefault();
@@ -652,16 +1156,8 @@ async function handleQuery(event) {
     const loadingId = addChatMessage('assistant', 'Analyzing your query<span class="loading-dots"></span>', true);
 
     try {
-        // Use unified query endpoint for all requests
-        const response = await fetch('/query', {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json',
-            },
-            body: JSON.stringify({ query: query })
-        });
-
-        const result = await response.json();
+        // Stream progress and report text into the loading message
+        const result = await streamQuery({ query: query }, event => updateQueryProgress(loadingId, event));
 
         // Remove loading message
         removeChatMessage(loadingId);
@@ -733,7 +1229,7 @@ function addChartResponse(result) {
                     <span class="chart-type-badge">${chartType}</span>
                 </div>
                 <div class="visualization-actions">
-                    <button class="btn btn-sm pin-chart-btn" data-chart-id="${chartId}" data-chart-data='${JSON.stringify(result.result.chart)}' data-chart-title="${escapeHtml(chartTitle)}">
+                    <button class="btn btn-sm pin-chart-btn" data-chart-id="${chartId}" data-chart-title="${escapeHtml(chartTitle)}">
                         <i class="fas fa-thumbtack"></i> Pin to Dashboard
                     </button>
                 </div>
@@ -743,6 +1239,16 @@ function addChartResponse(result) {
             </div>
     `;
 
+    // Note when the server reduced the number of plotted points
+    const sampling = result.result.chart.sampling;
+    if (sampling && sampling.applied) {
+        content += `
+            <small class="text-muted">
+                Showing ${sampling.returned_points.toLocaleString()} of ${sampling.original_points.toLocaleString()} points (${sampling.method === 'lttb' ? 'LTTB downsampling' : 'density-preserving sample'})
+            </small>
+        `;
+    }
+
     content += '</div>';
 
     responseDiv.innerHTML = `<div class="message-content">${content}</div>`;
@@ -757,9 +1263,9 @@ function addChartResponse(result) {
     if (chartDiv && result.result.chart) {
         if (result.result.chart.chart_type === 'png' && result.result.chart.image_path) {
             // Display PNG image
-            const filename = result.result.chart.image_path;
-            console.log('Displaying PNG chart:', filename);
-            chartDiv.innerHTML = `<img src="/chart-image/${filename}" alt="Chart" style="max-width: 100%; height: auto;" />`;
+            const src = chartImageSrc(result.result.chart);
+            console.log('Displaying PNG chart:', src);
+            chartDiv.innerHTML = `<img src="${src}" alt="Chart" style="max-width: 100%; height: auto;" />`;
         } else if (result.result.chart.data) {
             // Display Plotly chart
             console.log('Displaying Plotly chart');
@@ -773,14 +1279,15 @@ function addChartResponse(result) {
     }
     
     // Add event listener for pin button
+    pinnableCharts.set(chartId, { chart: result.result.chart, spec: result.result.spec });
     const pinBtn = document.querySelector(`[data-chart-id="${chartId}"]`);
     if (pinBtn) {
         console.log('Found pin button, adding event listener');
         pinBtn.addEventListener('click', function() {
             console.log('Pin button clicked!');
-            const chartData = JSON.parse(this.getAttribute('data-chart-data'));
+            const pinnable = pinnableCharts.get(chartId);
             const title = this.getAttribute('data-chart-title');
-            pinChartToDashboard(chartData, title, this);
+            pinChartToDashboard(pinnable.chart, title, this, pinnable.spec);
         });
     } else {
         console.log('Pin button not found for chart ID:', chartId);
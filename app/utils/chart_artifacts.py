@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+Chart image files written by generated code: unique paths, hashed URLs and retention
+"""
+
+import hashlib
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+from typing import Any, Dict, Optional
+
+from pandasai.constants import DEFAULT_CHART_DIRECTORY
+from werkzeug.security import safe_join
+
+CHART_DIRECTORY = DEFAULT_CHART_DIRECTORY
+# Content-hashed chart URLs never change content, so browsers may keep them for a year
+CHART_ASSET_MAX_AGE = 365 * 24 * 3600
+CHART_DIGEST_LENGTH = 20
+CHART_DIGEST_PATTERN = re.compile(r'^[0-9a-f]{%d}$' % CHART_DIGEST_LENGTH)
+# The digest in a chart's URL is recorded next to it as <chart>.png.sha256
+CHART_DIGEST_EXTENSION = '.sha256'
+# A <chart>.png.keep marker protects a chart still referenced (e.g. by a
+# cached query result) from pruning until the marker's mtime
+CHART_KEEP_EXTENSION = '.keep'
+# Pinned charts are copied here as <digest>.png; pruning never looks inside
+PINNED_CHART_SUBDIRECTORY = 'pinned'
+PINNED_CHART_PATTERN = re.compile(r'^[0-9a-f]{%d}\.png$' % CHART_DIGEST_LENGTH)
+
+
+def new_chart_path() -> str:
+    """A chart path no other query uses, so concurrent charts never collide"""
+    return os.path.join(CHART_DIRECTORY, f"temp_chart_{uuid.uuid4()}.png")
+
+
+def chart_filename(value: Any) -> Optional[str]:
+    """Filename of the chart a response points at, if it is a saved PNG
+
+    PandasAI returns the path its generated code saved to, so the image is
+    known without scanning the chart directory.
+    """
+    if not isinstance(value, str) or not value.lower().endswith('.png'):
+        return None
+    path = os.path.abspath(value)
+    if os.path.dirname(path) != os.path.abspath(CHART_DIRECTORY) or not os.path.isfile(path):
+        return None
+    return os.path.basename(path)
+
+
+def chart_asset_url(filename: str) -> Optional[str]:
+    """Immutable URL of a saved chart: /charts/<content hash>/<filename>
+
+    The hash is computed once, when the chart is produced, and recorded
+    beside the chart, so serving it later only compares the URL with the
+    record instead of hashing the file.
+    """
+    path = os.path.join(CHART_DIRECTORY, filename)
+    try:
+        short_digest = _file_digest(path)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, 'w', encoding='ascii') as f:
+            f.write(short_digest)
+        os.replace(tmp_path, path + CHART_DIGEST_EXTENSION)
+    except OSError:
+        return None
+    return f"/charts/{short_digest}/{filename}"
+
+
+def _file_digest(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()[:CHART_DIGEST_LENGTH]
+
+
+def pinned_chart_directory() -> str:
+    return os.path.join(CHART_DIRECTORY, PINNED_CHART_SUBDIRECTORY)
+
+
+def pin_chart(filename: str) -> Optional[Dict[str, str]]:
+    """Copy a chart into the pinned store, returning its image path and URL
+
+    Copies are named by content hash, so a chart pinned twice (or by other
+    sessions) is stored once and its URL never changes. Pruning leaves the
+    store alone, so a dashboard pin outlives the chart it was made from.
+    Returns None when the chart no longer exists.
+    """
+    source = safe_join(os.path.abspath(CHART_DIRECTORY), filename)
+    if source is None:
+        return None
+    try:
+        digest = _file_digest(source)
+        directory = pinned_chart_directory()
+        target = os.path.join(directory, f"{digest}.png")
+        if not os.path.exists(target):
+            os.makedirs(directory, exist_ok=True)
+            tmp_path = f"{target}.{uuid.uuid4().hex}.tmp"
+            shutil.copyfile(source, tmp_path)
+            os.replace(tmp_path, target)
+    except OSError:
+        return None
+    return {
+        'image_path': f"{PINNED_CHART_SUBDIRECTORY}/{digest}.png",
+        'image_url': f"/charts/{PINNED_CHART_SUBDIRECTORY}/{digest}.png"
+    }
+
+
+def keep_chart(filename: str, until: float):
+    """Protect a chart from pruning until ``until`` (a Unix time)
+
+    Used for charts that cached query results still point at; a later
+    ``until`` extends the protection.
+    """
+    path = safe_join(os.path.abspath(CHART_DIRECTORY), filename + CHART_KEEP_EXTENSION)
+    if path is None:
+        return
+    try:
+        if os.path.exists(path) and os.path.getmtime(path) >= until:
+            return
+        with open(path, 'a', encoding='ascii'):
+            pass
+        os.utime(path, (until, until))
+    except OSError:
+        pass
+
+
+def recorded_chart_digest(filename: str) -> Optional[str]:
+    """Digest recorded for a chart by ``chart_asset_url`` (None if it has none)"""
+    path = safe_join(os.path.abspath(CHART_DIRECTORY), filename + CHART_DIGEST_EXTENSION)
+    if path is None:
+        return None
+    try:
+        with open(path, 'r', encoding='ascii') as f:
+            return f.read().strip()
+    except (OSError, ValueError):
+        return None
+
+
+class ChartRetention:
+    """Removes chart images past a maximum age or beyond a maximum count
+
+    ``maybe_prune`` is cheap to call after every chart: the directory is
+    scanned at most once per ``interval`` seconds. Charts with a live keep
+    marker are neither removed nor counted, and pinned copies live in a
+    subdirectory that is never scanned.
+    """
+
+    def __init__(self, directory: str = CHART_DIRECTORY, max_age: float = 24 * 3600,
+                 max_files: int = 1000, interval: float = 300):
+        self._lock = threading.Lock()
+        self._last_prune = 0.0
+        self.configure(directory, max_age, max_files, interval)
+
+    def configure(self, directory: str = CHART_DIRECTORY, max_age: float = 24 * 3600,
+                  max_files: int = 1000, interval: float = 300):
+        self.directory = directory
+        self.max_age = max_age
+        self.max_files = max_files
+        self.interval = interval
+
+    def maybe_prune(self):
+        with self._lock:
+            now = time.time()
+            if now - self._last_prune < self.interval:
+                return
+            self._last_prune = now
+        self.prune()
+
+    def prune(self) -> int:
+        """Delete expired charts, then the oldest ones over the limit"""
+        try:
+            entries = [entry for entry in os.scandir(self.directory)
+                       if entry.is_file() and entry.name.endswith('.png')]
+        except OSError:
+            return 0
+
+        now = time.time()
+        cutoff = now - self.max_age
+        charts = []
+        for entry in entries:
+            try:
+                if os.path.getmtime(entry.path + CHART_KEEP_EXTENSION) > now:
+                    continue
+            except OSError:
+                pass
+            try:
+                charts.append((entry.stat().st_mtime, entry.path))
+            except OSError:
+                pass
+        charts.sort(reverse=True)
+        expired = [path for i, (mtime, path) in enumerate(charts)
+                   if mtime < cutoff or i >= self.max_files]
+
+        removed = 0
+        for path in expired:
+            try:
+                os.remove(path)
+                removed += 1
+            except OSError:
+                pass
+            for sidecar in (path + CHART_DIGEST_EXTENSION, path + CHART_KEEP_EXTENSION):
+                try:
+                    os.remove(sidecar)
+                except OSError:
+                    pass
+        if removed:
+            print(f"Removed {removed} old chart image(s) from {self.directory}")
+        return removed
+
+
+chart_retention = ChartRetention()
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Local re-execution of PandasAI-generated code against session tables
+"""
+
+import hashlib
+import hmac
+import json
+import re
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Dict
+
+import duckdb
+import matplotlib
+matplotlib.use('Agg')  # Use non-interactive backend to avoid GUI issues
+import matplotlib.pyplot as plt
+import pandas as pd
+import pandasai as pai
+from pandasai.core.code_execution.code_executor import CodeExecutor
+from pandasai.core.response.parser import ResponseParser
+
+from app.utils.chart_artifacts import new_chart_path
+
+# Quoted .png paths in generated code, as PandasAI itself rewrites them
+CHART_PATH_PATTERN = re.compile(r"""(['"])([^'"]*\.png)\1""")
+
+# pyplot's current figure and pai.config are process-global; jobs on the
+# worker pool take this lock to change the config or run generated code
+pandasai_lock = threading.RLock()
+
+
+@contextmanager
+def exclusive_pyplot():
+    """Hold ``pandasai_lock`` and close every figure left open on the way out
+
+    Generated code draws on pyplot's current figure, so two jobs running
+    it at once could draw into or save each other's charts.
+    """
+    with pandasai_lock:
+        try:
+            yield
+        finally:
+            plt.close('all')
+
+
+def schema_fingerprint(tables: Dict[str, pd.DataFrame]) -> str:
+    """Hash table names, column names and dtypes (not data) of a query's tables"""
+    schema = [
+        [name, [[str(col), str(dtype)] for col, dtype in df.dtypes.items()]]
+        for name, df in sorted(tables.items())
+    ]
+    return hashlib.sha256(json.dumps(schema).encode('utf-8')).hexdigest()
+
+
+class UntrustedCodeError(ValueError):
+    """Raised for cached code that was not stored by this app for this schema"""
+
+
+def _code_signature(code: str, fingerprint: str, secret: str) -> str:
+    payload = json.dumps([fingerprint, hashlib.sha256(code.encode('utf-8')).hexdigest()])
+    return hmac.new(secret.encode('utf-8'), payload.encode('utf-8'), hashlib.sha256).hexdigest()
+
+
+def generated_code_entry(code: str, fingerprint: str, secret: str) -> Dict[str, Any]:
+    """Cache entry for code generated against the schema with ``fingerprint``
+
+    The entry is signed with ``secret`` (the app's SECRET_KEY) over the
+    schema fingerprint and the code's hash, so it can be checked before
+    the code is run again.
+    """
+    return {'code': code, 'schema': fingerprint,
+            'signature': _code_signature(code, fingerprint, secret)}
+
+
+def verify_generated_code(entry: Dict[str, Any], fingerprint: str, secret: str) -> str:
+    """Return the code of a cache entry made by ``generated_code_entry``
+
+    Raises UntrustedCodeError unless the entry was stored for the schema
+    with ``fingerprint`` and its signature matches the code, i.e. it was
+    written by this app and not edited in the cache directory since.
+    """
+    code, schema, signature = entry.get('code'), entry.get('schema'), entry.get('signature')
+    if not isinstance(code, str) or not isinstance(signature, str) or schema != fingerprint:
+        raise UntrustedCodeError('Cached code was not stored for this schema')
+    if not hmac.compare_digest(signature, _code_signature(code, fingerprint, secret)):
+        raise UntrustedCodeError('Cached code does not match its signature')
+    return code
+
+
+def _fresh_chart_paths(code: str) -> str:
+    """Point chart output at a new file so re-runs never share an image"""
+    chart_path = new_chart_path()
+    return CHART_PATH_PATTERN.sub(lambda m: f"{m.group(1)}{chart_path}{m.group(1)}", code)
+
+
+class LazyTables:
+    """Private DuckDB connection that loads session tables on first reference
+
+    ``loaders`` maps each PandasAI table name to a callable returning its
+    DataFrame. A table is loaded and registered only when a SQL query
+    mentions its name, so questions about one domain never read the
+    others. ``progress``, when given, receives a ``data_loaded`` event per
+    table loaded.
+    """
+
+    def __init__(self, loaders: Dict[str, Callable[[], pd.DataFrame]],
+                 progress: Callable[..., None] = None):
+        self.loaders = loaders
+        self.progress = progress
+        self.loaded = []
+        self._patterns = {
+            name: re.compile(r'\b' + re.escape(name) + r'\b', re.IGNORECASE)
+            for name in loaders
+        }
+        self._connection = duckdb.connect()
+        self._lock = threading.Lock()
+
+    def _register_referenced(self, sql_query: str):
+        for name, pattern in self._patterns.items():
+            if name in self.loaded or not pattern.search(sql_query):
+                continue
+            df = self.loaders[name]()
+            if df is None:
+                raise FileNotFoundError(f"Data for table {name} is no longer available")
+            self._connection.register(name, df)
+            self.loaded.append(name)
+            if self.progress:
+                self.progress('data_loaded', table=name, rows=len(df), columns=len(df.columns))
+
+    def execute_sql_query(self, sql_query: str) -> pd.DataFrame:
+        with self._lock:
+            self._register_referenced(sql_query)
+            return self._connection.execute(sql_query).df()
+
+    def close(self):
+        self._connection.close()
+
+
+def execute_generated_code(code: str, tables: LazyTables):
+    """Run previously generated code without calling the LLM
+
+    The code runs in a fresh PandasAI namespace (pd, np, plt) whose
+    ``execute_sql_query`` is backed by ``tables``. Returns a PandasAI
+    response object, exactly like ``df.chat``.
+
+    Trust boundary: like ``Agent.execute_code`` without a sandbox, the
+    code runs in this process with the server's privileges and no checks
+    of its own. Only pass code returned by ``verify_generated_code``, which
+    accepts only what this app generated for the same schema; the cache
+    directory and SECRET_KEY must not be writable or readable by others.
+    """
+    executor = CodeExecutor(pai.config.get())
+    executor.add_to_env('execute_sql_query', tables.execute_sql_query)
+    code = _fresh_chart_paths(code)
+    with exclusive_pyplot():
+        result = executor.execute_and_return_result(code)
+    return ResponseParser().parse(result, code)
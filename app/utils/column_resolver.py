@@ -0,0 +1,330 @@
+#!/usr/bin/env python3
+"""
+Column resolver: ranked matching of query terms to a dataset's columns
+"""
+
+import bisect
+import json
+import os
+import re
+import uuid
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+
+COLUMN_INDEX_EXTENSION = '.columns.json'
+COLUMN_INDEX_VERSION = 1
+
+# Match weights per term source; a query term counts once per column (best source)
+NAME_WEIGHT = 100       # the full column name appears in the query
+NAME_TOKEN_WEIGHT = 30  # a word of the column name (e.g. 'pressure' in blood_pressure)
+SYNONYM_WEIGHT = 25     # a synonym of a name word or label (e.g. 'weight' -> 'wt')
+LABEL_WEIGHT = 10       # a word of the SDTM variable label
+MIN_SCORE = 10
+# Query words that describe the records ('adverse events' of an AE domain,
+# 'over time') rather than name a column: they only add to other matches
+GENERIC_TERMS = {'adverse', 'adverse event', 'event', 'time'}
+GENERIC_TERM_FACTOR = 0.2
+MIN_PREFIX_LENGTH = 3   # shorter query words only match whole terms
+# Words shared by most columns of a wide table (e.g. 'value') do not discriminate
+COMMON_TERM_FRACTION = 0.5
+COMMON_TERM_MIN_COLUMNS = 20
+
+# SDTM variables whose full name carries the meaning
+SDTM_VARIABLE_LABELS = {
+    'STUDYID': 'Study Identifier',
+    'DOMAIN': 'Domain Abbreviation',
+    'USUBJID': 'Unique Subject Identifier',
+    'SUBJID': 'Subject Identifier for the Study',
+    'SITEID': 'Study Site Identifier',
+    'AGE': 'Age',
+    'AGEU': 'Age Units',
+    'SEX': 'Sex',
+    'RACE': 'Race',
+    'ETHNIC': 'Ethnicity',
+    'COUNTRY': 'Country',
+    'ARM': 'Description of Planned Arm',
+    'ARMCD': 'Planned Arm Code',
+    'ACTARM': 'Description of Actual Arm',
+    'ACTARMCD': 'Actual Arm Code',
+    'BRTHDTC': 'Date/Time of Birth',
+    'DTHDTC': 'Date/Time of Death',
+    'DTHFL': 'Subject Death Flag',
+    'RFSTDTC': 'Subject Reference Start Date/Time',
+    'RFENDTC': 'Subject Reference End Date/Time',
+    'RFXSTDTC': 'Date/Time of First Study Treatment',
+    'RFXENDTC': 'Date/Time of Last Study Treatment',
+    'RFICDTC': 'Date/Time of Informed Consent',
+    'VISIT': 'Visit Name',
+    'VISITNUM': 'Visit Number',
+    'VISITDY': 'Planned Study Day of Visit',
+    'EPOCH': 'Epoch',
+    'ETCD': 'Element Code',
+    'ELEMENT': 'Description of Element',
+}
+
+# Domain-prefixed SDTM variables (AESEV, VSSTRESN, ...) labelled by suffix
+SDTM_SUFFIX_LABELS = {
+    'SEQ': 'Sequence Number',
+    'SPID': 'Sponsor-Defined Identifier',
+    'TESTCD': 'Test Short Name',
+    'TEST': 'Test Name',
+    'CAT': 'Category',
+    'SCAT': 'Subcategory',
+    'POS': 'Position of Subject',
+    'LOC': 'Location',
+    'ORRES': 'Result or Finding in Original Units',
+    'ORRESU': 'Original Units',
+    'STRESC': 'Standardized Result in Character Format',
+    'STRESN': 'Standardized Result in Numeric Format',
+    'STRESU': 'Standardized Units',
+    'STAT': 'Completion Status',
+    'REASND': 'Reason Not Done',
+    'BLFL': 'Baseline Flag',
+    'TPT': 'Planned Time Point Name',
+    'TPTNUM': 'Planned Time Point Number',
+    'TERM': 'Reported Term',
+    'DECOD': 'Dictionary-Derived Term',
+    'LLT': 'Lowest Level Term',
+    'HLT': 'High Level Term',
+    'HLGT': 'High Level Group Term',
+    'BODSYS': 'Body System or Organ Class',
+    'SOC': 'Primary System Organ Class',
+    'SEV': 'Severity Intensity',
+    'TOXGR': 'Standard Toxicity Grade',
+    'SER': 'Serious Event',
+    'ACN': 'Action Taken with Study Treatment',
+    'REL': 'Causality',
+    'OUT': 'Outcome of Adverse Event',
+    'DTC': 'Date/Time of Collection',
+    'DY': 'Study Day of Collection',
+    'STDTC': 'Start Date/Time',
+    'ENDTC': 'End Date/Time',
+    'STDY': 'Study Day of Start',
+    'ENDY': 'Study Day of End',
+}
+
+# Query words and phrases -> index terms they stand for
+SYNONYMS = {
+    'weight': ['wt'],
+    'height': ['ht'],
+    'bmi': ['body', 'mass', 'index'],
+    'body mass index': ['bmi'],
+    'temperature': ['temp'],
+    'blood pressure': ['bp', 'sysbp', 'diabp'],
+    'heart rate': ['hr', 'pulse'],
+    'pulse': ['hr', 'heart', 'rate'],
+    'gender': ['sex'],
+    'subject': ['usubjid', 'subjid', 'patient'],
+    'patient': ['usubjid', 'subjid', 'subject'],
+    'id': ['usubjid', 'subjid', 'identifier'],
+    'date': ['dtc', 'date'],
+    'time': ['dtc', 'time'],
+    'day': ['dy', 'day'],
+    'value': ['stresn', 'result'],
+    'event': ['term', 'decod'],
+    'adverse event': ['aeterm', 'aedecod'],
+    'severity': ['sev', 'aesev'],
+    'treatment': ['arm'],
+    'group': ['arm'],
+}
+
+_LABEL_STOPWORDS = {'of', 'or', 'in', 'the', 'and', 'to', 'for', 'by', 'with', 'a', 'an'}
+_WORD_PATTERN = re.compile(r'[a-z0-9]+')
+
+
+def sdtm_label(column: str) -> Optional[str]:
+    """CDISC SDTM label of a variable name, if it follows the standard"""
+    name = column.upper()
+    if name in SDTM_VARIABLE_LABELS:
+        return SDTM_VARIABLE_LABELS[name]
+    if len(name) > 2 and name[:2].isalpha() and name[2:] in SDTM_SUFFIX_LABELS:
+        return SDTM_SUFFIX_LABELS[name[2:]]
+    return None
+
+
+def _name_tokens(column: str) -> List[str]:
+    """Words of a column name: split on separators, camelCase and digit runs"""
+    spaced = re.sub(r'(?<=[a-z])(?=[A-Z])|(?<=[A-Za-z])(?=[0-9])|(?<=[0-9])(?=[A-Za-z])', ' ', column)
+    return _WORD_PATTERN.findall(spaced.lower())
+
+
+def _label_tokens(label: str) -> List[str]:
+    return [word for word in _WORD_PATTERN.findall(label.lower()) if word not in _LABEL_STOPWORDS]
+
+
+def build_column_terms(columns: List[str], labels: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+    """Inverted index of column names, name words, SDTM labels and synonyms
+
+    ``terms`` maps each index term to ``[column position, weight, source]``
+    entries; it is plain JSON so it can be stored next to the upload.
+    ``labels`` overrides the SDTM label of specific columns.
+    """
+    label_overrides = labels or {}
+    terms: Dict[str, Dict[int, Tuple[int, str]]] = {}
+
+    def add(term, position, weight, source):
+        entries = terms.setdefault(term, {})
+        if position not in entries or entries[position][0] < weight:
+            entries[position] = (weight, source)
+
+    column_labels = {}
+    for position, column in enumerate(columns):
+        column = str(column)
+        add(column.lower(), position, NAME_WEIGHT, 'name')
+        for token in _name_tokens(column):
+            add(token, position, NAME_TOKEN_WEIGHT, 'name')
+
+        label = label_overrides.get(column) or sdtm_label(column)
+        if label:
+            column_labels[column] = label
+            for token in _label_tokens(label):
+                add(token, position, LABEL_WEIGHT, 'label')
+
+    # Synonyms point a query phrase at the columns its target terms index
+    for phrase, targets in SYNONYMS.items():
+        for target in targets:
+            for position, (weight, _) in list(terms.get(target, {}).items()):
+                add(phrase, position, min(weight, SYNONYM_WEIGHT), 'synonym')
+
+    return {
+        'version': COLUMN_INDEX_VERSION,
+        'columns': [str(column) for column in columns],
+        'labels': column_labels,
+        'terms': {term: [[position, weight, source] for position, (weight, source) in sorted(entries.items())]
+                  for term, entries in terms.items()}
+    }
+
+
+class ColumnResolver:
+    """Ranked, explainable matches of a natural-language query to columns"""
+
+    def __init__(self, index: Dict[str, Any]):
+        self.version = index.get('version', 0)
+        self.columns = index['columns']
+        self.labels = index['labels']
+        self.terms = index['terms']
+        self.sorted_terms = sorted(self.terms)  # bisect gives trie-style prefix lookups
+        self.max_phrase_words = max(len(term.split()) for term in self.terms) if self.terms else 1
+        self.common_term_limit = max(COMMON_TERM_MIN_COLUMNS, len(self.columns) * COMMON_TERM_FRACTION)
+
+    @classmethod
+    def from_columns(cls, columns: List[str]) -> 'ColumnResolver':
+        return cls(build_column_terms(columns))
+
+    def _prefix_terms(self, word: str) -> List[str]:
+        matches = []
+        for i in range(bisect.bisect_left(self.sorted_terms, word), len(self.sorted_terms)):
+            term = self.sorted_terms[i]
+            if not term.startswith(word):
+                break
+            if term != word and ' ' not in term:
+                matches.append(term)
+        return matches
+
+    def resolve(self, query: str) -> List[Dict[str, Any]]:
+        """Columns matching the query, best first
+
+        Each match has the column, its score, the query position of its
+        first matching term (for ordering axes as mentioned) and the
+        reasons behind the score. Ties keep the dataset's column order.
+        """
+        query_lower = query.lower()
+        names = re.findall(r'[a-z0-9_]+', query_lower)
+        words = _WORD_PATTERN.findall(query_lower)
+        candidates = []  # (query term, position in query, weight factor, prefix match)
+
+        for position, name in enumerate(names):
+            if '_' in name:
+                candidates.append((name, position, 1.0, False))
+        for position, _ in enumerate(words):
+            for size in range(self.max_phrase_words, 0, -1):
+                if position + size > len(words):
+                    continue
+                phrase = ' '.join(words[position:position + size])
+                if phrase not in self.terms and phrase.endswith('s') and phrase[:-1] in self.terms:
+                    phrase = phrase[:-1]  # plural of an indexed term
+                if phrase in self.terms:
+                    candidates.append((phrase, position, 1.0, False))
+                elif size == 1 and len(phrase) >= MIN_PREFIX_LENGTH:
+                    for term in self._prefix_terms(phrase):
+                        candidates.append((term, position, 0.5, True))
+
+        # Best contribution of each query term to each column
+        contributions: Dict[int, Dict[str, Tuple[float, int, str]]] = {}
+        for term, query_position, factor, prefix in candidates:
+            entries = self.terms.get(term, [])
+            if len(entries) > self.common_term_limit:
+                continue
+            if term in GENERIC_TERMS:
+                factor *= GENERIC_TERM_FACTOR
+            for column_position, weight, source in entries:
+                score = weight * factor
+                if source == 'name' and weight == NAME_WEIGHT and not prefix:
+                    source = 'exact'
+                reason = f"{'prefix of ' if prefix else ''}{source} '{term}'"
+                best = contributions.setdefault(column_position, {})
+                key = term if not prefix else f"{query_position}:prefix"
+                if key not in best or best[key][0] < score:
+                    best[key] = (score, query_position, reason)
+
+        matches = []
+        for column_position, parts in contributions.items():
+            score = sum(score for score, _, _ in parts.values())
+            if score < MIN_SCORE:
+                continue
+            ranked_parts = sorted(parts.values(), key=lambda part: (-part[0], part[1]))
+            matches.append({
+                'column': self.columns[column_position],
+                'score': score,
+                'exact': any(reason.startswith('exact') for _, _, reason in parts.values()),
+                'query_position': min(part[1] for part in parts.values()),
+                'query_positions': sorted({part[1] for part in parts.values()}),
+                'column_position': column_position,
+                'reasons': [reason for _, _, reason in ranked_parts]
+            })
+
+        matches.sort(key=lambda match: (-match['score'], match['column_position']))
+        return matches
+
+
+def build_column_index(columns: List[str], path: str,
+                       labels: Optional[Dict[str, str]] = None) -> ColumnResolver:
+    """Build a dataset's column index and persist it as JSON"""
+    index = build_column_terms(columns, labels)
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(index, f)
+    os.replace(tmp_path, path)
+    return ColumnResolver(index)
+
+
+@lru_cache(maxsize=64)
+def _load_cached(path: str, mtime_ns: int) -> ColumnResolver:
+    with open(path, 'r', encoding='utf-8') as f:
+        return ColumnResolver(json.load(f))
+
+
+@lru_cache(maxsize=64)
+def _resolver_for_columns(columns: Tuple[str, ...]) -> ColumnResolver:
+    return ColumnResolver.from_columns(list(columns))
+
+
+def load_column_resolver(file_info: Dict, columns: Optional[List[str]] = None) -> Optional[ColumnResolver]:
+    """Return the stored column resolver of an upload
+
+    Uploads indexed before resolvers existed fall back to an in-memory
+    resolver over ``columns`` (cached per column list).
+    """
+    path = file_info.get('column_index_path')
+    if path:
+        try:
+            resolver = _load_cached(path, os.stat(path).st_mtime_ns)
+            if resolver.version == COLUMN_INDEX_VERSION:
+                return resolver
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Could not load column index {path}: {e}")
+    if columns is None:
+        columns = file_info.get('column_names')
+    if not columns:
+        return None
+    return _resolver_for_columns(tuple(str(column) for column in columns))
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Columnar (Feather) copies of uploaded CSVs and the shared dataset loader
+"""
+
+import os
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from pyarrow import feather
+
+from app.utils.dataframe_cache import dataframe_cache
+
+COLUMNAR_EXTENSION = '.feather'
+
+
+def columnar_path_for(csv_path: str) -> str:
+    """Return the Feather path stored next to an uploaded CSV"""
+    return os.path.splitext(csv_path)[0] + COLUMNAR_EXTENSION
+
+
+def _arrow_schema(dtypes: Dict[str, Any]) -> pa.Schema:
+    """Build the Arrow schema for the dtypes inferred during validation"""
+    empty = pd.DataFrame({name: pd.Series(dtype=dtype) for name, dtype in dtypes.items()})
+    schema = pa.Schema.from_pandas(empty, preserve_index=False)
+    for i, (name, dtype) in enumerate(dtypes.items()):
+        if dtype == object:
+            # Empty object columns infer as Arrow null; CSV text is always string
+            schema = schema.set(i, pa.field(name, pa.string()))
+    return schema
+
+
+def convert_csv_to_columnar(csv_path: str, dtypes: Dict[str, Any],
+                            chunk_size: int = 50000) -> Optional[str]:
+    """Convert a validated CSV to Feather once, returning the new path
+
+    The CSV is streamed in chunks parsed with the dtypes inferred during
+    validation, so memory stays bounded by ``chunk_size`` rows. Returns None
+    when a chunk cannot be represented with those dtypes; callers then keep
+    reading the CSV.
+    """
+    columnar_path = columnar_path_for(csv_path)
+    try:
+        schema = _arrow_schema(dtypes)
+        options = pa.ipc.IpcWriteOptions(compression='lz4')
+        reader = pd.read_csv(csv_path, dtype=dict(dtypes), chunksize=chunk_size,
+                             on_bad_lines='skip')
+        with pa.OSFile(columnar_path, 'wb') as sink, \
+                pa.ipc.new_file(sink, schema, options=options) as writer:
+            for chunk in reader:
+                writer.write_batch(
+                    pa.RecordBatch.from_pandas(chunk, schema=schema, preserve_index=False)
+                )
+        return columnar_path
+    except Exception as e:
+        print(f"Columnar conversion failed for {csv_path}: {e}")
+        if os.path.exists(columnar_path):
+            os.remove(columnar_path)
+        return None
+
+
+def append_csv_to_columnar(columnar_path: str, csv_path: str, dtypes: Dict[str, Any],
+                           target_path: str, chunk_size: int = 50000,
+                           on_chunk: Callable[[pd.DataFrame], None] = None) -> Optional[str]:
+    """Write a Feather file holding an existing one's rows followed by a CSV's
+
+    Record batches of the existing file are copied without re-parsing (and
+    cast only when a column's dtype was widened by the new rows); only the
+    CSV is parsed, in chunks, each of which is passed to ``on_chunk``.
+    Returns None when the rows cannot be stored with ``dtypes``.
+    """
+    try:
+        schema = _arrow_schema(dtypes)
+        options = pa.ipc.IpcWriteOptions(compression='lz4')
+        reader = pd.read_csv(csv_path, dtype=dict(dtypes), chunksize=chunk_size,
+                             on_bad_lines='skip')
+        with pa.memory_map(columnar_path) as source, \
+                pa.OSFile(target_path, 'wb') as sink, \
+                pa.ipc.new_file(sink, schema, options=options) as writer:
+            existing = pa.ipc.open_file(source)
+            for i in range(existing.num_record_batches):
+                batch = existing.get_batch(i)
+                if batch.schema.equals(schema):
+                    writer.write_batch(batch)
+                else:
+                    writer.write_table(pa.Table.from_batches([batch]).cast(schema))
+            for chunk in reader:
+                writer.write_batch(
+                    pa.RecordBatch.from_pandas(chunk, schema=schema, preserve_index=False)
+                )
+                if on_chunk is not None:
+                    on_chunk(chunk)
+        return target_path
+    except Exception as e:
+        print(f"Appending {csv_path} to {columnar_path} failed: {e}")
+        if os.path.exists(target_path):
+            os.remove(target_path)
+        return None
+
+
+def read_columnar(columnar_path: str, columns: List[str] = None) -> pd.DataFrame:
+    """Read a Feather file, materializing only the requested columns"""
+    return pd.read_feather(columnar_path, columns=columns)
+
+
+def read_columnar_rows(columnar_path: str, start: int, columns: List[str] = None) -> pd.DataFrame:
+    """Rows from position ``start`` on (e.g. those appended last), read batch by batch
+
+    Only the record batches overlapping those rows are converted to pandas.
+    """
+    tables = []
+    with pa.memory_map(columnar_path) as source:
+        reader = pa.ipc.open_file(source)
+        offset = 0
+        for i in range(reader.num_record_batches):
+            batch = reader.get_batch(i)
+            end = offset + batch.num_rows
+            if end > start:
+                batch = batch.slice(max(start - offset, 0))
+                tables.append(pa.Table.from_batches([batch.select(columns) if columns else batch]))
+            offset = end
+        if not tables:
+            return reader.schema.empty_table().select(columns or reader.schema.names).to_pandas()
+        return pa.concat_tables(tables).to_pandas()
+
+
+def take_file_rows(file_info: Dict[str, Any], positions: np.ndarray,
+                   columns: List[str] = None) -> pd.DataFrame:
+    """Rows of an upload at the given positions, e.g. one page of a preview
+
+    From the columnar copy only the requested columns are read and only
+    the selected rows are converted to pandas.
+    """
+    columnar_path = file_info.get('columnar_path')
+    if columnar_path and os.path.exists(columnar_path):
+        table = feather.read_table(columnar_path, columns=columns, memory_map=True)
+        return table.take(pa.array(positions, type=pa.int64())).to_pandas()
+    df = dataframe_cache.get(file_info['file_path'], columns=columns)
+    return df.take(positions).reset_index(drop=True)
+
+
+def load_file_dataframe(file_info: Dict[str, Any],
+                        columns: List[str] = None) -> Optional[pd.DataFrame]:
+    """Load an uploaded file through the shared cache
+
+    Reads the columnar copy when one exists and falls back to the raw CSV.
+    When ``columns`` is given only those columns are read from disk.
+    """
+    columnar_path = file_info.get('columnar_path')
+    if columnar_path and os.path.exists(columnar_path):
+        return dataframe_cache.get(columnar_path, loader=read_columnar, columns=columns)
+    return dataframe_cache.get(file_info['file_path'], columns=columns)
+
+
+def load_file_schema(file_info: Dict[str, Any]) -> Optional[pd.DataFrame]:
+    """Return a zero-row DataFrame carrying the file's columns and dtypes"""
+    columnar_path = file_info.get('columnar_path')
+    if columnar_path and os.path.exists(columnar_path):
+        with pa.memory_map(columnar_path) as source:
+            schema = pa.ipc.open_file(source).schema
+        return schema.empty_table().to_pandas()
+
+    df = dataframe_cache.get(file_info['file_path'])
+    return df.iloc[:0] if df is not None else None
+
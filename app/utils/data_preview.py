@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+Paged data preview with column projection, sorting and filters on the stored dataset
+"""
+
+import hashlib
+import operator
+import os
+import uuid
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from app.utils.columnar_store import load_file_dataframe, load_file_schema, take_file_rows
+from app.utils.subject_index import load_subject_index
+
+PREVIEW_PAGE_SIZE = 10
+# Sort orders are stored next to the upload as <hash>.sort.<column digest>.npz
+SORT_INDEX_EXTENSION = '.sort.{}.npz'
+COMPARISONS = {'eq': operator.eq, 'ne': operator.ne, 'lt': operator.lt,
+               'le': operator.le, 'gt': operator.gt, 'ge': operator.ge}
+FILTER_OPERATORS = tuple(COMPARISONS) + ('contains', 'null', 'notnull')
+
+
+class PreviewError(ValueError):
+    """A preview request naming an unknown column or an invalid filter"""
+
+
+def parse_filter(text: str) -> Tuple[str, str, Optional[str]]:
+    """Parse ``COLUMN:op[:value]``, e.g. ``VSTESTCD:eq:PULSE`` or ``AESER:null``"""
+    parts = text.split(':', 2)
+    if len(parts) < 2 or parts[1] not in FILTER_OPERATORS:
+        raise PreviewError(f"Invalid filter {text!r}; expected COLUMN:op:value with op one of "
+                           f"{', '.join(FILTER_OPERATORS)}")
+    column, op = parts[0], parts[1]
+    value = parts[2] if len(parts) == 3 else None
+    if value is None and op not in ('null', 'notnull'):
+        raise PreviewError(f"Filter {text!r} needs a value")
+    return column, op, value
+
+
+def _filter_mask(series: pd.Series, op: str, value: Optional[str]) -> np.ndarray:
+    if op == 'null':
+        return series.isna().to_numpy()
+    if op == 'notnull':
+        return series.notna().to_numpy()
+    if op == 'contains':
+        matches = series.astype('string').str.contains(value, case=False, regex=False)
+        return matches.fillna(False).to_numpy(dtype=bool)
+
+    if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+        try:
+            value = float(value)
+        except ValueError:
+            raise PreviewError(f"{series.name} is numeric; {value!r} is not a number")
+    else:
+        series = series.astype('string')
+    # Missing values match no comparison, 'ne' included
+    matches = COMPARISONS[op](series, value).fillna(False) & series.notna()
+    return matches.to_numpy(dtype=bool)
+
+
+def _sort_index_path(file_info: Dict[str, Any], column: str) -> str:
+    base = os.path.splitext(file_info.get('columnar_path') or file_info['file_path'])[0]
+    digest = hashlib.sha256(column.encode('utf-8')).hexdigest()[:16]
+    return base + SORT_INDEX_EXTENSION.format(digest)
+
+
+@lru_cache(maxsize=64)
+def _load_sort_index(path: str, mtime_ns: int) -> Tuple[np.ndarray, int, np.ndarray]:
+    with np.load(path, allow_pickle=False) as data:
+        return data['order'], int(data['valid']), data['groups']
+
+
+def sort_order(file_info: Dict[str, Any], column: str) -> Tuple[np.ndarray, int, np.ndarray]:
+    """Row positions ordered by a column (missing values last), the non-missing count and tie groups
+
+    ``groups[i]`` numbers the distinct value at ``order[i]`` for the
+    non-missing rows; equal values keep file order. Orders are computed
+    on first use and stored next to the upload, so every session
+    previewing the same content reuses them. A text subject key is
+    already ordered by the subject index.
+    """
+    index = load_subject_index(file_info)
+    if (index is not None and index.key == column
+            and file_info.get('data_types', {}).get(column) == 'object'):
+        missing = np.setdiff1d(np.arange(file_info['rows']), index.rows, assume_unique=True)
+        groups = np.repeat(np.arange(len(index.subjects)), np.diff(index.indptr))
+        return np.concatenate([index.rows, missing]), len(index.rows), groups
+
+    path = _sort_index_path(file_info, column)
+    try:
+        return _load_sort_index(path, os.stat(path).st_mtime_ns)
+    except (OSError, ValueError, KeyError):
+        pass
+
+    series = load_file_dataframe(file_info, columns=[column])[column].reset_index(drop=True)
+    try:
+        ordered = series.sort_values(kind='stable', na_position='last')
+    except TypeError:
+        # Mixed value types: order by their text
+        series = series.where(series.isna(), series.astype(str))
+        ordered = series.sort_values(kind='stable', na_position='last')
+    order = ordered.index.to_numpy(dtype=np.int64)
+    valid = int(series.notna().sum())
+    values = ordered.to_numpy()[:valid]
+    groups = np.concatenate([[0], np.cumsum(values[1:] != values[:-1])]).astype(np.int64)[:valid]
+
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp.npz"
+    np.savez(tmp_path, order=order, valid=np.array(valid), groups=groups)
+    os.replace(tmp_path, path)
+    return order, valid, groups
+
+
+def preview_page(file_info: Dict[str, Any], offset: int = 0, limit: int = PREVIEW_PAGE_SIZE,
+                 columns: Optional[List[str]] = None, sort: Optional[str] = None,
+                 descending: bool = False,
+                 filters: Sequence[Tuple[str, str, Optional[str]]] = ()) -> Dict[str, Any]:
+    """One page of an upload's rows after filtering and sorting
+
+    Filter and sort columns are read one at a time through the shared
+    DataFrame cache; only the rows of the page are read for display.
+    """
+    schema = load_file_schema(file_info)
+    if schema is None:
+        raise FileNotFoundError(file_info['file_path'])
+    names = schema.columns.tolist()
+    unknown = [col for col in list(columns or []) + ([sort] if sort else []) + [f[0] for f in filters]
+               if col not in names]
+    if unknown:
+        raise PreviewError(f"Unknown column(s): {', '.join(dict.fromkeys(unknown))}")
+
+    total = file_info['rows']
+    mask = None
+    for column, op, value in filters:
+        column_mask = _filter_mask(load_file_dataframe(file_info, columns=[column])[column], op, value)
+        mask = column_mask if mask is None else mask & column_mask
+    matched = int(mask.sum()) if mask is not None else total
+
+    if sort:
+        order, valid, groups = sort_order(file_info, sort)
+        if descending:
+            # Groups of equal values reversed; rows within a group stay in file order
+            descending_order = np.lexsort((np.arange(valid), -groups))
+            order = np.concatenate([order[:valid][descending_order], order[valid:]])
+        if mask is not None:
+            order = order[mask[order]]
+        positions = order[offset:offset + limit]
+    elif mask is not None:
+        positions = np.flatnonzero(mask)[offset:offset + limit]
+    else:
+        positions = np.arange(offset, min(offset + limit, total), dtype=np.int64)
+
+    page = take_file_rows(file_info, positions, columns or None)
+    # JSON has no NaN or ±inf; both are sent as null
+    page = page.replace([np.inf, -np.inf], np.nan)
+    return {
+        'data': page.astype(object).where(page.notna(), None).to_dict('records'),
+        'columns': page.columns.tolist(),
+        'offset': offset,
+        'limit': limit,
+        'total_rows': total,
+        'matched_rows': matched,
+        'sort': sort,
+        'descending': descending,
+        'filters': [':'.join(part for part in f if part is not None) for f in filters]
+    }
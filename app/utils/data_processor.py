@@ -1,8 +1,28 @@
 import pandas as pd
+import numpy as np
 import os
+import re
+import warnings
 from werkzeug.utils import secure_filename
 from flask import current_app
 import json
+from app.utils.columnar_store import (COLUMNAR_EXTENSION, append_csv_to_columnar, convert_csv_to_columnar,
+                                      load_file_dataframe, read_columnar)
+from app.utils.upload_store import UploadStore
+from app.utils.subject_index import (SUBJECT_INDEX_EXTENSION, build_subject_index, detect_subject_key,
+                                     load_subject_index)
+from app.utils.dataset_profile import (PROFILE_EXTENSION, build_profile, column_state, load_profile,
+                                       load_profile_state, save_profile, update_column_state)
+from app.utils.column_resolver import COLUMN_INDEX_EXTENSION, build_column_index
+from app.utils.data_preview import preview_page
+from app.utils.findings_pivot import (FINDINGS_PIVOT_EXTENSION, FINDINGS_PIVOT_INDEX_EXTENSION,
+                                      append_findings_pivot, build_findings_pivot, detect_findings_layout,
+                                      findings_columns)
+
+# pandas reports skipped lines as "Skipping line 7: expected 5 fields, saw 6"
+MALFORMED_LINE_PATTERN = re.compile(r'Skipping line (\d+): ([^\n]*)')
+# Cap on malformed lines echoed back to the client
+MAX_REPORTED_MALFORMED_LINES = 20
 
 class DataProcessor:
     def __init__(self):
@@ -13,17 +33,54 @@ class DataProcessor:
         return '.' in filename and \
                filename.rsplit('.', 1)[1].lower() in self.allowed_extensions
     
-    def validate_csv(self, file_path):
-        """Validate CSV file and return basic info"""
+    def validate_csv(self, file_path, chunk_size=50000):
+        """Validate CSV file in bounded memory and return basic info
+        
+        The file is streamed in chunks: the first chunk supplies the sample
+        rows, dtypes are merged across chunks, and lines with the wrong number
+        of fields are skipped and reported by line number.
+        """
         try:
-            df = pd.read_csv(file_path)
+            rows = 0
+            column_names = None
+            data_types = {}
+            # Numeric columns holding values other than 0/1 (not boolean flags)
+            non_binary = set()
+            sample_data = []
+            
+            with warnings.catch_warnings(record=True) as caught:
+                warnings.simplefilter('always', pd.errors.ParserWarning)
+                for chunk in pd.read_csv(file_path, chunksize=chunk_size, on_bad_lines='warn'):
+                    if column_names is None:
+                        column_names = chunk.columns.tolist()
+                        sample_data = chunk.head(5).to_dict('records')
+                    for col in chunk.columns:
+                        dtype = self._chunk_dtype(chunk[col])
+                        if self._is_number_dtype(dtype) and not chunk[col].dropna().isin((0, 1)).all():
+                            non_binary.add(col)
+                        data_types[col] = self._merge_dtypes(data_types.get(col), dtype,
+                                                             binary=col not in non_binary)
+                    rows += len(chunk)
+            
+            if column_names is None:
+                # Header-only files yield no chunks
+                column_names = pd.read_csv(file_path, nrows=0).columns.tolist()
+                data_types = {col: np.dtype(object) for col in column_names}
+            
+            malformed_lines = []
+            for warning in caught:
+                for line, message in MALFORMED_LINE_PATTERN.findall(str(warning.message)):
+                    malformed_lines.append({'line': int(line), 'message': message})
+            
             return {
                 'success': True,
-                'rows': len(df),
-                'columns': len(df.columns),
-                'column_names': df.columns.tolist(),
-                'data_types': df.dtypes.to_dict(),
-                'sample_data': df.head(5).to_dict('records')
+                'rows': rows,
+                'columns': len(column_names),
+                'column_names': column_names,
+                'data_types': data_types,
+                'sample_data': sample_data,
+                'malformed_lines': malformed_lines,
+                'non_binary_columns': non_binary
             }
         except Exception as e:
             return {
@@ -31,40 +88,380 @@ class DataProcessor:
                 'error': str(e)
             }
     
+    def _chunk_dtype(self, series):
+        """dtype of a parsed chunk column
+        
+        pandas parses True/False with blanks as object; such columns are
+        reported as the nullable ``boolean`` dtype instead.
+        """
+        if series.dtype == object:
+            values = series.dropna()
+            if len(values) and isinstance(values.iloc[0], (bool, np.bool_)) \
+                    and values.map(lambda value: isinstance(value, (bool, np.bool_))).all():
+                return pd.BooleanDtype()
+        return series.dtype
+    
+    def _merge_dtypes(self, current, new, binary=False):
+        """Combine dtypes inferred for the same column in different chunks
+        
+        Booleans with and without missing values merge to the nullable
+        ``boolean`` dtype, as do booleans and numbers when the numbers are
+        all 0/1 (``binary``), i.e. one flag column written both ways.
+        """
+        if current is None or current == new:
+            return new
+        bools = [pd.api.types.is_bool_dtype(dtype) for dtype in (current, new)]
+        if all(bools):
+            return pd.BooleanDtype()
+        if any(bools) and binary and all(is_bool or self._is_number_dtype(dtype)
+                                         for is_bool, dtype in zip(bools, (current, new))):
+            return pd.BooleanDtype()
+        numeric = self._is_number_dtype(current) and self._is_number_dtype(new)
+        return np.dtype('float64') if numeric else np.dtype(object)
+    
+    def _is_number_dtype(self, dtype):
+        return pd.api.types.is_numeric_dtype(dtype) and not pd.api.types.is_bool_dtype(dtype)
+    
     def save_file_to_session(self, file, session_data):
-        """Save uploaded file and store metadata in session"""
+        """Save uploaded file and store metadata in session
+        
+        Uploads are stored by content hash, so identical files uploaded by
+        different sessions share one blob, one columnar copy and one cache
+        entry; validation only runs the first time content is seen.
+        """
         if file and self.allowed_file(file.filename):
             filename = secure_filename(file.filename)
-            file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
-            file.save(file_path)
+            upload_store = self._upload_store()
+            upload = upload_store.add(file, self._session_id(session_data))
             
-            # Validate the CSV
-            validation = self.validate_csv(file_path)
+            metadata = self._load_or_ingest(upload_store, upload)
+            if 'error' in metadata:
+                # Drop the reference; the blob goes with its last one
+                upload_store.release(upload['content_hash'], upload['upload_ref'])
+                return {'success': False, 'error': metadata['error']}
+            
+            # Store file info in session
+            if 'uploaded_files' not in session_data:
+                session_data['uploaded_files'] = []
             
-            if validation['success']:
-                # Store file info in session
-                if 'uploaded_files' not in session_data:
-                    session_data['uploaded_files'] = []
-                
-                file_info = {
-                    'filename': filename,
-                    'file_path': file_path,
-                    'rows': validation['rows'],
-                    'columns': validation['columns'],
-                    'column_names': validation['column_names'],
-                    'data_types': {str(k): str(v) for k, v in validation['data_types'].items()},
-                    'sample_data': validation['sample_data']
-                }
-                
-                session_data['uploaded_files'].append(file_info)
-                return {'success': True, 'file_info': file_info}
-            else:
-                # Remove invalid file
-                os.remove(file_path)
-                return {'success': False, 'error': validation['error']}
+            file_info = self._file_info(filename, upload, metadata)
+            session_data['uploaded_files'].append(file_info)
+            return {
+                'success': True,
+                'file_info': file_info,
+                'malformed_lines': metadata['malformed_lines']
+            }
         
         return {'success': False, 'error': 'Invalid file type or no file provided'}
     
+    def append_file_to_session(self, file, filename, session_data):
+        """Append the rows of an uploaded CSV to a dataset already in the session
+        
+        Only the new rows are parsed. The columnar copy is extended with
+        them, the profile, subject index and findings pivot are updated
+        from them, and the session file is swapped for the combined data
+        (a new content hash). The appended file needs the same header,
+        which is checked before anything is copied.
+        """
+        files = session_data.get('uploaded_files', [])
+        position = next((i for i, info in enumerate(files) if info['filename'] == filename), None)
+        if position is None:
+            return {'success': False, 'error': f'{filename} is not uploaded'}
+        if not (file and self.allowed_file(file.filename)):
+            return {'success': False, 'error': 'Invalid file type or no file provided'}
+        
+        previous = files[position]
+        # Check the header before the base blob is copied or its columnar data extended
+        try:
+            header = pd.read_csv(file.stream, nrows=0).columns.tolist()
+            file.stream.seek(0)
+        except Exception as e:
+            return {'success': False, 'error': f'Could not read the appended file: {str(e)}'}
+        if header != previous['column_names']:
+            return {'success': False,
+                    'error': 'Appended rows must have the same columns, in the same order, '
+                             f"as the dataset ({', '.join(previous['column_names'])})"}
+        
+        upload_store = self._upload_store()
+        upload = upload_store.append(previous['content_hash'], file, self._session_id(session_data))
+        try:
+            metadata = upload_store.load_metadata(upload['content_hash'])
+            if metadata is None:
+                base = upload_store.load_metadata(previous['content_hash'])
+                if base is None or not base.get('columnar_path'):
+                    # Nothing to extend: process the combined file like a new upload
+                    metadata = self._load_or_ingest(upload_store, upload)
+                else:
+                    metadata = self._append_rows(upload_store, upload, base)
+        finally:
+            os.remove(upload['rows_path'])
+        
+        if 'error' in metadata:
+            upload_store.release(upload['content_hash'], upload['upload_ref'])
+            return {'success': False, 'error': metadata['error']}
+        
+        file_info = self._file_info(filename, upload, metadata)
+        files[position] = file_info
+        self.remove_file(previous)
+        return {
+            'success': True,
+            'file_info': file_info,
+            'previous_file_info': previous,
+            'appended_rows': file_info['rows'] - previous['rows'],
+            # Columns whose type had to change to hold the new values (e.g. numbers to text)
+            'widened_columns': [col for col in file_info['column_names']
+                                if file_info['data_types'][col] != previous['data_types'].get(col)],
+            'malformed_lines': metadata.get('appended_malformed_lines', [])
+        }
+    
+    def _load_or_ingest(self, upload_store, upload):
+        """Stored metadata of an upload, validating and converting it when first seen"""
+        content_hash = upload['content_hash']
+        file_path = upload['file_path']
+        metadata = upload_store.load_metadata(content_hash)
+        if metadata is None:
+            # Validate the CSV
+            chunk_size = current_app.config['CSV_VALIDATION_CHUNK_SIZE']
+            validation = self.validate_csv(file_path, chunk_size=chunk_size)
+            
+            if not validation['success']:
+                return {'error': validation['error']}
+            
+            # Convert once to columnar storage; later reads skip CSV parsing
+            columnar_path = convert_csv_to_columnar(
+                file_path, validation['data_types'], chunk_size=chunk_size
+            )
+            
+            metadata = {
+                'columnar_path': columnar_path,
+                'rows': validation['rows'],
+                'columns': validation['columns'],
+                'column_names': validation['column_names'],
+                'data_types': {str(k): str(v) for k, v in validation['data_types'].items()},
+                'sample_data': validation['sample_data'],
+                'malformed_lines': validation['malformed_lines'][:MAX_REPORTED_MALFORMED_LINES],
+                'malformed_line_count': len(validation['malformed_lines'])
+            }
+            metadata.update(self._build_derived_files(upload_store, content_hash, file_path,
+                                                      columnar_path, validation['column_names']))
+            upload_store.save_metadata(content_hash, metadata)
+        elif any(key not in metadata for key in ('subject_key', 'profile_path', 'column_index_path',
+                                                 'findings_pivot')):
+            # Blob stored before one of the derived files existed
+            metadata.update(self._build_derived_files(upload_store, content_hash, file_path,
+                                                      metadata['columnar_path'], metadata['column_names']))
+            upload_store.save_metadata(content_hash, metadata)
+        return metadata
+    
+    def _binary_state(self, state):
+        """Whether a stored column state shows only 0/1 (or boolean) values"""
+        if not state or not state.get('values_complete'):
+            return False
+        return all(value in (0, 1) for value, _ in state['value_counts'])
+    
+    def _append_rows(self, upload_store, upload, base):
+        """Metadata of a stored dataset extended with the rows in ``upload['rows_path']``"""
+        content_hash = upload['content_hash']
+        rows_path = upload['rows_path']
+        chunk_size = current_app.config['CSV_VALIDATION_CHUNK_SIZE']
+        
+        validation = self.validate_csv(rows_path, chunk_size=chunk_size)
+        if not validation['success']:
+            return {'error': validation['error']}
+        if validation['rows'] == 0:
+            return {'error': 'The appended file has no data rows'}
+        profile_state = load_profile_state(base.get('profile_path'))
+        states = (profile_state or {}).get('columns', {})
+        data_types = {col: self._merge_dtypes(pd.api.types.pandas_dtype(base['data_types'][col]),
+                                              validation['data_types'][col],
+                                              binary=(col not in validation['non_binary_columns']
+                                                      and self._binary_state(states.get(col))))
+                      for col in base['column_names']}
+        widened = [col for col in data_types if str(data_types[col]) != base['data_types'][col]]
+        
+        # Fold each parsed chunk into the profile state, subject keys and findings rows
+        layout = detect_findings_layout(base['column_names'], base.get('subject_key'))
+        kept_columns = list(dict.fromkeys(([base['subject_key']] if base.get('subject_key') else [])
+                                          + (findings_columns(layout) if layout else [])))
+        kept = []
+        
+        def on_chunk(chunk):
+            for col in base['column_names']:
+                if col in states and col not in widened:
+                    states[col] = update_column_state(states[col], chunk[col])
+            if kept_columns:
+                kept.append(chunk[kept_columns])
+        
+        columnar_path = append_csv_to_columnar(
+            base['columnar_path'], rows_path, data_types,
+            upload_store.blob_path(content_hash, COLUMNAR_EXTENSION),
+            chunk_size=chunk_size, on_chunk=on_chunk
+        )
+        if columnar_path is None:
+            # The rows do not fit the stored layout: process the combined file in full
+            return self._load_or_ingest(upload_store, upload)
+        rows = base['rows'] + validation['rows']
+        new_rows = pd.concat(kept, ignore_index=True) if kept else None
+        
+        derived = {'subject_key': base.get('subject_key'), 'subject_index_path': None, 'subject_count': None,
+                   'profile_path': None, 'column_index_path': None, 'findings_pivot': None}
+        try:
+            # Columns without a state (older profiles) or with a widened dtype are re-profiled
+            # from the columnar copy, which needs no CSV parsing
+            for col in base['column_names']:
+                if col not in states or col in widened:
+                    states[col] = column_state(read_columnar(columnar_path, columns=[col])[col])
+            profile_path = upload_store.blob_path(content_hash, PROFILE_EXTENSION)
+            save_profile(rows, {col: states[col] for col in base['column_names']}, profile_path)
+            derived['profile_path'] = profile_path
+        except Exception as e:
+            print(f"Could not update dataset profile: {str(e)}")
+        
+        if base.get('subject_key'):
+            try:
+                index_path = upload_store.blob_path(content_hash, SUBJECT_INDEX_EXTENSION)
+                index = load_subject_index(base)
+                if index is not None:
+                    index = index.append(new_rows[base['subject_key']], base['rows'])
+                    index.save(index_path)
+                else:
+                    keys = read_columnar(columnar_path, columns=[base['subject_key']])[base['subject_key']]
+                    index = build_subject_index(keys, base['subject_key'], index_path)
+                derived.update({'subject_index_path': index_path, 'subject_count': len(index)})
+            except Exception as e:
+                print(f"Could not update subject index: {str(e)}")
+        
+        try:
+            column_index_path = upload_store.blob_path(content_hash, COLUMN_INDEX_EXTENSION)
+            build_column_index(base['column_names'], column_index_path)
+            derived['column_index_path'] = column_index_path
+        except Exception as e:
+            print(f"Could not build column index: {str(e)}")
+        
+        if layout is not None:
+            try:
+                pivot_paths = (upload_store.blob_path(content_hash, FINDINGS_PIVOT_EXTENSION),
+                               upload_store.blob_path(content_hash, FINDINGS_PIVOT_INDEX_EXTENSION))
+                pivot = None
+                if base.get('findings_pivot'):
+                    pivot = append_findings_pivot(base['findings_pivot'], layout, new_rows, *pivot_paths)
+                if pivot is None:
+                    # New results for keys already in the view change their means
+                    pivot = build_findings_pivot({'file_path': upload['file_path'],
+                                                  'columnar_path': columnar_path}, layout, *pivot_paths)
+                derived['findings_pivot'] = pivot
+            except Exception as e:
+                print(f"Could not update findings pivot: {str(e)}")
+        
+        appended_malformed = [dict(line, appended=True) for line in validation['malformed_lines']]
+        metadata = {
+            'columnar_path': columnar_path,
+            'rows': rows,
+            'columns': base['columns'],
+            'column_names': base['column_names'],
+            'data_types': {str(k): str(v) for k, v in data_types.items()},
+            'sample_data': base['sample_data'],
+            'malformed_lines': (base['malformed_lines'] + appended_malformed)[:MAX_REPORTED_MALFORMED_LINES],
+            'malformed_line_count': base['malformed_line_count'] + len(appended_malformed),
+            'appended_malformed_lines': appended_malformed[:MAX_REPORTED_MALFORMED_LINES],
+            'appended_to': {'content_hash': upload['base_hash'], 'rows': base['rows']}
+        }
+        metadata.update(derived)
+        upload_store.save_metadata(content_hash, metadata)
+        print(f"Appended {validation['rows']} rows to {base['rows']} without re-reading them "
+              f"({len(widened)} column(s) widened)")
+        return metadata
+    
+    def _file_info(self, filename, upload, metadata):
+        """Session entry of an upload"""
+        return {
+            'filename': filename,
+            'file_path': upload['file_path'],
+            'columnar_path': metadata['columnar_path'],
+            'content_hash': upload['content_hash'],
+            'upload_ref': upload['upload_ref'],
+            'rows': metadata['rows'],
+            'columns': metadata['columns'],
+            'column_names': metadata['column_names'],
+            'data_types': metadata['data_types'],
+            'sample_data': metadata['sample_data'],
+            'malformed_line_count': metadata['malformed_line_count'],
+            'subject_key': metadata.get('subject_key'),
+            'subject_index_path': metadata.get('subject_index_path'),
+            'subject_count': metadata.get('subject_count'),
+            'profile_path': metadata.get('profile_path'),
+            'column_index_path': metadata.get('column_index_path'),
+            'findings_pivot': metadata.get('findings_pivot')
+        }
+    
+    def _build_derived_files(self, upload_store, content_hash, file_path, columnar_path, column_names):
+        """Subject index, column profile, column index and findings pivot stored next to the blob"""
+        derived = {'subject_key': None, 'subject_index_path': None, 'subject_count': None,
+                   'profile_path': None, 'column_index_path': None, 'findings_pivot': None}
+        derived.update(self._index_subjects(upload_store, content_hash, file_path,
+                                            columnar_path, column_names))
+        
+        try:
+            profile_path = upload_store.blob_path(content_hash, PROFILE_EXTENSION)
+            build_profile(file_path, columnar_path, column_names, profile_path)
+            derived['profile_path'] = profile_path
+        except Exception as e:
+            print(f"Could not build dataset profile: {str(e)}")
+        
+        try:
+            column_index_path = upload_store.blob_path(content_hash, COLUMN_INDEX_EXTENSION)
+            build_column_index(column_names, column_index_path)
+            derived['column_index_path'] = column_index_path
+        except Exception as e:
+            print(f"Could not build column index: {str(e)}")
+        
+        # Findings domains also get a wide view with one column per test
+        layout = detect_findings_layout(column_names, derived['subject_key'])
+        if layout is not None:
+            try:
+                derived['findings_pivot'] = build_findings_pivot(
+                    {'file_path': file_path, 'columnar_path': columnar_path}, layout,
+                    upload_store.blob_path(content_hash, FINDINGS_PIVOT_EXTENSION),
+                    upload_store.blob_path(content_hash, FINDINGS_PIVOT_INDEX_EXTENSION)
+                )
+            except Exception as e:
+                print(f"Could not build findings pivot: {str(e)}")
+        
+        return derived
+    
+    def _index_subjects(self, upload_store, content_hash, file_path, columnar_path, column_names):
+        """Build the persistent subject index of an SDTM domain, if it has a key column"""
+        subject_key = detect_subject_key(column_names)
+        if subject_key is None:
+            return {}
+        
+        try:
+            keys = load_file_dataframe(
+                {'file_path': file_path, 'columnar_path': columnar_path}, columns=[subject_key]
+            )[subject_key]
+            index_path = upload_store.blob_path(content_hash, SUBJECT_INDEX_EXTENSION)
+            index = build_subject_index(keys, subject_key, index_path)
+        except Exception as e:
+            print(f"Could not build subject index: {str(e)}")
+            return {}
+        
+        return {
+            'subject_key': subject_key,
+            'subject_index_path': index_path,
+            'subject_count': len(index)
+        }
+    
+    def remove_file(self, file_info):
+        """Release a session's reference to an upload"""
+        self._upload_store().release(file_info['content_hash'], file_info['upload_ref'])
+    
+    def _upload_store(self):
+        return UploadStore(current_app.config['UPLOAD_FOLDER'])
+    
+    def _session_id(self, session_data):
+        """Session id owning upload references (server-side sessions have one)"""
+        return getattr(session_data, 'sid', None) or 'anonymous'
+    
     def get_session_data_summary(self, session_data):
         """Get summary of uploaded files in session"""
         if 'uploaded_files' not in session_data:
@@ -81,6 +478,20 @@ class DataProcessor:
         
         return summary
     
+    def get_file_profile(self, filename, session_data):
+        """Return the stored column profile of a session file"""
+        for file_info in session_data.get('uploaded_files', []):
+            if file_info['filename'] == filename:
+                return load_profile(file_info)
+        return None
+    
+    def get_file_preview(self, filename, session_data, **options):
+        """Return one page of a session file (see ``preview_page`` for options)"""
+        for file_info in session_data.get('uploaded_files', []):
+            if file_info['filename'] == filename:
+                return preview_page(file_info, **options)
+        return None
+    
     def load_dataframe(self, filename, session_data):
         """Load a specific dataframe from session files"""
         if 'uploaded_files' not in session_data:
@@ -89,19 +500,15 @@ class DataProcessor:
         for file_info in session_data['uploaded_files']:
             if file_info['filename'] == filename:
                 try:
-                    return pd.read_csv(file_info['file_path'])
+                    return load_file_dataframe(file_info)
                 except Exception as e:
                     return None
         
         return None
     
     def cleanup_session_files(self, session_data):
-        """Clean up uploaded files when session ends"""
+        """Release uploaded files when session ends"""
         if 'uploaded_files' in session_data:
             for file_info in session_data['uploaded_files']:
-                try:
-                    if os.path.exists(file_info['file_path']):
-                        os.remove(file_info['file_path'])
-                except Exception:
-                    pass
+                self.remove_file(file_info)
             session_data['uploaded_files'] = [] 
\ No newline at end of file
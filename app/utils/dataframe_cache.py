@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+Process-wide cache of parsed DataFrames shared by all processors
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import pandas as pd
+
+
+def _read_csv(file_path: str, columns: List[str] = None) -> pd.DataFrame:
+    """Default loader: parse a CSV, optionally restricted to some columns
+
+    Malformed lines are skipped; validation reports them at upload time.
+    """
+    return pd.read_csv(file_path, usecols=columns, on_bad_lines='skip')
+
+
+class DataFrameCache:
+    """LRU cache of parsed DataFrames keyed by file path, mtime and size
+
+    Entries are evicted least-recently-used first once the combined memory
+    footprint exceeds ``max_bytes``. Cached DataFrames are shared between
+    requests, so callers must treat them as read-only and copy before
+    mutating.
+    """
+
+    def __init__(self, max_bytes: int = 256 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> (dataframe, nbytes)
+        self._current_bytes = 0
+        self._lock = threading.RLock()
+        self._load_locks = {}  # key -> [lock, threads using it]
+        self.hits = 0
+        self.misses = 0
+
+    def configure(self, max_bytes: int):
+        """Update the memory budget, evicting entries if it shrank"""
+        with self._lock:
+            self.max_bytes = max_bytes
+            self._evict()
+
+    def get(self, file_path: str, loader: Callable[..., pd.DataFrame] = None,
+            columns: List[str] = None) -> Optional[pd.DataFrame]:
+        """Return the parsed DataFrame for a file, loading it on a miss
+
+        ``loader`` is called as ``loader(file_path, columns)`` and defaults to
+        ``pd.read_csv``. When ``columns`` is given and the full frame is
+        already cached, the projection is served from memory.
+        """
+        file_key = self._make_key(file_path)
+        if file_key is None:
+            return None
+        projection = tuple(columns) if columns is not None else None
+        key = file_key + (projection,)
+
+        with self._lock:
+            df = self._lookup(key)
+            if df is None and projection is not None:
+                full_df = self._lookup(file_key + (None,))
+                if full_df is not None:
+                    return full_df[list(projection)]
+            if df is not None:
+                return df
+            load_lock = self._load_locks.setdefault(key, [threading.Lock(), 0])
+            load_lock[1] += 1
+
+        # Serialize loads of the same file so concurrent misses parse it once.
+        # The lock is dropped only once no thread holds or waits on it, so a
+        # late arrival can never pair with a fresh lock and load in parallel.
+        try:
+            with load_lock[0]:
+                with self._lock:
+                    df = self._lookup(key)
+                    if df is not None:
+                        return df
+                    self.misses += 1
+
+                df = (loader or _read_csv)(file_path, columns)
+                if projection is not None:
+                    df = df[list(projection)]
+                self._store(key, df)
+        finally:
+            with self._lock:
+                load_lock[1] -= 1
+                if load_lock[1] == 0:
+                    self._load_locks.pop(key, None)
+
+        return df
+
+    def invalidate(self, file_path: str):
+        """Drop every cached version of a file"""
+        path = os.path.abspath(file_path)
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == path]:
+                self._remove(key)
+
+    def clear(self):
+        """Drop all cached DataFrames"""
+        with self._lock:
+            self._entries.clear()
+            self._current_bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Return cache occupancy and hit statistics"""
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': int(self._current_bytes),
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses
+            }
+
+    def _lookup(self, key: Tuple) -> Optional[pd.DataFrame]:
+        """Return a cached frame and mark it most recently used"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def _make_key(self, file_path: str) -> Optional[Tuple[str, int, int]]:
+        """Build a cache key that changes whenever the file is rewritten"""
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            return None
+        return (os.path.abspath(file_path), stat.st_mtime_ns, stat.st_size)
+
+    def _store(self, key: Tuple, df: pd.DataFrame):
+        """Insert a DataFrame, replacing stale versions of the same file"""
+        nbytes = int(df.memory_usage(index=True, deep=True).sum())
+        with self._lock:
+            stale_keys = [k for k in self._entries
+                          if k[0] == key[0] and k[1:3] != key[1:3]]
+            for stale in stale_keys:
+                self._remove(stale)
+
+            # Frames larger than the whole budget are returned but not kept
+            if nbytes > self.max_bytes:
+                return
+
+            self._entries[key] = (df, nbytes)
+            self._current_bytes += nbytes
+            self._evict()
+
+    def _remove(self, key: Tuple):
+        _, nbytes = self._entries.pop(key)
+        self._current_bytes -= nbytes
+
+    def _evict(self):
+        """Evict least recently used entries until within budget"""
+        while self._entries and self._current_bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+
+
+dataframe_cache = DataFrameCache()
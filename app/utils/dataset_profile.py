@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+"""
+Per-dataset column profile computed once at upload and reused per request
+"""
+
+import json
+import os
+import uuid
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from app.utils.columnar_store import read_columnar
+
+PROFILE_EXTENSION = '.profile.json'
+# Column states (mergeable when rows are appended) are stored next to the profile
+PROFILE_STATE_SUFFIX = '.state.json'
+HISTOGRAM_BINS = 20
+TOP_VALUES = 10
+# Values counted exactly per column; beyond this the distinct count is estimated
+TRACKED_VALUES = 500
+# Hashes kept by the distinct-count sketch (relative error about 1/sqrt(size))
+DISTINCT_SKETCH_SIZE = 1024
+
+
+def _python_value(value):
+    """Convert numpy/pandas scalars to JSON-friendly Python values (NaN and ±inf become None)"""
+    if value is None or value is pd.NA:
+        return None
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and not np.isfinite(value):
+        return None
+    if isinstance(value, (int, float, bool, str)):
+        return value
+    return str(value)
+
+
+def is_numeric_column(series: pd.Series) -> bool:
+    return pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series)
+
+
+def _value_hashes(values: pd.Series) -> np.ndarray:
+    return pd.util.hash_pandas_object(values, index=False).to_numpy(dtype=np.uint64)
+
+
+def _distinct_sketch(hashes: np.ndarray) -> List[int]:
+    """K-minimum-values sketch: the smallest distinct 64-bit value hashes"""
+    return [int(h) for h in np.unique(hashes)[:DISTINCT_SKETCH_SIZE]]
+
+
+def _estimate_distinct(sketch: List[int]) -> int:
+    if len(sketch) < DISTINCT_SKETCH_SIZE:
+        return len(sketch)
+    return int(round((DISTINCT_SKETCH_SIZE - 1) * 2.0 ** 64 / (sketch[-1] + 1)))
+
+
+def _top_counts(counts: Dict[Any, int], limit: int) -> List[List[Any]]:
+    """Most frequent values first; ties in order of the values' text, so merges are deterministic"""
+    return [[value, count] for value, count in
+            sorted(counts.items(), key=lambda item: (-item[1], str(item[0])))[:limit]]
+
+
+def column_state(series: pd.Series) -> Dict[str, Any]:
+    """Mergeable summary of a column from which its profile is derived
+
+    Holds counts, numeric moments (count/sum/m2/min/max over finite
+    values, with ±inf counted separately), the histogram, exact value
+    counts while the column has at most ``TRACKED_VALUES`` distinct values
+    (the most frequent ones after that) and a sketch for estimating the
+    distinct count, so appended rows can be folded in with
+    ``update_column_state`` without re-reading earlier ones.
+    """
+    values = series.dropna()
+    numeric = is_numeric_column(series)
+    finite = None
+    if numeric:
+        numbers = values.to_numpy(dtype=float)
+        finite = numbers[np.isfinite(numbers)]
+        # ±inf has no JSON form: counted apart and left out of value counts
+        counts = values[np.isfinite(numbers)].value_counts()
+    else:
+        counts = values.value_counts()
+    state = {
+        'type': str(series.dtype),
+        'rows': int(len(series)),
+        'null_count': int(len(series) - len(values)),
+        'numeric': numeric,
+        'value_counts': _top_counts({_python_value(value): int(count)
+                                     for value, count in counts.head(TRACKED_VALUES).items()}, TRACKED_VALUES),
+        'values_complete': len(counts) <= TRACKED_VALUES,
+        'sketch': _distinct_sketch(_value_hashes(values))
+    }
+
+    if numeric:
+        state['non_finite'] = int(len(values) - len(finite))
+    if numeric and len(finite):
+        histogram_counts, bin_edges = np.histogram(finite, bins=HISTOGRAM_BINS)
+        mean = finite.mean()
+        state.update({
+            'count': int(len(finite)),
+            'sum': float(finite.sum()),
+            'm2': float(((finite - mean) ** 2).sum()),
+            'min': _python_value(finite.min()),
+            'max': _python_value(finite.max()),
+            'histogram': {
+                'bin_edges': [float(edge) for edge in bin_edges],
+                'counts': [int(count) for count in histogram_counts]
+            },
+            # The last bin is closed: values on its upper edge move if the grid grows past it
+            'histogram_top': int((finite == bin_edges[-1]).sum())
+        })
+    return state
+
+
+def _extend_histogram(histogram: Dict[str, List], top_count: int,
+                      values: np.ndarray) -> Tuple[Dict[str, List], int]:
+    """Add finite values to an equal-width histogram without its original data
+
+    The grid is extended to cover the new values and coarsened by merging
+    adjacent bins (doubling the width) until it has at most
+    ``HISTOGRAM_BINS`` bins, so earlier counts move between bins exactly.
+    ``top_count`` is how many values lie on the closed upper edge; they
+    move to the next bin when that edge becomes an inner one. Returns the
+    histogram and its new ``top_count``.
+    """
+    if not len(values):
+        return histogram, top_count
+    if not histogram['counts']:
+        counts, edges = np.histogram(values, bins=HISTOGRAM_BINS)
+        return ({'bin_edges': [float(edge) for edge in edges], 'counts': [int(count) for count in counts]},
+                int((values == edges[-1]).sum()))
+
+    edges = np.asarray(histogram['bin_edges'])
+    width = edges[1] - edges[0]
+    low, high = min(edges[0], values.min()), max(edges[-1], values.max())
+    shift = int(np.ceil((edges[0] - low) / width))
+    span = shift + int(np.ceil((high - edges[0]) / width))
+    factor = 1
+    while -(-span // factor) > HISTOGRAM_BINS:
+        factor *= 2
+    bins = max(1, -(-span // factor))
+    new_edges = edges[0] - shift * width + np.arange(bins + 1) * width * factor
+    # Edges that coincide with old ones are copied, not recomputed, so new
+    # values are binned against exactly the boundaries earlier counts used
+    old = np.arange(bins + 1) * factor - shift
+    kept = (old >= 0) & (old < len(edges))
+    new_edges[kept] = edges[old[kept]]
+    # Guard the outer edges against rounding so no value falls outside
+    new_edges[0], new_edges[-1] = min(new_edges[0], low), max(new_edges[-1], high)
+
+    counts = np.histogram(values, bins=new_edges)[0]
+    last = len(histogram['counts'])
+    positions = np.minimum((np.arange(last) + shift) // factor, bins - 1)
+    np.add.at(counts, positions, np.asarray(histogram['counts'], dtype=counts.dtype))
+    top_bin = (last + shift) // factor
+    if top_count and (last + shift) % factor == 0 and top_bin < bins:
+        counts[positions[-1]] -= top_count
+        counts[top_bin] += top_count
+    new_top = int((values == new_edges[-1]).sum()) + (top_count if new_edges[-1] == edges[-1] else 0)
+    return {'bin_edges': [float(edge) for edge in new_edges], 'counts': [int(count) for count in counts]}, new_top
+
+
+def update_column_state(state: Dict[str, Any], series: pd.Series) -> Dict[str, Any]:
+    """State of a column after appending ``series`` to the rows ``state`` describes"""
+    new = column_state(series)
+    counts = {}
+    for value, count in state['value_counts'] + new['value_counts']:
+        counts[value] = counts.get(value, 0) + count
+    merged = {
+        'type': state['type'],
+        'rows': state['rows'] + new['rows'],
+        'null_count': state['null_count'] + new['null_count'],
+        'numeric': state['numeric'],
+        'value_counts': _top_counts(counts, TRACKED_VALUES),
+        'values_complete': state['values_complete'] and new['values_complete'] and len(counts) <= TRACKED_VALUES,
+        'sketch': sorted(set(state['sketch']) | set(new['sketch']))[:DISTINCT_SKETCH_SIZE]
+    }
+    if merged['numeric']:
+        merged['non_finite'] = state.get('non_finite', 0) + new.get('non_finite', 0)
+    if not merged['numeric'] or not (state.get('count') or new.get('count')):
+        return merged
+    if not state.get('count'):
+        merged.update({key: new[key] for key in ('count', 'sum', 'm2', 'min', 'max', 'histogram', 'histogram_top')
+                       if key in new})
+        return merged
+    if not new.get('count'):
+        merged.update({key: state[key] for key in ('count', 'sum', 'm2', 'min', 'max', 'histogram', 'histogram_top')
+                       if key in state})
+        return merged
+
+    # Chan et al. pairwise update of the sum of squared deviations
+    n = state['count'] + new['count']
+    delta = new['sum'] / new['count'] - state['sum'] / state['count']
+    numbers = series.dropna().to_numpy(dtype=float)
+    histogram, top_count = _extend_histogram(state['histogram'], state.get('histogram_top', 0),
+                                             numbers[np.isfinite(numbers)])
+    merged.update({
+        'count': n,
+        'sum': state['sum'] + new['sum'],
+        'm2': state['m2'] + new['m2'] + delta ** 2 * state['count'] * new['count'] / n,
+        'min': min(state['min'], new['min']),
+        'max': max(state['max'], new['max']),
+        'histogram': histogram,
+        'histogram_top': top_count
+    })
+    return merged
+
+
+def profile_from_state(state: Dict[str, Any]) -> Dict[str, Any]:
+    """Column profile (as shown in previews and prompts) of a column state"""
+    profile = {
+        'type': state['type'],
+        'null_count': state['null_count'],
+        'unique_values': (len(state['value_counts']) if state['values_complete']
+                          else _estimate_distinct(state['sketch'])),
+        'top_values': state['value_counts'][:TOP_VALUES],
+        'numeric': state['numeric']
+    }
+    if len(state['sketch']) >= DISTINCT_SKETCH_SIZE and not state['values_complete']:
+        # Too many distinct values to count exactly: estimated from the sketch
+        profile['unique_values_estimated'] = True
+
+    if state.get('non_finite'):
+        profile['non_finite_count'] = state['non_finite']
+    if state['numeric'] and state.get('count'):
+        n = state['count']
+        profile.update({
+            'mean': _python_value(state['sum'] / n),
+            'std': _python_value(np.sqrt(state['m2'] / (n - 1))) if n > 1 else None,
+            'min': state['min'],
+            'max': state['max'],
+            'histogram': state['histogram']
+        })
+    return profile
+
+
+def profile_column(series: pd.Series) -> Dict[str, Any]:
+    """Dtype, nulls, cardinality, top values and, for numbers, moments and a histogram"""
+    return profile_from_state(column_state(series))
+
+
+def profile_state_path(profile_path: str) -> str:
+    """Path of the mergeable column states stored next to a profile"""
+    return profile_path[:-len('.json')] + PROFILE_STATE_SUFFIX
+
+
+def save_profile(rows: int, states: Dict[str, Dict[str, Any]], path: str) -> Dict[str, Any]:
+    """Persist a profile and the column states it was derived from"""
+    profile = {'rows': rows, 'columns': {col: profile_from_state(state) for col, state in states.items()}}
+    for target, content in ((profile_state_path(path), {'rows': rows, 'columns': states}),
+                            (path, profile)):
+        tmp_path = f"{target}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(content, f)
+        os.replace(tmp_path, target)
+    return profile
+
+
+def load_profile_state(profile_path: Optional[str]) -> Optional[Dict[str, Any]]:
+    """Column states saved with a profile (None for profiles stored without them)"""
+    if not profile_path:
+        return None
+    try:
+        with open(profile_state_path(profile_path), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def build_profile(file_path: str, columnar_path: Optional[str], column_names: List[str],
+                  path: str) -> Dict[str, Any]:
+    """Profile every column of an upload and persist the result as JSON
+
+    With a columnar copy, columns are read one at a time so memory stays
+    bounded by the largest column rather than the whole file.
+    """
+    states = {}
+    rows = 0
+    if columnar_path and os.path.exists(columnar_path):
+        for col in column_names:
+            series = read_columnar(columnar_path, columns=[col])[col]
+            rows = len(series)
+            states[col] = column_state(series)
+    else:
+        df = pd.read_csv(file_path, on_bad_lines='skip')
+        rows = len(df)
+        for col in df.columns:
+            states[str(col)] = column_state(df[col])
+
+    return save_profile(rows, states, path)
+
+
+@lru_cache(maxsize=64)
+def _load_cached(path: str, mtime_ns: int) -> Dict[str, Any]:
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def load_profile(file_info: Dict) -> Optional[Dict[str, Any]]:
+    """Return the stored profile of an upload, if it has one"""
+    path = file_info.get('profile_path')
+    if not path:
+        return None
+    try:
+        return _load_cached(path, os.stat(path).st_mtime_ns)
+    except (OSError, ValueError) as e:
+        print(f"Could not load dataset profile {path}: {e}")
+        return None
+
+
+def describe_column(column_profile: Dict[str, Any]) -> str:
+    """One-line description of a column for LLM prompts"""
+    parts = [f"{column_profile['unique_values']} distinct"]
+    if column_profile['null_count']:
+        parts.append(f"{column_profile['null_count']} missing")
+    if column_profile.get('numeric') and column_profile.get('min') is not None:
+        parts.append(f"range {column_profile['min']:g} to {column_profile['max']:g}")
+    elif column_profile['top_values']:
+        top = ', '.join(str(value) for value, _ in column_profile['top_values'][:5])
+        parts.append(f"e.g. {top}")
+    return '; '.join(parts)
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Point reduction for large line and scatter charts
+"""
+
+import warnings
+
+import numpy as np
+import pandas as pd
+
+# Cells per axis used to estimate point density for scatter sampling
+SCATTER_GRID_SIZE = 64
+
+
+def _as_numeric(series: pd.Series) -> np.ndarray:
+    """Numeric positions for any axis: numbers as-is, datetimes as ns, categories as codes"""
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return series.astype('int64').to_numpy(dtype=float)
+    if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+        return series.to_numpy(dtype=float)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')  # format inference warnings for ISO-ish strings
+        converted = pd.to_datetime(series, errors='coerce')
+    if converted.notna().all():
+        return converted.astype('int64').to_numpy(dtype=float)
+    return pd.factorize(series, sort=True)[0].astype(float)
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    """Largest-Triangle-Three-Buckets: positions of ``threshold`` points of a sorted series
+
+    Keeps the first and last point and, from each bucket in between, the
+    point forming the largest triangle with the previously kept point and
+    the average of the next bucket, which preserves peaks and troughs.
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    bucket_edges = np.floor(np.linspace(1, n - 1, threshold - 1)).astype(int)
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+    previous = 0
+
+    for i in range(threshold - 2):
+        start, end = bucket_edges[i], bucket_edges[i + 1]
+        next_start, next_end = end, bucket_edges[i + 2] if i + 2 < len(bucket_edges) else n
+        avg_x = x[next_start:next_end].mean()
+        avg_y = y[next_start:next_end].mean()
+
+        areas = np.abs(
+            (x[previous] - avg_x) * (y[start:end] - y[previous])
+            - (x[previous] - x[start:end]) * (avg_y - y[previous])
+        )
+        previous = start + int(np.argmax(areas))
+        selected[i + 1] = previous
+
+    return selected
+
+
+def downsample_line(df: pd.DataFrame, x_col: str, y_col: str, budget: int):
+    """Reduce a line series to ``budget`` points with LTTB
+
+    Returns the (possibly reduced) frame, sorted by x, and a sampling
+    summary for the response.
+    """
+    original = len(df)
+    if original <= budget:
+        return df, _summary(None, original, original)
+
+    df = df.dropna(subset=[x_col, y_col]).sort_values(x_col, kind='stable')
+    x = _as_numeric(df[x_col])
+    y = _as_numeric(df[y_col])
+    reduced = df.iloc[lttb_indices(x, y, budget)]
+    return reduced, _summary('lttb', original, len(reduced))
+
+
+def density_sample_indices(x: np.ndarray, y: np.ndarray, budget: int, seed: int = 0) -> np.ndarray:
+    """Positions of ``budget`` points sampled in proportion to local density
+
+    Points are binned on a grid; every occupied cell keeps at least one
+    point (so sparse regions and outliers survive) and the rest of the
+    budget is spread across cells in proportion to their point counts.
+    A fixed seed keeps the sample stable between requests.
+    """
+    n = len(x)
+    if budget >= n:
+        return np.arange(n)
+
+    def cell_coordinates(values):
+        low, high = np.nanmin(values), np.nanmax(values)
+        if high == low:
+            return np.zeros(n, dtype=np.int64)
+        scaled = (values - low) / (high - low) * (SCATTER_GRID_SIZE - 1)
+        return np.nan_to_num(scaled).astype(np.int64)
+
+    cells = cell_coordinates(x) * SCATTER_GRID_SIZE + cell_coordinates(y)
+
+    # Random order within each cell, then priority = position / cell size:
+    # each cell's first point ranks 0, denser cells fill up proportionally
+    order = np.random.default_rng(seed).permutation(n)
+    shuffled_cells = cells[order]
+    by_cell = np.argsort(shuffled_cells, kind='stable')
+    sorted_cells = shuffled_cells[by_cell]
+    starts = np.flatnonzero(np.r_[True, sorted_cells[1:] != sorted_cells[:-1]])
+    counts = np.diff(np.r_[starts, n])
+    rank = np.arange(n) - np.repeat(starts, counts)
+    priority = rank / np.repeat(counts, counts)
+
+    chosen = by_cell[np.argsort(priority, kind='stable')[:budget]]
+    return np.sort(order[chosen])
+
+
+def downsample_scatter(df: pd.DataFrame, x_col: str, y_col: str, budget: int):
+    """Reduce scatter points to ``budget`` with density-preserving sampling"""
+    original = len(df)
+    if original <= budget:
+        return df, _summary(None, original, original)
+
+    x = _as_numeric(df[x_col])
+    y = _as_numeric(df[y_col])
+    reduced = df.iloc[density_sample_indices(x, y, budget)]
+    return reduced, _summary('density_sample', original, len(reduced))
+
+
+def _summary(method, original: int, returned: int):
+    return {
+        'applied': method is not None,
+        'method': method,
+        'original_points': original,
+        'returned_points': returned
+    }
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Precomputed wide view of SDTM findings domains (one column per test)
+"""
+
+import os
+import uuid
+from typing import Any, Dict, Iterable, List, Optional
+
+import pandas as pd
+
+from app.utils.column_resolver import build_column_index
+from app.utils.columnar_store import load_file_dataframe, read_columnar
+
+FINDINGS_PIVOT_EXTENSION = '.wide.feather'
+FINDINGS_PIVOT_INDEX_EXTENSION = '.wide.columns.json'
+# Row keys of the wide view after the subject key, when the domain has them
+FINDINGS_ROW_KEYS = ('VISITNUM',)
+
+
+def detect_findings_layout(column_names: Iterable[str], subject_key: Optional[str]) -> Optional[Dict[str, Any]]:
+    """Test code, numeric result and row key columns of a findings domain
+
+    Findings domains (VS, LB, EG, ...) store one row per test with
+    ``--TESTCD`` naming the test and ``--STRESN`` holding its standardized
+    numeric result.
+    """
+    if not subject_key:
+        return None
+    names = [str(name) for name in column_names]
+    for name in names:
+        if len(name) == 8 and name.upper().endswith('TESTCD'):
+            prefix = name[:2]
+            value = f"{prefix}STRESN"
+            if value not in names:
+                continue
+            return {
+                'test_code': name,
+                'value': value,
+                'test_name': f"{prefix}TEST" if f"{prefix}TEST" in names else None,
+                'unit': f"{prefix}STRESU" if f"{prefix}STRESU" in names else None,
+                'keys': [subject_key] + [key for key in FINDINGS_ROW_KEYS if key in names]
+            }
+    return None
+
+
+def _test_labels(df: pd.DataFrame, layout: Dict[str, Any]) -> Dict[str, str]:
+    """Test name and unit of each test code, e.g. SYSBP -> 'Systolic Blood Pressure (mmHg)'"""
+    detail_columns = [col for col in (layout['test_name'], layout['unit']) if col]
+    if not detail_columns:
+        return {}
+    details = df.groupby(layout['test_code'], sort=True)[detail_columns].first()
+    labels = {}
+    for code, row in details.iterrows():
+        name = row.get(layout['test_name']) if layout['test_name'] else None
+        unit = row.get(layout['unit']) if layout['unit'] else None
+        label = str(name) if pd.notna(name) else str(code)
+        if unit is not None and pd.notna(unit):
+            label += f" ({unit})"
+        labels[str(code)] = label
+    return labels
+
+
+def findings_columns(layout: Dict[str, Any]) -> List[str]:
+    """Columns of the long layout the wide view is built from"""
+    return list(dict.fromkeys(layout['keys'] + [layout['test_code'], layout['value']]
+                              + [col for col in (layout['test_name'], layout['unit']) if col]))
+
+
+def _pivot(df: pd.DataFrame, layout: Dict[str, Any]) -> pd.DataFrame:
+    values = pd.to_numeric(df[layout['value']], errors='coerce')
+    codes = df[layout['test_code']].astype('string')
+    wide = pd.pivot_table(
+        pd.DataFrame({**{key: df[key] for key in layout['keys']},
+                      layout['test_code']: codes, layout['value']: values}),
+        index=layout['keys'], columns=layout['test_code'], values=layout['value'],
+        aggfunc='mean', sort=True
+    )
+    # Test codes that collide with row keys keep their values under a suffix
+    wide.columns = [f"{code}_RESULT" if code in layout['keys'] else str(code) for code in wide.columns]
+    return wide.reset_index()
+
+
+def _save_pivot(wide: pd.DataFrame, labels: Dict[str, str], layout: Dict[str, Any],
+                path: str, index_path: str) -> Dict[str, Any]:
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    wide.to_feather(tmp_path, compression='lz4')
+    os.replace(tmp_path, path)
+
+    test_codes = [col for col in wide.columns if col not in layout['keys']]
+    labels = {code: label for code, label in labels.items() if code in test_codes}
+    build_column_index(wide.columns.tolist(), index_path, labels)
+    return {
+        'file_path': path,
+        'columnar_path': path,
+        'column_index_path': index_path,
+        'rows': len(wide),
+        'keys': layout['keys'],
+        'test_code': layout['test_code'],
+        'value': layout['value'],
+        'test_codes': test_codes,
+        'labels': labels
+    }
+
+
+def build_findings_pivot(source: Dict[str, Any], layout: Dict[str, Any], path: str,
+                         index_path: str) -> Dict[str, Any]:
+    """Pivot a findings domain to one row per key and one column per test
+
+    Multiple results for the same key and test (e.g. several time points
+    in a visit) are averaged. The view is stored as Feather next to the
+    upload, with its own column index so test names resolve in queries.
+    Returns a file-info style dict usable with the shared loaders.
+    """
+    df = load_file_dataframe(source, columns=findings_columns(layout))
+    return _save_pivot(_pivot(df, layout), _test_labels(df, layout), layout, path, index_path)
+
+
+def append_findings_pivot(pivot: Dict[str, Any], layout: Dict[str, Any], rows: pd.DataFrame,
+                          path: str, index_path: str) -> Optional[Dict[str, Any]]:
+    """Extend a wide view with appended long-layout rows
+
+    Only the new rows are pivoted. Returns None when they add results to
+    a key already in the view (its means would change); the view must
+    then be rebuilt from the full domain.
+    """
+    added = _pivot(rows, layout)
+    wide = read_columnar(pivot['columnar_path'])
+    keys = layout['keys']
+    if pd.MultiIndex.from_frame(wide[keys]).isin(pd.MultiIndex.from_frame(added[keys])).any():
+        return None
+
+    test_codes = sorted(set(pivot['test_codes']) | set(added.columns.difference(keys)))
+    wide = pd.concat([wide, added], ignore_index=True)
+    wide = wide.sort_values(keys, kind='stable').reset_index(drop=True)[keys + test_codes]
+    labels = dict(_test_labels(rows, layout), **pivot['labels'])
+    return _save_pivot(wide, labels, layout, path, index_path)
+
+
+def describe_findings_pivot(filename: str, pivot: Dict[str, Any]) -> str:
+    """Table description of the wide view for LLM prompts"""
+    return (f"Wide view of {filename}, {pivot['rows']} rows: one row per "
+            f"{'/'.join(pivot['keys'])}, one column per {pivot['test_code']} "
+            f"holding the mean {pivot['value']}")
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Background job queue for long-running query and visualization requests
+"""
+
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+
+class QueueFullError(Exception):
+    """Raised when the queue already holds its maximum number of pending jobs"""
+
+
+class JobQueue:
+    """Runs jobs on a bounded thread pool and tracks their status per owner
+
+    Each job records a list of status events (``queued``, ``running``,
+    ``progress``, ``done``, ``failed``) that clients can poll or stream.
+    Finished jobs are kept for ``result_ttl`` seconds, then purged.
+    """
+
+    def __init__(self, max_workers: int = 4, max_pending: int = 64, result_ttl: int = 600):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.result_ttl = result_ttl
+        self._executor = None
+        self._jobs = {}
+        self._condition = threading.Condition()
+
+    def configure(self, max_workers: int = None, max_pending: int = None, result_ttl: int = None):
+        with self._condition:
+            if max_workers is not None and max_workers != self.max_workers:
+                self.max_workers = max_workers
+                if self._executor is not None:
+                    self._executor.shutdown(wait=False)
+                    self._executor = None
+            if max_pending is not None:
+                self.max_pending = max_pending
+            if result_ttl is not None:
+                self.result_ttl = result_ttl
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.max_workers, thread_name_prefix='sigmatic-job'
+            )
+        return self._executor
+
+    def submit(self, owner: str, kind: str, func: Callable[..., Dict[str, Any]], *args) -> str:
+        """Queue ``func(*args, progress=callback)`` and return the job id
+
+        ``func`` receives a ``progress(stage, **data)`` callback it may call
+        to report intermediate events.
+        """
+        with self._condition:
+            self._purge_expired()
+            pending = sum(1 for job in self._jobs.values() if job['status'] in ('queued', 'running'))
+            if pending >= self.max_pending:
+                raise QueueFullError('Server is busy, please try again shortly')
+
+            job_id = uuid.uuid4().hex
+            self._jobs[job_id] = {
+                'id': job_id,
+                'owner': owner,
+                'kind': kind,
+                'status': 'queued',
+                'events': [],
+                'result': None,
+                'created_at': time.time(),
+                'finished_at': None
+            }
+            self._add_event(job_id, 'queued')
+            self._get_executor().submit(self._run, job_id, func, args)
+        return job_id
+
+    def _run(self, job_id: str, func: Callable, args: tuple):
+        def progress(stage: str, **data):
+            with self._condition:
+                self._add_event(job_id, stage, **data)
+
+        with self._condition:
+            self._jobs[job_id]['status'] = 'running'
+            self._add_event(job_id, 'running')
+
+        try:
+            result = func(*args, progress=progress)
+            status = 'done'
+        except Exception as e:
+            print(f"Job {job_id} failed: {str(e)}")
+            result = {'success': False, 'error': f'Error processing request: {str(e)}'}
+            status = 'failed'
+
+        with self._condition:
+            job = self._jobs[job_id]
+            job['result'] = result
+            job['status'] = status
+            job['finished_at'] = time.time()
+            self._add_event(job_id, status)
+
+    def _add_event(self, job_id: str, stage: str, **data):
+        """Append an event and wake up streaming clients (caller holds the lock)"""
+        event = {'stage': stage, 'time': time.time()}
+        event.update(data)
+        self._jobs[job_id]['events'].append(event)
+        self._condition.notify_all()
+
+    def _purge_expired(self):
+        now = time.time()
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job['finished_at'] is not None and now - job['finished_at'] >= self.result_ttl
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    def get(self, job_id: str, owner: str) -> Optional[Dict[str, Any]]:
+        """Return a snapshot of a job, or None if unknown or not the owner's"""
+        with self._condition:
+            job = self._jobs.get(job_id)
+            if job is None or job['owner'] != owner:
+                return None
+            return self._snapshot(job)
+
+    def _snapshot(self, job: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            'job_id': job['id'],
+            'kind': job['kind'],
+            'status': job['status'],
+            'events': list(job['events']),
+            'result': job['result']
+        }
+
+    def wait_for_events(self, job_id: str, owner: str, seen: int,
+                        timeout: float = 15.0) -> Optional[List[Dict[str, Any]]]:
+        """Block until the job has more than ``seen`` events or ``timeout`` passes
+
+        Returns the new events (possibly empty on timeout), or None if the
+        job is unknown or belongs to someone else.
+        """
+        with self._condition:
+            job = self._jobs.get(job_id)
+            if job is None or job['owner'] != owner:
+                return None
+            self._condition.wait_for(lambda: len(job['events']) > seen, timeout=timeout)
+            return list(job['events'][seen:])
+
+    def is_finished(self, job_id: str) -> bool:
+        with self._condition:
+            job = self._jobs.get(job_id)
+            return job is None or job['finished_at'] is not None
+
+
+job_queue = JobQueue()
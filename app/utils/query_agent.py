@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""
+PandasAI agent that reports its intermediate steps
+"""
+
+from typing import Callable, List
+
+import pandas as pd
+from pandasai import Agent
+
+from app.utils.code_executor import LazyTables, exclusive_pyplot
+
+
+class QueryAgent(Agent):
+    """PandasAI Agent emitting progress events around code generation and execution
+
+    ``progress(stage, **data)`` is called with ``generating_code``,
+    ``code_generated`` (with the code) and ``executing_code``; retries
+    after a failed execution report ``executing_code`` again. Generated
+    code runs under ``exclusive_pyplot``.
+
+    When ``tables`` is given, ``dfs`` only describe the schemas shown to
+    the LLM and generated SQL runs against ``tables``, which loads each
+    table the first time the SQL references it.
+    """
+
+    def __init__(self, dfs: List, progress: Callable[..., None] = None,
+                 tables: LazyTables = None, **kwargs):
+        super().__init__(dfs, **kwargs)
+        self._progress = progress
+        self._tables = tables
+
+    def _emit(self, stage: str, **data):
+        if self._progress:
+            self._progress(stage, **data)
+
+    def generate_code(self, query):
+        self._emit('generating_code')
+        code = super().generate_code(query)
+        self._emit('code_generated', code=code)
+        return code
+
+    def execute_code(self, code: str) -> dict:
+        self._emit('executing_code')
+        # Code generation runs in parallel across jobs; execution one at a time
+        with exclusive_pyplot():
+            return super().execute_code(code)
+
+    def _execute_sql_query(self, query: str) -> pd.DataFrame:
+        if self._tables is None:
+            return super()._execute_sql_query(query)
+        return self._tables.execute_sql_query(query)
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+Cache of natural-language query results keyed by query, dataset and model
+"""
+
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional
+
+
+def normalize_query(query: str) -> str:
+    """Normalize a question so trivial rephrasings share a cache entry"""
+    query = re.sub(r'\s+', ' ', query.strip().lower())
+    return query.rstrip('?.! ')
+
+
+class QueryResultCache:
+    """Two-tier TTL cache of converted query results
+
+    The memory tier is an LRU bounded by ``max_entries``; the disk tier
+    keeps one JSON file per key under ``cache_dir`` so results survive
+    restarts and are shared between worker processes. It is pruned to
+    ``max_disk_entries``, oldest first.
+    """
+
+    def __init__(self, cache_dir: str = None, ttl: int = 24 * 3600,
+                 max_entries: int = 500, max_disk_entries: int = 5000):
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries
+        self._entries = OrderedDict()  # key -> (created_at, value)
+        self._lock = threading.RLock()
+        self._disk_writes = 0
+
+    def configure(self, cache_dir: str = None, ttl: int = None,
+                  max_entries: int = None, max_disk_entries: int = None):
+        with self._lock:
+            if cache_dir is not None:
+                self.cache_dir = cache_dir
+                os.makedirs(cache_dir, exist_ok=True)
+            if ttl is not None:
+                self.ttl = ttl
+            if max_entries is not None:
+                self.max_entries = max_entries
+            if max_disk_entries is not None:
+                self.max_disk_entries = max_disk_entries
+
+    def make_key(self, query: str, dataset_hashes: Iterable[str], model: str) -> str:
+        """Build a key from the normalized query, dataset content and model"""
+        payload = json.dumps([normalize_query(query), list(dataset_hashes), model])
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return a live cached value, promoting disk hits into memory"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if now - entry[0] < self.ttl:
+                    self._entries.move_to_end(key)
+                    return entry[1]
+                del self._entries[key]
+
+        entry = self._read_disk(key)
+        if entry is None:
+            return None
+        created_at, value = entry
+        if now - created_at >= self.ttl:
+            self._remove_disk(key)
+            return None
+        self._remember(key, created_at, value)
+        return value
+
+    def set(self, key: str, value: Dict[str, Any]):
+        created_at = time.time()
+        self._remember(key, created_at, value)
+        self._write_disk(key, created_at, value)
+
+    def invalidate(self, key: str):
+        with self._lock:
+            self._entries.pop(key, None)
+        self._remove_disk(key)
+
+    def _remember(self, key: str, created_at: float, value: Dict[str, Any]):
+        with self._lock:
+            self._entries[key] = (created_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _disk_path(self, key: str) -> Optional[str]:
+        if not self.cache_dir:
+            return None
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def _read_disk(self, key: str):
+        path = self._disk_path(key)
+        if not path:
+            return None
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                stored = json.load(f)
+            return stored['created_at'], stored['value']
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def _write_disk(self, key: str, created_at: float, value: Dict[str, Any]):
+        path = self._disk_path(key)
+        if not path:
+            return
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'created_at': created_at, 'value': value}, f, default=str)
+            os.replace(tmp_path, path)
+        except (OSError, TypeError, ValueError) as e:
+            print(f"Could not persist query cache entry: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+
+        self._disk_writes += 1
+        if self._disk_writes % 50 == 0:
+            self._prune_disk()
+
+    def _remove_disk(self, key: str):
+        path = self._disk_path(key)
+        if path and os.path.exists(path):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def _prune_disk(self):
+        """Drop expired files and the oldest ones beyond max_disk_entries"""
+        now = time.time()
+        files = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith('.json'):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                mtime = os.path.getmtime(path)
+            except OSError:
+                continue
+            if now - mtime >= self.ttl:
+                os.remove(path)
+            else:
+                files.append((mtime, path))
+
+        files.sort()
+        for _, path in files[:max(0, len(files) - self.max_disk_entries)]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+query_cache = QueryResultCache()
+# PandasAI-generated code keyed by query and schema fingerprint
+generated_code_cache = QueryResultCache()
+# Rendered charts keyed by dataset, resolved columns, chart type and options
+chart_cache = QueryResultCache()
@@ -1,11 +1,28 @@
 import pandas as pd
-import json
 from typing import Dict, List, Any, Optional
 from flask import current_app
 import pandasai as pai
+from pandasai.helpers.path import get_table_name_from_path
+from pandasai.core.response.error import ErrorResponse
 from pandasai_litellm.litellm import LiteLLM
 import matplotlib
 matplotlib.use('Agg')  # Use non-interactive backend to avoid GUI issues
+from plotly.basedatatypes import BaseFigure
+from app.utils.columnar_store import load_file_dataframe, load_file_schema
+from app.utils.query_cache import query_cache, generated_code_cache
+from app.utils.code_executor import (LazyTables, exclusive_pyplot, execute_generated_code,
+                                     generated_code_entry, pandasai_lock, schema_fingerprint,
+                                     verify_generated_code)
+from app.utils.query_agent import QueryAgent
+from app.utils.dataset_profile import describe_column, load_profile
+from app.utils.findings_pivot import describe_findings_pivot
+from app.utils.chart_artifacts import (CHART_DIRECTORY, chart_asset_url, chart_filename, chart_retention,
+                                      keep_chart)
+from app.utils.raw_json import RawJSON, figure_json
+import os
+import re
+import time
+from functools import partial
 
 class QueryProcessor:
     def __init__(self):
@@ -22,25 +39,42 @@ class QueryProcessor:
                 pass
         return self.openai_api_key
     
+    def _get_model_name(self):
+        """Get the LLM model name from current app context"""
+        try:
+            return current_app.config.get('OPENAI_MODEL', 'gpt-4o-mini')
+        except RuntimeError:
+            return 'gpt-4o-mini'
+    
     def _configure_pandasai(self):
-        """Configure PandasAI with LiteLLM"""
-        if not self.pandas_ai_configured:
-            api_key = self._get_openai_key()
-            if api_key:
-                try:
-                    llm = LiteLLM(model="gpt-4o-mini", api_key=api_key)
-                    pai.config.set({"llm": llm})
-                    self.pandas_ai_configured = True
-                    print("PandasAI configured successfully with LiteLLM")
-                except Exception as e:
-                    print(f"Failed to configure PandasAI with LiteLLM: {str(e)}")
-                    return False
-        return self.pandas_ai_configured
+        """Configure PandasAI with LiteLLM
+        
+        pai.config is process-global, so jobs running in parallel set it
+        under the shared PandasAI lock.
+        """
+        with pandasai_lock:
+            if not self.pandas_ai_configured:
+                api_key = self._get_openai_key()
+                if api_key:
+                    try:
+                        llm = LiteLLM(model=self._get_model_name(), api_key=api_key)
+                        pai.config.set({"llm": llm})
+                        self.pandas_ai_configured = True
+                        print("PandasAI configured successfully with LiteLLM")
+                    except Exception as e:
+                        print(f"Failed to configure PandasAI with LiteLLM: {str(e)}")
+                        return False
+            return self.pandas_ai_configured
     
-    def process_query(self, query: str, session_data: Dict) -> Dict[str, Any]:
+    def process_query(self, query: str, session_data: Dict, progress=None) -> Dict[str, Any]:
         """
         Process a natural language query using PandasAI and return results
+        
+        ``progress(stage, **data)``, when given, is called as the query moves
+        through data loading, code generation, execution and report writing.
         """
+        progress = progress or (lambda stage, **data: None)
+        
         # Check if files are uploaded
         if 'uploaded_files' not in session_data or not session_data['uploaded_files']:
             return {
@@ -48,6 +82,17 @@ class QueryProcessor:
                 'error': 'No data uploaded. Please upload CSV files first.'
             }
         
+        # Serve repeated questions against the same data without an LLM call
+        cache_key = query_cache.make_key(
+            query, self._dataset_fingerprint(session_data), self._get_model_name()
+        )
+        cached = self._get_cached_result(cache_key)
+        if cached is not None:
+            print(f"Query cache hit for: '{query}'")
+            progress('result_ready', cached=True)
+            self._stream_report(cached.get('report', ''), progress)
+            return cached
+        
         # Check if OpenAI is available
         if not self._get_openai_key():
             return {
@@ -64,18 +109,30 @@ class QueryProcessor:
                 }
             
             # Process query with PandasAI using the new pattern
-            result = self._process_with_pandasai_new(query, session_data)
+            result, code, code_cached = self._process_with_pandasai_new(query, session_data, progress)
+            progress('result_ready', result_type=result.get('type'))
             
             # Generate natural language report
             report = self._generate_report(query, result)
+            self._stream_report(report, progress)
             
-            return {
+            response = {
                 'success': True,
                 'result': result,
                 'report': report,
-                'pandas_code': 'Generated by PandasAI'  # PandasAI handles code generation internally
+                'pandas_code': code or 'Generated by PandasAI',
+                'code_cached': code_cached
             }
             
+            if result.get('type') != 'error':
+                query_cache.set(cache_key, response)
+                chart = result.get('chart')
+                if isinstance(chart, dict) and chart.get('image_path'):
+                    # Chart pruning spares the image while the cached answer points at it
+                    keep_chart(chart['image_path'], time.time() + query_cache.ttl)
+            
+            return response
+            
         except Exception as e:
             print(f"Error in process_query: {str(e)}")
             return {
@@ -83,27 +140,98 @@ class QueryProcessor:
                 'error': f'Error processing query: {str(e)}'
             }
     
-    def _process_with_pandasai_new(self, query: str, session_data: Dict) -> Dict[str, Any]:
-        """Process query using PandasAI with the new pattern"""
+    def _stream_report(self, report: str, progress):
+        """Emit the report sentence by sentence as ``report_chunk`` events"""
+        for chunk in re.split(r'(?<=[.!?])\s+', report):
+            if chunk:
+                progress('report_chunk', text=chunk)
+    
+    def _dataset_fingerprint(self, session_data: Dict) -> List[str]:
+        """Names and content hashes of the datasets a query runs against"""
+        return [
+            f"{file_info['filename']}:{file_info.get('content_hash') or file_info['file_path']}"
+            for file_info in session_data['uploaded_files']
+        ]
+    
+    def _get_cached_result(self, cache_key: str) -> Optional[Dict[str, Any]]:
+        """Return a cached response unless it points at a deleted chart image"""
+        cached = query_cache.get(cache_key)
+        if cached is None:
+            return None
+        
+        chart = cached.get('result', {}).get('chart') or {}
+        image_path = chart.get('image_path') if isinstance(chart, dict) else None
+        if image_path and not os.path.exists(os.path.join(CHART_DIRECTORY, image_path)):
+            query_cache.invalidate(cache_key)
+            return None
+        
+        if isinstance(chart, dict) and chart.get('chart_type') == 'plotly' and isinstance(chart.get('data'), str):
+            # The disk tier stores the serialized figure as a string; embed it verbatim again
+            cached = dict(cached, result=dict(cached['result'], chart=dict(chart, data=RawJSON(chart['data']))))
+        return dict(cached, cached=True)
+    
+    def _process_with_pandasai_new(self, query: str, session_data: Dict, progress=None):
+        """Process query using PandasAI with the new pattern
+        
+        Returns (result, generated code, whether the code came from the
+        generated-code cache rather than the LLM).
+        """
         
         try:
-            # Get the first uploaded file
-            file_info = session_data['uploaded_files'][0]
-            file_path = file_info['file_path']
-            
-            print(f"Processing query: '{query}' with file: {file_path}")
+            files = session_data['uploaded_files']
+            print(f"Processing query: '{query}' with files: {[f['filename'] for f in files]}")
             
-            # Use PandasAI's read_csv function
-            df = pai.read_csv(file_path)
-            print("Successfully loaded CSV with PandasAI")
+            # Only schemas are read up front; each table's data is loaded the
+            # first time generated SQL references it. Table names follow the
+            # upload names so generated SQL is reusable across studies.
+            schemas, loaders, details = self._session_tables(files)
+            tables = LazyTables(loaders, progress)
             
-            preprompt = "You are an expert in clinical trial data analysis. Given this input,  "
-            # Process the query using chat
-            response = df.chat(preprompt + query)
-            print(f"PandasAI response type: {type(response)}")
-            
-            # Convert response to serializable format
-            return self._convert_pandasai_response(response)
+            try:
+                # Equivalent question against the same schemas: re-run its code locally
+                fingerprint = schema_fingerprint(schemas)
+                secret = current_app.config['SECRET_KEY']
+                code_key = generated_code_cache.make_key(query, [fingerprint], self._get_model_name())
+                cached_code = generated_code_cache.get(code_key)
+                if cached_code is not None:
+                    try:
+                        # Checked before anything runs: signed by this app, same schema
+                        code = verify_generated_code(cached_code, fingerprint, secret)
+                        if progress:
+                            progress('code_generated', code=code, cached=True)
+                            progress('executing_code')
+                        response = execute_generated_code(code, tables)
+                        print("Re-executed cached generated code")
+                        return self._convert_pandasai_response(response), response.last_code_executed, True
+                    except Exception as e:
+                        print(f"Cached code failed, falling back to LLM: {str(e)}")
+                        generated_code_cache.invalidate(code_key)
+                
+                dfs = []
+                for table_name, schema_df in schemas.items():
+                    df = pai.DataFrame(schema_df, _table_name=table_name)
+                    df.schema.description, column_descriptions = details[table_name]
+                    self._describe_columns(df, column_descriptions)
+                    dfs.append(df)
+                print(f"Prepared {len(dfs)} table schema(s) for PandasAI")
+                
+                preprompt = "You are an expert in clinical trial data analysis. Given this input,  "
+                if len(files) > 1:
+                    preprompt += "join the SDTM domain tables on USUBJID where needed. "
+                if any(file_info.get('findings_pivot') for file_info in files):
+                    preprompt += "Use the _wide tables to compare findings tests side by side. "
+                # Process the query through an agent that reports its steps
+                response = QueryAgent(dfs, progress=progress, tables=tables).chat(preprompt + query)
+                print(f"PandasAI response type: {type(response)}")
+                
+                code = getattr(response, 'last_code_executed', None)
+                if code and not isinstance(response, ErrorResponse):
+                    generated_code_cache.set(code_key, generated_code_entry(code, fingerprint, secret))
+                
+                # Convert response to serializable format
+                return self._convert_pandasai_response(response), code, False
+            finally:
+                tables.close()
             
         except Exception as e:
             print(f"PandasAI new pattern failed: {str(e)}")
@@ -111,31 +239,32 @@ class QueryProcessor:
             try:
                 print("Trying fallback with pandas DataFrame...")
                 
-                # Load with pandas and convert to PandasAI DataFrame
-                file_info = session_data['uploaded_files'][0]
-                file_path = file_info['file_path']
-                
-                # Load with pandas first
-                pandas_df = pd.read_csv(file_path)
-                print(f"Loaded pandas DataFrame with shape: {pandas_df.shape}")
-                
-                # Clean the dataframe
-                pandas_df.columns = [str(col).strip().replace(' ', '_').replace('-', '_') for col in pandas_df.columns]
-                pandas_df = pandas_df.dropna(how='all').dropna(axis=1, how='all')
-                
-                if len(pandas_df) == 0:
-                    raise Exception("No valid data in the dataframe")
-                
-                # Convert to PandasAI DataFrame
-                df = pai.DataFrame(pandas_df)
+                # Load each upload with pandas and convert to PandasAI DataFrames
+                dfs = []
+                for file_info in session_data['uploaded_files']:
+                    # Copy the cached frame since the cleaning below renames columns
+                    pandas_df = load_file_dataframe(file_info).copy()
+                    print(f"Loaded pandas DataFrame with shape: {pandas_df.shape}")
+                    
+                    # Clean the dataframe
+                    pandas_df.columns = [str(col).strip().replace(' ', '_').replace('-', '_') for col in pandas_df.columns]
+                    pandas_df = pandas_df.dropna(how='all').dropna(axis=1, how='all')
+                    
+                    if len(pandas_df) == 0:
+                        raise Exception(f"No valid data in {file_info['filename']}")
+                    
+                    dfs.append(pai.DataFrame(
+                        pandas_df, _table_name=get_table_name_from_path(file_info['filename'])
+                    ))
                 print("Successfully converted to PandasAI DataFrame")
                 
-                # Process the query
-                response = df.chat(query)
+                # Process the query; pai.chat generates and runs code in one call
+                with exclusive_pyplot():
+                    response = pai.chat(query, *dfs)
                 print(f"Fallback response type: {type(response)}")
                 print("Debugging response: ", response.value)
                 
-                return self._convert_pandasai_response(response)
+                return self._convert_pandasai_response(response), getattr(response, 'last_code_executed', None), False
                 
             except Exception as e2:
                 print(f"Fallback also failed: {str(e2)}")
@@ -143,7 +272,55 @@ class QueryProcessor:
                 return {
                     'type': 'error',
                     'data': f"PandasAI processing failed. Please try rephrasing your query. Error: {str(e2)}"
-                }
+                }, None, False
+    
+    def _describe_columns(self, df, column_descriptions: Dict[str, str]):
+        """Give the LLM value ranges and typical values from the upload profile"""
+        for column in df.schema.columns:
+            if column_descriptions.get(column.name):
+                column.description = column_descriptions[column.name]
+    
+    def _session_tables(self, files: List[Dict]):
+        """Schema frames, lazy data loaders and descriptions keyed by PandasAI table name
+        
+        Findings domains add a second table with their precomputed wide view.
+        """
+        schemas = {}
+        loaders = {}
+        details = {}
+        
+        def add_table(base_name, source, schema_df, description, column_descriptions):
+            table_name = base_name
+            suffix = 2
+            while table_name in schemas:
+                table_name = f"{base_name}_{suffix}"
+                suffix += 1
+            schemas[table_name] = schema_df
+            loaders[table_name] = partial(load_file_dataframe, source)
+            details[table_name] = (description, column_descriptions)
+        
+        for file_info in files:
+            schema_df = load_file_schema(file_info)
+            if schema_df is None:
+                raise FileNotFoundError(file_info['file_path'])
+            
+            description = f"{file_info['filename']}, {file_info['rows']} rows"
+            if file_info.get('subject_key'):
+                description += f", {file_info['subject_count']} subjects keyed by {file_info['subject_key']}"
+            profile = load_profile(file_info)
+            column_descriptions = {
+                column: describe_column(column_profile)
+                for column, column_profile in (profile['columns'] if profile else {}).items()
+            }
+            table_name = get_table_name_from_path(file_info['filename'])
+            add_table(table_name, file_info, schema_df, description, column_descriptions)
+            
+            pivot = file_info.get('findings_pivot')
+            pivot_schema = load_file_schema(pivot) if pivot else None
+            if pivot_schema is not None:
+                add_table(f"{table_name}_wide", pivot, pivot_schema,
+                          describe_findings_pivot(file_info['filename'], pivot), pivot['labels'])
+        return schemas, loaders, details
     
     def _convert_pandasai_response(self, response) -> Dict[str, Any]:
         """Convert PandasAI response to serializable format"""
@@ -219,39 +396,30 @@ class QueryProcessor:
                 print("Processing PandasAI chart response")
                 chart_value = response.value
                 
-                # Check if PandasAI generated a PNG file
-                import os
-                import glob
-                
-                # Look for the most recent PNG file in exports/charts/
-                chart_dir = "exports/charts"
-                if os.path.exists(chart_dir):
-                    png_files = glob.glob(os.path.join(chart_dir, "*.png"))
-                    if png_files:
-                        # Get the most recent PNG file
-                        latest_png = max(png_files, key=os.path.getctime)
-                        print(f"Found chart PNG: {latest_png}")
-                        
-                        # Return just the filename for the PNG file
-                        filename = os.path.basename(latest_png)
-                        print(f"Returning PNG chart filename: {filename}")
-                        return {
-                            'type': 'chart',
-                            'chart': {
-                                'image_path': filename,
-                                'chart_type': 'png'
-                            },
-                            'chart_type': 'png'
-                        }
+                # The response value is the PNG path this query's code saved to
+                filename = chart_filename(chart_value)
+                if filename:
+                    print(f"Returning PNG chart filename: {filename}")
+                    chart_retention.maybe_prune()
+                    chart = {
+                        'image_path': filename,
+                        'image_url': chart_asset_url(filename),
+                        'chart_type': 'png'
+                    }
+                    return {
+                        'type': 'chart',
+                        'chart': chart,
+                        'chart_type': 'png',
+                        # What the dashboard pins instead of the chart itself
+                        'spec': dict(chart, kind='image')
+                    }
                 
-                # Fallback: try to handle as Plotly figure
-                if hasattr(chart_value, 'to_json'):
-                    # It's a Plotly figure
-                    chart_json = json.loads(chart_value.to_json())
+                # Fallback: a Plotly figure, serialized once like /visualize charts
+                if isinstance(chart_value, BaseFigure):
                     return {
                         'type': 'chart',
                         'chart': {
-                            'data': chart_json,
+                            'data': figure_json(chart_value),
                             'chart_type': 'plotly'
                         },
                         'chart_type': 'plotly'
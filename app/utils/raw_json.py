@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+JSON encoding that embeds already-serialized fragments (e.g. Plotly figures) verbatim
+"""
+
+import json
+import uuid
+from typing import Any, Dict
+
+from flask.json.provider import DefaultJSONProvider
+
+
+class RawJSON(str):
+    """A string of valid JSON to be embedded as-is rather than re-encoded"""
+
+
+def figure_json(fig: Any) -> RawJSON:
+    """Serialize a Plotly figure once; responses embed this JSON verbatim"""
+    # Traces were validated when the figure was built; uses orjson when installed
+    return RawJSON(fig.to_json(validate=False))
+
+
+def _extract_fragments(obj: Any, fragments: Dict[str, RawJSON], nonce: str) -> Any:
+    """Copy containers, swapping RawJSON values for unique placeholder strings"""
+    if isinstance(obj, RawJSON):
+        token = f"__raw_json_{nonce}_{len(fragments)}__"
+        fragments[token] = obj
+        return token
+    if isinstance(obj, dict):
+        return {key: _extract_fragments(value, fragments, nonce) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_extract_fragments(value, fragments, nonce) for value in obj]
+    return obj
+
+
+def splice_fragments(text: str, fragments: Dict[str, RawJSON]) -> str:
+    for token, fragment in fragments.items():
+        text = text.replace(f'"{token}"', fragment, 1)
+    return text
+
+
+def dumps(obj: Any, **kwargs) -> str:
+    """json.dumps that writes RawJSON values verbatim (no parse/re-encode)"""
+    fragments = {}
+    obj = _extract_fragments(obj, fragments, uuid.uuid4().hex)
+    return splice_fragments(json.dumps(obj, **kwargs), fragments)
+
+
+class RawJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider so jsonify embeds RawJSON fragments directly"""
+
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        fragments = {}
+        obj = _extract_fragments(obj, fragments, uuid.uuid4().hex)
+        return splice_fragments(super().dumps(obj, **kwargs), fragments)
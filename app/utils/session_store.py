@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+"""
+Server-side session storage: the cookie carries only a signed session id
+"""
+
+import os
+import secrets
+import sqlite3
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from flask.sessions import SecureCookieSession, SessionInterface
+from flask.json.tag import TaggedJSONSerializer
+from itsdangerous import BadSignature, Signer
+
+# Same serializer Flask uses for cookie sessions, so tuples, bytes,
+# datetimes and Markup survive the round trip unchanged
+serializer = TaggedJSONSerializer()
+
+
+class SessionStore(ABC):
+    """Interface for server-side session backends
+
+    Backends map a session id to a serialized payload with an absolute
+    expiry timestamp. Anything offering get/set/delete with TTLs (for
+    example a Redis client) can implement it; a backend missing one of
+    the methods fails when it is constructed.
+    """
+
+    @abstractmethod
+    def load(self, sid: str) -> Optional[Tuple[Dict[str, Any], float]]:
+        """Return (data, expires_at) for a live session, or None"""
+
+    @abstractmethod
+    def save(self, sid: str, data: Dict[str, Any], expires_at: float):
+        """Create or replace a session"""
+
+    @abstractmethod
+    def touch(self, sid: str, expires_at: float):
+        """Extend a session's expiry without rewriting its data"""
+
+    @abstractmethod
+    def delete(self, sid: str):
+        """Remove a session"""
+
+    @abstractmethod
+    def cleanup(self) -> List[str]:
+        """Purge expired sessions, returning their ids"""
+
+
+class SQLiteSessionStore(SessionStore):
+    """Sessions in a single SQLite table, safe across gunicorn workers"""
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS sessions ('
+                'sid TEXT PRIMARY KEY, data TEXT NOT NULL, expires_at REAL NOT NULL)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS sessions_expiry ON sessions (expires_at)')
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.db_path, timeout=10)
+
+    def load(self, sid):
+        with self._connect() as conn:
+            row = conn.execute(
+                'SELECT data, expires_at FROM sessions WHERE sid = ? AND expires_at > ?',
+                (sid, time.time())
+            ).fetchone()
+        if row is None:
+            return None
+        return serializer.loads(row[0]), row[1]
+
+    def save(self, sid, data, expires_at):
+        with self._connect() as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO sessions (sid, data, expires_at) VALUES (?, ?, ?)',
+                (sid, serializer.dumps(data), expires_at)
+            )
+
+    def touch(self, sid, expires_at):
+        with self._connect() as conn:
+            conn.execute('UPDATE sessions SET expires_at = ? WHERE sid = ?', (expires_at, sid))
+
+    def delete(self, sid):
+        with self._connect() as conn:
+            conn.execute('DELETE FROM sessions WHERE sid = ?', (sid,))
+
+    def cleanup(self):
+        now = time.time()
+        with self._connect() as conn:
+            expired = [row[0] for row in conn.execute(
+                'SELECT sid FROM sessions WHERE expires_at <= ?', (now,)
+            )]
+            conn.execute('DELETE FROM sessions WHERE expires_at <= ?', (now,))
+        return expired
+
+
+class FileSystemSessionStore(SessionStore):
+    """One file per session; the file mtime records the expiry"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, sid: str) -> str:
+        return os.path.join(self.directory, sid)
+
+    def load(self, sid):
+        path = self._path(sid)
+        try:
+            expires_at = os.path.getmtime(path)
+            if expires_at <= time.time():
+                return None
+            with open(path, 'r', encoding='utf-8') as f:
+                return serializer.loads(f.read()), expires_at
+        except (OSError, ValueError):
+            return None
+
+    def save(self, sid, data, expires_at):
+        path = self._path(sid)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(serializer.dumps(data))
+        os.utime(tmp_path, (expires_at, expires_at))
+        os.replace(tmp_path, path)
+
+    def touch(self, sid, expires_at):
+        try:
+            os.utime(self._path(sid), (expires_at, expires_at))
+        except OSError:
+            pass
+
+    def delete(self, sid):
+        try:
+            os.remove(self._path(sid))
+        except OSError:
+            pass
+
+    def cleanup(self):
+        now = time.time()
+        expired = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.tmp'):
+                continue
+            path = self._path(name)
+            try:
+                if os.path.getmtime(path) <= now:
+                    os.remove(path)
+                    expired.append(name)
+            except OSError:
+                pass
+        return expired
+
+
+class ServerSideSession(SecureCookieSession):
+    """Session dict tracking its id and whether it came from the store"""
+
+    def __init__(self, initial=None, sid: str = None, new: bool = False,
+                 expires_at: float = None):
+        super().__init__(initial)
+        self.sid = sid
+        self.new = new
+        self.expires_at = expires_at
+
+
+class ServerSideSessionInterface(SessionInterface):
+    """Flask session interface persisting session data in a SessionStore"""
+
+    salt = 'sigmatic-session-id'
+    # Purge expired sessions roughly once per this many session writes
+    cleanup_interval = 100
+
+    def __init__(self, store: SessionStore, on_expire: Callable[[str], None] = None):
+        self.store = store
+        self.on_expire = on_expire
+        self._writes = 0
+
+    def _signer(self, app) -> Optional[Signer]:
+        if not app.secret_key:
+            return None
+        return Signer(app.secret_key, salt=self.salt)
+
+    def _lifetime(self, app) -> float:
+        return app.permanent_session_lifetime.total_seconds()
+
+    def _cleanup(self):
+        """Purge expired sessions and let the app release what they held"""
+        for sid in self.store.cleanup():
+            if self.on_expire:
+                try:
+                    self.on_expire(sid)
+                except Exception as e:
+                    print(f"Error releasing expired session {sid}: {e}")
+
+    def open_session(self, app, request):
+        signer = self._signer(app)
+        if signer is None:
+            return None
+
+        cookie = request.cookies.get(self.get_cookie_name(app))
+        if cookie:
+            try:
+                sid = signer.unsign(cookie).decode('utf-8')
+            except BadSignature:
+                sid = None
+            if sid:
+                stored = self.store.load(sid)
+                if stored is not None:
+                    data, expires_at = stored
+                    return ServerSideSession(data, sid=sid, expires_at=expires_at)
+
+        return ServerSideSession(sid=secrets.token_urlsafe(32), new=True)
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        secure = self.get_cookie_secure(app)
+        samesite = self.get_cookie_samesite(app)
+        httponly = self.get_cookie_httponly(app)
+
+        if session.accessed:
+            response.vary.add('Cookie')
+
+        # Emptied sessions are removed from the store along with the cookie
+        if not session:
+            if session.modified:
+                if not session.new:
+                    self.store.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path, secure=secure,
+                                       samesite=samesite, httponly=httponly)
+                response.vary.add('Cookie')
+            return
+
+        now = time.time()
+        lifetime = self._lifetime(app)
+        if session.modified or session.new:
+            self.store.save(session.sid, dict(session), now + lifetime)
+            self._writes += 1
+            if self._writes % self.cleanup_interval == 0:
+                self._cleanup()
+        elif session.expires_at is not None and session.expires_at - now < lifetime / 2:
+            # Sliding expiry for read-only requests, refreshed at most twice per lifetime
+            self.store.touch(session.sid, now + lifetime)
+        else:
+            return
+
+        if session.new or self.should_set_cookie(app, session):
+            response.set_cookie(
+                name,
+                self._signer(app).sign(session.sid).decode('utf-8'),
+                expires=self.get_expiration_time(app, session),
+                httponly=httponly,
+                domain=domain,
+                path=path,
+                secure=secure,
+                samesite=samesite,
+            )
+            response.vary.add('Cookie')
+
+
+def create_session_store(config) -> SessionStore:
+    """Build the session backend selected by SESSION_BACKEND"""
+    backend = config.get('SESSION_BACKEND', 'sqlite')
+    if backend == 'sqlite':
+        return SQLiteSessionStore(config['SESSION_SQLITE_PATH'])
+    if backend == 'filesystem':
+        return FileSystemSessionStore(config['SESSION_FILE_DIR'])
+    raise ValueError(f"Unknown SESSION_BACKEND: {backend}")
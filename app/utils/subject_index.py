@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Persistent subject index (subject -> row offsets) for SDTM domain uploads
+"""
+
+import os
+from functools import lru_cache
+from typing import Dict, Iterable, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+# Subject key columns in order of preference; USUBJID is unique across studies
+SUBJECT_KEY_CANDIDATES = ('USUBJID', 'SUBJID')
+SUBJECT_INDEX_EXTENSION = '.subjects.npz'
+
+
+def detect_subject_key(column_names: Iterable[str]) -> Optional[str]:
+    """Return the subject key column of a domain, matched case-insensitively"""
+    by_upper = {str(name).upper(): name for name in column_names}
+    for candidate in SUBJECT_KEY_CANDIDATES:
+        if candidate in by_upper:
+            return by_upper[candidate]
+    return None
+
+
+class SubjectIndex:
+    """Row offsets of every subject in one domain file, in CSR layout
+
+    ``subjects`` is sorted; the rows of ``subjects[i]`` are
+    ``rows[indptr[i]:indptr[i + 1]]`` (positions in file order, so they
+    also address column-projected reads of the same file).
+    """
+
+    def __init__(self, key: str, subjects: np.ndarray, indptr: np.ndarray, rows: np.ndarray):
+        self.key = key
+        self.subjects = subjects
+        self.indptr = indptr
+        self.rows = rows
+
+    @classmethod
+    def build(cls, key: str, values: pd.Series) -> 'SubjectIndex':
+        codes, uniques = pd.factorize(values.astype('string'), sort=True)
+        valid = codes >= 0  # missing subject ids are left out of the index
+        order = np.flatnonzero(valid)[np.argsort(codes[valid], kind='stable')]
+        counts = np.bincount(codes[valid], minlength=len(uniques))
+        indptr = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+        subjects = np.asarray(uniques, dtype=str)
+        return cls(key, subjects, indptr, order.astype(np.int64))
+
+    def append(self, values: pd.Series, offset: int) -> 'SubjectIndex':
+        """Index of the file after appending rows with these key values
+
+        ``offset`` is the file's row count before the append; the new rows
+        are numbered from there and follow each subject's earlier rows.
+        """
+        added = SubjectIndex.build(self.key, values)
+        subjects = np.union1d(self.subjects, added.subjects)
+        codes = np.concatenate([
+            np.repeat(np.searchsorted(subjects, self.subjects), np.diff(self.indptr)),
+            np.repeat(np.searchsorted(subjects, added.subjects), np.diff(added.indptr))
+        ])
+        rows = np.concatenate([self.rows, added.rows + offset])
+        order = np.argsort(codes, kind='stable')
+        counts = np.bincount(codes, minlength=len(subjects))
+        indptr = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+        return SubjectIndex(self.key, subjects, indptr, rows[order])
+
+    def save(self, path: str):
+        tmp_path = f"{path}.tmp.npz"
+        np.savez(tmp_path, key=np.array(self.key), subjects=self.subjects,
+                 indptr=self.indptr, rows=self.rows)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> 'SubjectIndex':
+        with np.load(path, allow_pickle=False) as data:
+            return cls(str(data['key']), data['subjects'], data['indptr'], data['rows'])
+
+    def __len__(self) -> int:
+        return len(self.subjects)
+
+    def rows_for(self, subject: str) -> np.ndarray:
+        """Row positions of one subject (empty if unknown)"""
+        i = np.searchsorted(self.subjects, subject)
+        if i == len(self.subjects) or self.subjects[i] != subject:
+            return np.empty(0, dtype=np.int64)
+        return self.rows[self.indptr[i]:self.indptr[i + 1]]
+
+    def join(self, other: 'SubjectIndex') -> Tuple[np.ndarray, np.ndarray]:
+        """Row position pairs of an inner join with another domain on subject"""
+        _, left, right = np.intersect1d(self.subjects, other.subjects,
+                                        assume_unique=True, return_indices=True)
+        left_rows, right_rows = [], []
+        for i, j in zip(left, right):
+            l = self.rows[self.indptr[i]:self.indptr[i + 1]]
+            r = other.rows[other.indptr[j]:other.indptr[j + 1]]
+            left_rows.append(np.repeat(l, len(r)))
+            right_rows.append(np.tile(r, len(l)))
+        if not left_rows:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        return np.concatenate(left_rows), np.concatenate(right_rows)
+
+
+def build_subject_index(values: pd.Series, key: str, path: str) -> SubjectIndex:
+    """Build a domain's subject index from its key column and persist it"""
+    index = SubjectIndex.build(key, values)
+    index.save(path)
+    return index
+
+
+@lru_cache(maxsize=64)
+def _load_cached(path: str, mtime_ns: int) -> SubjectIndex:
+    return SubjectIndex.load(path)
+
+
+def load_subject_index(file_info: Dict) -> Optional[SubjectIndex]:
+    """Return the persisted subject index of an upload, if it has one"""
+    path = file_info.get('subject_index_path')
+    if not path:
+        return None
+    try:
+        return _load_cached(path, os.stat(path).st_mtime_ns)
+    except (OSError, ValueError) as e:
+        print(f"Could not load subject index {path}: {e}")
+        return None
+
+
+def join_on_subject(left_df: pd.DataFrame, left_index: SubjectIndex,
+                    right_df: pd.DataFrame, right_index: SubjectIndex) -> pd.DataFrame:
+    """Inner-join two domain frames on subject via their indexes
+
+    Frames must hold the files' rows in file order (full or
+    column-projected reads). The right frame's key column is dropped.
+    """
+    left_rows, right_rows = left_index.join(right_index)
+    right_df = right_df.drop(columns=[right_index.key], errors='ignore')
+    return pd.concat([
+        left_df.take(left_rows).reset_index(drop=True),
+        right_df.take(right_rows).reset_index(drop=True)
+    ], axis=1)
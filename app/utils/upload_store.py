@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+Content-addressed upload storage with per-session reference counting
+"""
+
+import fcntl
+import glob
+import hashlib
+import json
+import os
+import shutil
+import uuid
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+
+from app.utils.dataframe_cache import dataframe_cache
+
+# Bytes read per iteration while hashing an upload
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+class UploadStore:
+    """Stores each distinct upload once under its SHA-256 content hash
+
+    Blobs live in ``<root>/blobs/<hash>.csv`` and everything derived from
+    them (columnar copy, validation metadata, ...) shares the
+    ``<hash>.*`` prefix. Every session upload holds a reference marker in
+    ``<root>/refs/<hash>/``; when the last marker is released the blob and
+    its derived files are deleted.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        self.blob_dir = os.path.join(root, 'blobs')
+        self.ref_dir = os.path.join(root, 'refs')
+        self.tmp_dir = os.path.join(root, 'tmp')
+        for directory in (self.blob_dir, self.ref_dir, self.tmp_dir):
+            os.makedirs(directory, exist_ok=True)
+
+    @contextmanager
+    def _locked(self):
+        """Serialize blob/ref changes across threads and worker processes"""
+        with open(os.path.join(self.root, '.upload.lock'), 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def blob_path(self, content_hash: str, extension: str = '.csv') -> str:
+        return os.path.join(self.blob_dir, content_hash + extension)
+
+    def add(self, file, session_id: str) -> Dict[str, Any]:
+        """Store an uploaded file and add a reference for the session
+
+        Returns the content hash, the blob path, the reference id and
+        whether identical content was already stored.
+        """
+        tmp_path = os.path.join(self.tmp_dir, uuid.uuid4().hex)
+        digest = hashlib.sha256()
+        with open(tmp_path, 'wb') as out:
+            while True:
+                chunk = file.stream.read(HASH_CHUNK_SIZE)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                out.write(chunk)
+
+        content_hash = digest.hexdigest()
+        file_path = self.blob_path(content_hash)
+        ref_id = f"{session_id}__{uuid.uuid4().hex}"
+
+        with self._locked():
+            existing = os.path.exists(file_path)
+            if existing:
+                os.remove(tmp_path)
+            else:
+                os.replace(tmp_path, file_path)
+            ref_path = os.path.join(self.ref_dir, content_hash)
+            os.makedirs(ref_path, exist_ok=True)
+            open(os.path.join(ref_path, ref_id), 'w').close()
+
+        return {
+            'content_hash': content_hash,
+            'file_path': file_path,
+            'upload_ref': ref_id,
+            'existing': existing
+        }
+
+    def append(self, base_hash: str, file, session_id: str) -> Dict[str, Any]:
+        """Store a blob extended with the data rows of an uploaded CSV
+
+        The combined blob is the base blob followed by the upload minus its
+        header line, addressed by the hash of the base hash and the
+        upload, so hashing never re-reads the base. Returns what ``add``
+        does plus ``rows_path``, a copy of the upload for parsing its rows
+        that the caller deletes, and ``base_hash``.
+        """
+        rows_path = os.path.join(self.tmp_dir, uuid.uuid4().hex)
+        digest = hashlib.sha256()
+        with open(rows_path, 'wb') as out:
+            while True:
+                chunk = file.stream.read(HASH_CHUNK_SIZE)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                out.write(chunk)
+
+        content_hash = hashlib.sha256(f"{base_hash}+{digest.hexdigest()}".encode('utf-8')).hexdigest()
+        file_path = self.blob_path(content_hash)
+        ref_id = f"{session_id}__{uuid.uuid4().hex}"
+
+        # Copy the base outside the lock; only the final rename is serialized
+        tmp_path = None if os.path.exists(file_path) else self._combine(base_hash, rows_path)
+
+        with self._locked():
+            existing = os.path.exists(file_path)
+            if not existing and tmp_path is None:
+                # Released since the check above
+                tmp_path = self._combine(base_hash, rows_path)
+            if tmp_path is not None:
+                if existing:
+                    os.remove(tmp_path)
+                else:
+                    os.replace(tmp_path, file_path)
+            ref_path = os.path.join(self.ref_dir, content_hash)
+            os.makedirs(ref_path, exist_ok=True)
+            open(os.path.join(ref_path, ref_id), 'w').close()
+
+        return {
+            'content_hash': content_hash,
+            'file_path': file_path,
+            'upload_ref': ref_id,
+            'existing': existing,
+            'rows_path': rows_path,
+            'base_hash': base_hash
+        }
+
+    def _combine(self, base_hash: str, rows_path: str) -> str:
+        """Temporary copy of a base blob followed by a CSV's data rows"""
+        tmp_path = os.path.join(self.tmp_dir, uuid.uuid4().hex)
+        with open(self.blob_path(base_hash), 'rb') as base, open(tmp_path, 'wb') as out:
+            shutil.copyfileobj(base, out, HASH_CHUNK_SIZE)
+            if out.tell():
+                base.seek(-1, os.SEEK_END)
+                if base.read(1) != b'\n':
+                    out.write(b'\n')
+            with open(rows_path, 'rb') as rows:
+                rows.readline()  # header
+                shutil.copyfileobj(rows, out, HASH_CHUNK_SIZE)
+        return tmp_path
+
+    def release(self, content_hash: str, ref_id: str) -> bool:
+        """Drop one reference, deleting the blob when none remain
+
+        Returns True when the blob and its derived files were deleted.
+        """
+        ref_path = os.path.join(self.ref_dir, content_hash)
+        with self._locked():
+            try:
+                os.remove(os.path.join(ref_path, ref_id))
+            except OSError:
+                pass
+            if os.path.isdir(ref_path) and os.listdir(ref_path):
+                return False
+            try:
+                os.rmdir(ref_path)
+            except OSError:
+                pass
+            for path in glob.glob(os.path.join(self.blob_dir, content_hash + '.*')):
+                dataframe_cache.invalidate(path)
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+        return True
+
+    def release_session(self, session_id: str):
+        """Release every reference held by a session (e.g. on expiry)"""
+        prefix = f"{session_id}__"
+        for ref_path in glob.glob(os.path.join(self.ref_dir, '*', prefix + '*')):
+            content_hash = os.path.basename(os.path.dirname(ref_path))
+            self.release(content_hash, os.path.basename(ref_path))
+
+    def reference_count(self, content_hash: str) -> int:
+        ref_path = os.path.join(self.ref_dir, content_hash)
+        return len(os.listdir(ref_path)) if os.path.isdir(ref_path) else 0
+
+    def load_metadata(self, content_hash: str) -> Optional[Dict[str, Any]]:
+        """Return the validation summary stored for a blob, if any"""
+        try:
+            with open(self.blob_path(content_hash, '.json'), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def save_metadata(self, content_hash: str, metadata: Dict[str, Any]):
+        """Persist a blob's validation summary so duplicates skip validation"""
+        path = self.blob_path(content_hash, '.json')
+        tmp_path = os.path.join(self.tmp_dir, uuid.uuid4().hex)
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(metadata, f)
+        os.replace(tmp_path, path)
@@ -7,11 +7,30 @@ import pandas as pd
 import plotly.graph_objects as go
 import plotly.express as px
 from plotly.subplots import make_subplots
-import json
 from typing import Dict, Any, List, Optional
 import numpy as np
 import matplotlib
 matplotlib.use('Agg')  # Use non-interactive backend to avoid GUI issues
+from app.utils.columnar_store import load_file_dataframe, load_file_schema, read_columnar_rows
+from app.utils.subject_index import join_on_subject, load_subject_index
+from app.utils.dataset_profile import is_numeric_column, load_profile
+from app.utils.column_resolver import ColumnResolver, load_column_resolver
+from app.utils.chart_aggregation import category_counts, grouped_sums, histogram_bins, order_counts
+from app.utils import raw_json
+from app.utils.raw_json import RawJSON, figure_json
+from app.utils.query_cache import chart_cache
+import hashlib
+import json
+from app.utils.downsampling import downsample_line, downsample_scatter
+from flask import current_app
+
+# Points per scatter/line chart when CHART_POINT_BUDGET is not configured
+DEFAULT_CHART_POINT_BUDGET = 5000
+# Bump when chart rendering changes so stale cached figures are not served
+CHART_CACHE_VERSION = 2
+# Fields of a chart spec, enough to render a chart again without re-resolving its query
+CHART_SPEC_KEYS = ('query', 'filename', 'content_hash', 'view', 'x_column', 'y_column',
+                   'columns', 'joined_columns', 'chart_type')
 
 class VisualizationProcessor:
     """Handles data visualization and chart generation"""
@@ -28,20 +47,34 @@ class VisualizationProcessor:
         }
     
     def generate_chart(self, query: str, session_data: Dict, 
-                      chart_type: str = None) -> Dict[str, Any]:
+                      chart_type: str = None, progress=None) -> Dict[str, Any]:
         """
         Generate a chart based on natural language query
         """
+        progress = progress or (lambda stage, **data: None)
         try:
             # Determine chart type from query if not specified
             if not chart_type:
                 chart_type = self._detect_chart_type(query)
             
-            # Load dataframes from session
-            dataframes = self._load_session_dataframes(session_data)
+            # Resolve columns against schemas only, then read just those columns
+            schemas = self._load_session_schemas(session_data)
+            
+            # Domains with a subject index can contribute joined columns
+            joinable = {
+                file_info['filename'] for file_info in session_data.get('uploaded_files', [])
+                if file_info.get('subject_index_path')
+            }
             
             # Extract data based on query
-            chart_data = self._extract_chart_data(query, dataframes)
+            resolvers = self._load_session_resolvers(session_data, schemas)
+            chart_data = self._extract_chart_data(query, schemas, joinable, resolvers)
+            
+            # Findings domains: tests named in the query chart from the wide view
+            wide_data = self._extract_findings_chart_data(query, session_data, schemas)
+            if wide_data and (not chart_data or wide_data['match_score'] > chart_data['match_score']):
+                print(f"Charting {wide_data['columns']} from the wide view of {wide_data['filename']}")
+                chart_data = wide_data
             
             if not chart_data:
                 return {
@@ -49,19 +82,25 @@ class VisualizationProcessor:
                     'error': 'Could not extract data for visualization from the query.'
                 }
             
-            # Generate the chart
-            if chart_type in self.chart_types:
-                chart = self.chart_types[chart_type](chart_data, query)
-            else:
-                # Default to scatter plot
-                chart = self._create_scatter_plot(chart_data, query)
+            return self._render_chart(query, session_data, chart_data, chart_type, progress)
             
+        except Exception as e:
             return {
-                'success': True,
-                'chart': chart,
-                'chart_type': chart_type,
-                'data_summary': self._generate_data_summary(chart_data)
+                'success': False,
+                'error': f'Error generating chart: {str(e)}'
             }
+    
+    def render_chart_spec(self, spec: Dict[str, Any], session_data: Dict) -> Dict[str, Any]:
+        """Re-render a chart from its spec (e.g. a dashboard pin) through the chart cache"""
+        try:
+            file_info = next((info for info in session_data.get('uploaded_files', [])
+                              if info['filename'] == spec['filename']
+                              and info.get('content_hash') == spec['content_hash']), None)
+            if file_info is None:
+                return self._missing_dataset_error(spec)
+            
+            chart_data = self._spec_chart_data(spec, file_info)
+            return self._render_chart(spec['query'], session_data, chart_data, spec['chart_type'])
             
         except Exception as e:
             return {
@@ -69,6 +108,282 @@ class VisualizationProcessor:
                 'error': f'Error generating chart: {str(e)}'
             }
     
+    def render_chart_specs(self, specs: List[Dict[str, Any]], session_data: Dict) -> List[Dict[str, Any]]:
+        """Re-render many chart specs against the current uploads in one pass
+        
+        Specs follow the latest upload of their file, so a re-uploaded
+        dataset refreshes its charts. Cached figures are reused; the
+        remaining charts of each dataset share a single read of the union
+        of their columns. Results are returned in spec order, each with its
+        updated spec.
+        """
+        files = {file_info['filename']: file_info for file_info in session_data.get('uploaded_files', [])}
+        results = [None] * len(specs)
+        batches = {}
+        
+        for i, spec in enumerate(specs):
+            try:
+                file_info = files.get(spec['filename'])
+                if file_info is None:
+                    results[i] = self._missing_dataset_error(spec)
+                    continue
+                spec = dict(spec, content_hash=file_info.get('content_hash'))
+                chart_data = self._spec_chart_data(spec, file_info)
+                
+                cached = self._get_cached_chart(
+                    self._chart_cache_key(session_data, chart_data, spec['chart_type']), chart_data
+                )
+                if cached is not None:
+                    results[i] = dict(cached, spec=self._chart_spec(spec['query'], session_data,
+                                                                     chart_data, spec['chart_type']))
+                elif chart_data['joined_columns']:
+                    results[i] = self._render_chart(spec['query'], session_data, chart_data, spec['chart_type'])
+                else:
+                    batches.setdefault((spec['filename'], chart_data.get('view')), []).append(
+                        (i, spec, chart_data)
+                    )
+            except Exception as e:
+                results[i] = {'success': False, 'error': f'Error generating chart: {str(e)}'}
+        
+        for (filename, view), batch in batches.items():
+            try:
+                # One projected read covers every chart of this dataset
+                columns = list(dict.fromkeys(
+                    col for _, spec, chart_data in batch
+                    for col in self._chart_columns(chart_data, spec['chart_type'])
+                ))
+                source = files[filename]['findings_pivot'] if view == 'wide' else files[filename]
+                frame = load_file_dataframe(source, columns=columns)
+                print(f"Refreshing {len(batch)} chart(s) from {filename} with one read of {len(columns)} columns")
+            except Exception as e:
+                for i, _, _ in batch:
+                    results[i] = {'success': False, 'error': f'Error generating chart: {str(e)}'}
+                continue
+            
+            for i, spec, chart_data in batch:
+                try:
+                    results[i] = self._render_chart(spec['query'], session_data, chart_data,
+                                                    spec['chart_type'], frame=frame)
+                except Exception as e:
+                    results[i] = {'success': False, 'error': f'Error generating chart: {str(e)}'}
+        
+        return results
+    
+    def update_appended_charts(self, specs: List[Dict[str, Any]], session_data: Dict,
+                               previous_info: Dict) -> int:
+        """Carry aggregate-backed charts of an appended dataset over to its new rows
+        
+        Bar, pie and categorical histogram charts cached for the previous
+        data keep their per-category counts or sums. Only the appended rows
+        are read and aggregated; their values are added to the cached ones
+        and the chart is cached for the combined data, so refreshing it
+        afterwards is a cache hit. Other charts are rendered again on their
+        next refresh. Returns the number of charts updated.
+        """
+        current = next((info for info in reversed(session_data.get('uploaded_files', []))
+                        if info['filename'] == previous_info['filename']), None)
+        if current is None or not current.get('columnar_path'):
+            return 0
+        previous_session = {'uploaded_files': [previous_info if info is current else info
+                                               for info in session_data['uploaded_files']]}
+        profiles = self._load_session_profiles(session_data)
+        if current['filename'] not in profiles:
+            # Column statistics of the combined data come from its profile
+            return 0
+        
+        updated = 0
+        for spec in specs:
+            try:
+                chart_type = spec['chart_type']
+                if (spec.get('view') == 'wide' or spec.get('joined_columns')
+                        or chart_type not in ('bar', 'pie', 'histogram')):
+                    continue
+                chart_data = self._spec_chart_data(spec, current)
+                cache_key = self._chart_cache_key(session_data, chart_data, chart_type)
+                cached = chart_cache.get(self._chart_cache_key(previous_session, chart_data, chart_type))
+                if chart_cache.get(cache_key) is not None or not (cached or {}).get('aggregate'):
+                    continue
+                
+                rows = read_columnar_rows(current['columnar_path'], previous_info['rows'],
+                                          self._chart_columns(chart_data, chart_type))
+                aggregate = self._chart_aggregate(chart_type, rows, chart_data['x_column'], chart_data['y_column'])
+                if aggregate is None or aggregate[0] != cached['aggregate']['kind']:
+                    continue
+                values = self._merge_aggregates(cached['aggregate'], self._aggregate_entry(*aggregate))
+                
+                if chart_type == 'bar':
+                    chart = self._bar_chart(chart_data['x_column'], chart_data['y_column'], aggregate[0], values)
+                elif chart_type == 'pie':
+                    chart = self._pie_chart(chart_data['x_column'], values)
+                else:
+                    chart = self._category_histogram(chart_data['x_column'], values)
+                chart_data['dataframe'] = rows
+                summary = self._generate_data_summary(chart_data, profiles)
+                summary['total_records'] = cached['data_summary']['total_records'] + len(rows)
+                result = {'chart': chart, 'chart_type': chart_type, 'data_summary': summary}
+                self._cache_chart(cache_key, result, chart.pop('aggregate'))
+                updated += 1
+            except Exception as e:
+                print(f"Could not update chart {spec.get('query')!r} with appended rows: {e}")
+        
+        print(f"Updated {updated} of {len(specs)} chart(s) of {current['filename']} with "
+              f"{current['rows'] - previous_info['rows']} appended rows")
+        return updated
+    
+    def _missing_dataset_error(self, spec: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            'success': False,
+            'error': f"The dataset {spec['filename']} of this chart is no longer uploaded."
+        }
+    
+    def _spec_chart_data(self, spec: Dict[str, Any], file_info: Dict) -> Dict[str, Any]:
+        """Resolved chart data of a spec, with the file's schema in place of its data"""
+        source = file_info.get('findings_pivot') if spec.get('view') == 'wide' else file_info
+        schema = load_file_schema(source) if source else None
+        if schema is None:
+            raise FileNotFoundError(spec['filename'])
+        missing = [col for col in spec['columns'] if col not in schema.columns
+                   and not any(col in cols for cols in (spec.get('joined_columns') or {}).values())]
+        if missing:
+            raise KeyError(f"Columns no longer in {spec['filename']}: {', '.join(missing)}")
+        
+        return {
+            'dataframe': schema,
+            'filename': spec['filename'],
+            'x_column': spec['x_column'],
+            'y_column': spec['y_column'],
+            'columns': spec['columns'],
+            'joined_columns': spec.get('joined_columns') or {},
+            'view': spec.get('view'),
+            'column_matches': []
+        }
+    
+    def _chart_spec(self, query: str, session_data: Dict, chart_data: Dict[str, Any],
+                    chart_type: str) -> Dict[str, Any]:
+        """Everything needed to render the chart again, without its data"""
+        # The latest upload of a filename is the one charts read
+        file_info = next(info for info in reversed(session_data['uploaded_files'])
+                         if info['filename'] == chart_data['filename'])
+        return {
+            'kind': 'visualization',
+            'query': query,
+            'filename': chart_data['filename'],
+            'content_hash': file_info.get('content_hash'),
+            'view': chart_data.get('view'),
+            'x_column': chart_data['x_column'],
+            'y_column': chart_data['y_column'],
+            'columns': chart_data['columns'],
+            'joined_columns': chart_data.get('joined_columns') or {},
+            'chart_type': chart_type
+        }
+    
+    def _render_chart(self, query: str, session_data: Dict, chart_data: Dict[str, Any],
+                      chart_type: str, progress=None, frame: pd.DataFrame = None) -> Dict[str, Any]:
+        """Build (or fetch from the chart cache) the figure for resolved columns
+        
+        ``frame``, when given, already holds the chart's columns (batch refresh).
+        """
+        progress = progress or (lambda stage, **data: None)
+        spec = self._chart_spec(query, session_data, chart_data, chart_type)
+        
+        # Same data, columns and chart type render the same figure
+        cache_key = self._chart_cache_key(session_data, chart_data, chart_type)
+        cached = self._get_cached_chart(cache_key, chart_data)
+        if cached is not None:
+            print(f"Chart cache hit for {chart_type} of {chart_data['columns']}")
+            progress('result_ready', result_type='chart', cached=True)
+            return dict(cached, spec=spec)
+        
+        if frame is not None:
+            chart_data['dataframe'] = frame[self._chart_columns(chart_data, chart_type)]
+        else:
+            chart_data['dataframe'] = self._load_chart_columns(
+                session_data, chart_data, chart_type
+            )
+        progress('data_loaded', rows=len(chart_data['dataframe']),
+                 columns=len(chart_data['dataframe'].columns))
+        
+        # Generate the chart
+        if chart_type in self.chart_types:
+            chart = self.chart_types[chart_type](chart_data, query)
+        else:
+            # Default to scatter plot
+            chart = self._create_scatter_plot(chart_data, query)
+        aggregate = chart.pop('aggregate', None)
+        progress('result_ready', result_type='chart')
+        
+        # Upload profiles describe the long layout, not the wide view
+        profiles = {} if chart_data.get('view') == 'wide' else self._load_session_profiles(session_data)
+        result = {
+            'success': True,
+            'chart': chart,
+            'chart_type': chart_type,
+            'data_summary': self._generate_data_summary(chart_data, profiles),
+            'column_matches': chart_data['column_matches']
+        }
+        if chart.get('success', True):
+            self._cache_chart(cache_key, result, aggregate)
+        result['spec'] = spec
+        return result
+    
+    def _chart_cache_key(self, session_data: Dict, chart_data: Dict[str, Any], chart_type: str) -> str:
+        """Key of a rendered chart: dataset content, resolved columns, type and options"""
+        files = {file_info['filename']: file_info for file_info in session_data['uploaded_files']}
+        sources = [chart_data['filename']] + sorted(chart_data.get('joined_columns') or {})
+        payload = json.dumps([
+            CHART_CACHE_VERSION,
+            [files[name].get('content_hash') or files[name]['file_path'] for name in sources],
+            chart_data['x_column'],
+            chart_data['y_column'],
+            chart_data['columns'],
+            chart_data.get('joined_columns') or {},
+            chart_data.get('view'),
+            chart_type,
+            self._point_budget()
+        ], sort_keys=True)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+    
+    def _get_cached_chart(self, cache_key: str, chart_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        cached = chart_cache.get(cache_key)
+        if cached is None:
+            return None
+        return {
+            'success': True,
+            'chart': RawJSON(cached['chart_json']),
+            'chart_type': cached['chart_type'],
+            'data_summary': cached['data_summary'],
+            'column_matches': chart_data['column_matches'],
+            'etag': cached['etag'],
+            'cached': True
+        }
+    
+    def _cache_chart(self, cache_key: str, result: Dict[str, Any], aggregate: Dict[str, Any] = None):
+        """Store the serialized chart and tag the result with its ETag
+        
+        ``aggregate`` (per-category counts or sums) is kept with the chart so
+        appended rows can be added to it later.
+        """
+        chart_json = raw_json.dumps(result['chart'], default=str)
+        result['etag'] = hashlib.sha256(chart_json.encode('utf-8')).hexdigest()[:32]
+        chart_cache.set(cache_key, {
+            'chart_json': chart_json,
+            'chart_type': result['chart_type'],
+            'data_summary': result['data_summary'],
+            'etag': result['etag'],
+            'aggregate': aggregate
+        })
+    
+    def _figure_json(self, fig: go.Figure) -> RawJSON:
+        """Serialize a figure once; the response embeds this JSON verbatim"""
+        return figure_json(fig)
+    
+    def _point_budget(self) -> int:
+        """Maximum points sent per scatter/line chart"""
+        try:
+            return current_app.config.get('CHART_POINT_BUDGET', DEFAULT_CHART_POINT_BUDGET)
+        except RuntimeError:
+            return DEFAULT_CHART_POINT_BUDGET
+    
     def _detect_chart_type(self, query: str) -> str:
         """Detect chart type from natural language query"""
         query_lower = query.lower()
@@ -90,7 +405,9 @@ class VisualizationProcessor:
         else:
             return 'scatter'  # default
     
-    def _extract_chart_data(self, query: str, dataframes: Dict[str, pd.DataFrame]) -> Dict[str, Any]:
+    def _extract_chart_data(self, query: str, dataframes: Dict[str, pd.DataFrame],
+                            joinable: set = None,
+                            resolvers: Dict[str, ColumnResolver] = None) -> Dict[str, Any]:
         """Extract relevant data for chart generation"""
         # For now, use the first available dataframe
         if not dataframes:
@@ -98,52 +415,74 @@ class VisualizationProcessor:
         
         df_name = list(dataframes.keys())[0]
         df = dataframes[df_name]
-        
-        # Simple extraction based on common patterns
-        query_lower = query.lower()
-        
-        # Look for column names in the query with better matching
         columns = df.columns.tolist()
-        found_columns = []
-        
-        # Common column name mappings
-        column_mappings = {
-            'age': ['age', 'AGE', 'Age', 'subject_age', 'patient_age'],
-            'weight': ['weight', 'WEIGHT', 'Weight', 'subject_weight', 'patient_weight', 'wt'],
-            'height': ['height', 'HEIGHT', 'Height', 'subject_height', 'patient_height', 'ht'],
-            'bmi': ['bmi', 'BMI', 'Bmi', 'body_mass_index'],
-            'visit': ['visit', 'VISIT', 'Visit', 'visit_num', 'visit_number'],
-            'date': ['date', 'DATE', 'Date', 'visit_date', 'screening_date'],
-            'id': ['id', 'ID', 'Id', 'subject_id', 'patient_id', 'usubjid', 'studyid']
-        }
-        
-        # First, try to find columns mentioned in the query
-        for col in columns:
-            if col.lower() in query_lower:
-                found_columns.append(col)
-        
-        # If not enough columns found, try mapping common terms
-        if len(found_columns) < 2:
-            for term, possible_names in column_mappings.items():
-                if term in query_lower:
-                    for possible_name in possible_names:
-                        if possible_name in columns:
-                            if possible_name not in found_columns:
-                                found_columns.append(possible_name)
-                                break
-                    # Also try partial matches
-                    for col in columns:
-                        if term in col.lower() and col not in found_columns:
-                            found_columns.append(col)
-                            break
+        numeric_cols = df.select_dtypes(include=[np.number]).columns.tolist()
+        resolvers = resolvers or {}
+        
+        def resolver_for(name, frame):
+            return resolvers.get(name) or ColumnResolver.from_columns(frame.columns.tolist())
+        
+        # Ranked matches of the query against names, SDTM labels and synonyms
+        matches = resolver_for(df_name, df).resolve(query)
+        
+        # Columns named outright in the query come first
+        found = [match for match in matches if match['exact']]
+        
+        # Columns named in the query that live in other subject-indexed domains
+        joined_columns = {}
+        if len(found) < 2 and joinable and df_name in joinable:
+            for other_name, other_df in list(dataframes.items())[1:]:
+                if other_name not in joinable:
+                    continue
+                for match in resolver_for(other_name, other_df).resolve(query):
+                    if len(found) >= 2:
+                        break
+                    if (match['exact'] and match['column'] not in columns
+                            and all(match['column'] != chosen['column'] for chosen in found)):
+                        found.append(match)
+                        joined_columns.setdefault(other_name, []).append(match['column'])
+                if joined_columns:
+                    # Row positions only line up for a single join
+                    break
+        
+        # If not enough columns found, take the best partial matches,
+        # preferring ones that cover query words not matched yet
+        partial = sorted((match for match in matches if not match['exact']),
+                         key=lambda match: (-match['score'], match['column'] not in numeric_cols,
+                                            match['column_position']))
+        covered = {position for match in found for position in match['query_positions']}
+        for match in partial:
+            if len(found) < 2 and not covered.issuperset(match['query_positions']):
+                found.append(match)
+                covered.update(match['query_positions'])
+        for match in partial:
+            if len(found) < 2 and match not in found:
+                found.append(match)
+        
+        # Score of the choice, counting each query word once
+        match_score = 0
+        covered = set()
+        for match in found:
+            if not covered.issuperset(match['query_positions']):
+                match_score += match['score']
+                covered.update(match['query_positions'])
+        
+        # Axes follow the order the columns are mentioned in the query
+        found.sort(key=lambda match: (match['query_position'], -match['score'], match['column_position']))
+        found_columns = [match['column'] for match in found]
+        column_matches = [{'column': match['column'], 'score': match['score'], 'reasons': match['reasons']}
+                          for match in found]
         
         # If still not enough columns found, use first two numeric columns
         if len(found_columns) < 2:
-            numeric_cols = df.select_dtypes(include=[np.number]).columns.tolist()
+            joined_columns = {}
             if len(numeric_cols) >= 2:
                 found_columns = numeric_cols[:2]
             elif len(columns) >= 2:
                 found_columns = columns[:2]
+            column_matches = [{'column': col, 'score': 0, 'reasons': ['no match; first columns of the dataset']}
+                              for col in found_columns]
+            match_score = 0
         
         if len(found_columns) < 2:
             return None
@@ -152,21 +491,19 @@ class VisualizationProcessor:
         print(f"DataFrame columns: {columns}")
         print(f"DataFrame shape: {df.shape}")
         
-        # Debug: Show all numeric columns
-        numeric_cols = df.select_dtypes(include=[np.number]).columns.tolist()
-        print(f"All numeric columns: {numeric_cols}")
-        
-        # Debug: Show columns that might contain age/weight
-        age_like_cols = [col for col in columns if 'age' in col.lower()]
-        weight_like_cols = [col for col in columns if 'weight' in col.lower() or 'wt' in col.lower()]
-        print(f"Age-like columns: {age_like_cols}")
-        print(f"Weight-like columns: {weight_like_cols}")
+        # Debug: Show why each column was chosen
+        for match in column_matches:
+            print(f"  {match['column']}: score {match['score']} ({', '.join(match['reasons'])})")
         
         return {
             'dataframe': df,
+            'filename': df_name,
             'x_column': found_columns[0],
             'y_column': found_columns[1],
-            'columns': found_columns
+            'columns': found_columns,
+            'joined_columns': joined_columns,
+            'column_matches': column_matches,
+            'match_score': match_score
         }
     
     def _create_scatter_plot(self, chart_data: Dict[str, Any], query: str) -> Dict[str, Any]:
@@ -203,6 +540,11 @@ class VisualizationProcessor:
                 }
             }
         
+        # Keep the payload bounded: sample in proportion to point density
+        df_clean, sampling = downsample_scatter(df_clean, x_col, y_col, self._point_budget())
+        if sampling['applied']:
+            print(f"Downsampled scatter from {sampling['original_points']} to {sampling['returned_points']} points")
+        
         fig = px.scatter(
             df_clean, 
             x=x_col, 
@@ -213,12 +555,13 @@ class VisualizationProcessor:
         
         return {
             'type': 'scatter',
-            'data': json.loads(fig.to_json()),
+            'data': self._figure_json(fig),
             'layout': {
                 'title': f"Scatter Plot: {x_col} vs {y_col}",
                 'xaxis_title': x_col,
                 'yaxis_title': y_col
-            }
+            },
+            'sampling': sampling
         }
     
     def _create_line_plot(self, chart_data: Dict[str, Any], query: str) -> Dict[str, Any]:
@@ -227,6 +570,11 @@ class VisualizationProcessor:
         x_col = chart_data['x_column']
         y_col = chart_data['y_column']
         
+        # Keep the payload bounded: LTTB preserves the line's visual shape
+        df, sampling = downsample_line(df, x_col, y_col, self._point_budget())
+        if sampling['applied']:
+            print(f"Downsampled line from {sampling['original_points']} to {sampling['returned_points']} points")
+        
         fig = px.line(
             df, 
             x=x_col, 
@@ -237,65 +585,77 @@ class VisualizationProcessor:
         
         return {
             'type': 'line',
-            'data': json.loads(fig.to_json()),
+            'data': self._figure_json(fig),
             'layout': {
                 'title': f"Line Plot: {y_col} over {x_col}",
                 'xaxis_title': x_col,
                 'yaxis_title': y_col
-            }
+            },
+            'sampling': sampling
         }
     
     def _create_bar_chart(self, chart_data: Dict[str, Any], query: str) -> Dict[str, Any]:
-        """Create a bar chart"""
-        df = chart_data['dataframe']
+        """Create a bar chart from server-side aggregates (one bar per category)"""
         x_col = chart_data['x_column']
         y_col = chart_data['y_column']
-        
-        # For bar charts, we might want to aggregate the data
-        if df[y_col].dtype in ['int64', 'float64']:
-            # If y is numeric, create a bar chart of values
-            fig = px.bar(
-                df, 
-                x=x_col, 
-                y=y_col,
-                title=f"Bar Chart: {y_col} by {x_col}",
-                labels={x_col: x_col, y_col: y_col}
+        kind, values = self._chart_aggregate('bar', chart_data['dataframe'], x_col, y_col)
+        return self._bar_chart(x_col, y_col, kind, values)
+    
+    def _bar_chart(self, x_col: str, y_col: str, kind: str, values: pd.Series) -> Dict[str, Any]:
+        if kind == 'sum':
+            # If y is numeric, one bar per x value holds its sum
+            fig = go.Figure(
+                go.Bar(x=values.index.tolist(), y=values.values.tolist()),
+                layout=dict(title=f"Bar Chart: {y_col} by {x_col}",
+                            xaxis_title=x_col, yaxis_title=y_col)
             )
         else:
             # If y is categorical, count occurrences
-            value_counts = df[x_col].value_counts()
-            fig = px.bar(
-                x=value_counts.index,
-                y=value_counts.values,
-                title=f"Bar Chart: Count of {x_col}",
-                labels={'x': x_col, 'y': 'Count'}
+            fig = go.Figure(
+                go.Bar(x=values.index.tolist(), y=values.values.tolist()),
+                layout=dict(title=f"Bar Chart: Count of {x_col}",
+                            xaxis_title=x_col, yaxis_title='Count')
             )
         
         return {
             'type': 'bar',
-            'data': json.loads(fig.to_json()),
+            'data': self._figure_json(fig),
             'layout': {
                 'title': f"Bar Chart: {y_col} by {x_col}",
                 'xaxis_title': x_col,
-                'yaxis_title': y_col if df[y_col].dtype in ['int64', 'float64'] else 'Count'
-            }
+                'yaxis_title': y_col if kind == 'sum' else 'Count'
+            },
+            'aggregate': self._aggregate_entry(kind, values)
         }
     
     def _create_histogram(self, chart_data: Dict[str, Any], query: str) -> Dict[str, Any]:
-        """Create a histogram"""
+        """Create a histogram from bins computed on the server"""
         df = chart_data['dataframe']
         x_col = chart_data['x_column']
         
-        fig = px.histogram(
-            df, 
-            x=x_col,
-            title=f"Histogram: Distribution of {x_col}",
-            labels={x_col: x_col}
+        aggregate = self._chart_aggregate('histogram', df, x_col, chart_data['y_column'])
+        if aggregate is not None:
+            # Categorical values: one bar per value
+            return self._category_histogram(x_col, aggregate[1])
+        
+        centers, counts, widths = histogram_bins(df[x_col])
+        return self._histogram(x_col, go.Bar(x=centers.tolist(), y=counts.tolist(), width=widths.tolist()))
+    
+    def _category_histogram(self, x_col: str, values: pd.Series) -> Dict[str, Any]:
+        chart = self._histogram(x_col, go.Bar(x=values.index.tolist(), y=values.values.tolist()))
+        chart['aggregate'] = self._aggregate_entry('count', values)
+        return chart
+    
+    def _histogram(self, x_col: str, trace: go.Bar) -> Dict[str, Any]:
+        fig = go.Figure(
+            trace,
+            layout=dict(title=f"Histogram: Distribution of {x_col}",
+                        xaxis_title=x_col, yaxis_title='count', bargap=0)
         )
         
         return {
             'type': 'histogram',
-            'data': json.loads(fig.to_json()),
+            'data': self._figure_json(fig),
             'layout': {
                 'title': f"Histogram: Distribution of {x_col}",
                 'xaxis_title': x_col,
@@ -319,7 +679,7 @@ class VisualizationProcessor:
         
         return {
             'type': 'box',
-            'data': json.loads(fig.to_json()),
+            'data': self._figure_json(fig),
             'layout': {
                 'title': f"Box Plot: {y_col} by {x_col}",
                 'xaxis_title': x_col,
@@ -329,11 +689,11 @@ class VisualizationProcessor:
     
     def _create_pie_chart(self, chart_data: Dict[str, Any], query: str) -> Dict[str, Any]:
         """Create a pie chart"""
-        df = chart_data['dataframe']
         x_col = chart_data['x_column']
-        
-        value_counts = df[x_col].value_counts()
-        
+        _, value_counts = self._chart_aggregate('pie', chart_data['dataframe'], x_col, chart_data['y_column'])
+        return self._pie_chart(x_col, value_counts)
+    
+    def _pie_chart(self, x_col: str, value_counts: pd.Series) -> Dict[str, Any]:
         fig = px.pie(
             values=value_counts.values,
             names=value_counts.index,
@@ -342,12 +702,42 @@ class VisualizationProcessor:
         
         return {
             'type': 'pie',
-            'data': json.loads(fig.to_json()),
+            'data': self._figure_json(fig),
             'layout': {
                 'title': f"Pie Chart: Distribution of {x_col}"
-            }
+            },
+            'aggregate': self._aggregate_entry('count', value_counts)
         }
     
+    def _chart_aggregate(self, chart_type: str, df: pd.DataFrame, x_col: str,
+                         y_col: str) -> Optional[tuple]:
+        """(kind, values) behind bar, pie and categorical histogram charts
+        
+        ``kind`` is 'count' (occurrences per x value, most frequent first) or
+        'sum' (y summed per x value, in x order). Both add up across row
+        batches, which lets appended rows update a chart without the
+        earlier ones. None for charts drawn from the rows themselves.
+        """
+        if chart_type == 'bar' and df[y_col].dtype in ['int64', 'float64']:
+            return 'sum', grouped_sums(df, x_col, y_col)
+        if chart_type in ('bar', 'pie') or (chart_type == 'histogram' and not is_numeric_column(df[x_col])):
+            return 'count', category_counts(df[x_col])
+        return None
+    
+    def _aggregate_entry(self, kind: str, values: pd.Series) -> Dict[str, Any]:
+        return {'kind': kind, 'index': values.index.tolist(), 'values': values.tolist()}
+    
+    def _merge_aggregates(self, previous: Dict[str, Any], added: Dict[str, Any]) -> pd.Series:
+        """Per-category values of the previous rows plus those of appended rows"""
+        values = pd.Series(previous['values'], index=previous['index'], dtype=float).add(
+            pd.Series(added['values'], index=added['index'], dtype=float), fill_value=0
+        )
+        if all(isinstance(value, int) for value in previous['values'] + added['values']):
+            values = values.astype('int64')
+        if previous['kind'] == 'count':
+            return order_counts(values)
+        return values.sort_index()
+    
     def _create_heatmap(self, chart_data: Dict[str, Any], query: str) -> Dict[str, Any]:
         """Create a correlation heatmap"""
         df = chart_data['dataframe']
@@ -372,61 +762,171 @@ class VisualizationProcessor:
         
         return {
             'type': 'heatmap',
-            'data': json.loads(fig.to_json()),
+            'data': self._figure_json(fig),
             'layout': {
                 'title': 'Correlation Heatmap'
             }
         }
     
-    def _generate_data_summary(self, chart_data: Dict[str, Any]) -> Dict[str, Any]:
-        """Generate summary statistics for the chart data"""
+    def _generate_data_summary(self, chart_data: Dict[str, Any],
+                               profiles: Dict[str, Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Generate summary statistics for the chart data
+        
+        Column statistics come from the upload-time dataset profiles when
+        available, so only columns without a profile are computed here.
+        """
         df = chart_data['dataframe']
         x_col = chart_data['x_column']
         y_col = chart_data['y_column']
+        profiles = profiles or {}
         
-        summary = {
+        # Profile of each chart column: the chart's file first, then joined files
+        sources = [chart_data['filename']] + list((chart_data.get('joined_columns') or {}).keys())
+        
+        def column_profile(col):
+            for filename in sources:
+                profile = profiles.get(filename)
+                if profile and col in profile['columns']:
+                    return profile['columns'][col]
+            return None
+        
+        return {
             'total_records': len(df),
-            'x_column': {
-                'name': x_col,
-                'type': str(df[x_col].dtype),
-                'unique_values': df[x_col].nunique()
-            },
-            'y_column': {
-                'name': y_col,
-                'type': str(df[y_col].dtype),
-                'unique_values': df[y_col].nunique()
+            'x_column': self._column_summary(df, x_col, column_profile(x_col)),
+            'y_column': self._column_summary(df, y_col, column_profile(y_col))
+        }
+    
+    def _column_summary(self, df: pd.DataFrame, col: str,
+                        column_profile: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        """Name, type, cardinality and, for numeric columns, basic statistics"""
+        if column_profile is not None:
+            summary = {
+                'name': col,
+                'type': column_profile['type'],
+                'unique_values': column_profile['unique_values']
             }
+            if column_profile['numeric'] and column_profile.get('mean') is not None:
+                summary.update({key: column_profile[key] for key in ('mean', 'std', 'min', 'max')})
+            return summary
+        
+        summary = {
+            'name': col,
+            'type': str(df[col].dtype),
+            'unique_values': df[col].nunique()
         }
         
         # Add numeric statistics if applicable
-        if df[x_col].dtype in ['int64', 'float64']:
-            summary['x_column'].update({
-                'mean': float(df[x_col].mean()),
-                'std': float(df[x_col].std()),
-                'min': float(df[x_col].min()),
-                'max': float(df[x_col].max())
-            })
-        
-        if df[y_col].dtype in ['int64', 'float64']:
-            summary['y_column'].update({
-                'mean': float(df[y_col].mean()),
-                'std': float(df[y_col].std()),
-                'min': float(df[y_col].min()),
-                'max': float(df[y_col].max())
+        if df[col].dtype in ['int64', 'float64']:
+            summary.update({
+                'mean': float(df[col].mean()),
+                'std': float(df[col].std()),
+                'min': float(df[col].min()),
+                'max': float(df[col].max())
             })
         
         return summary
     
-    def _load_session_dataframes(self, session_data: Dict) -> Dict[str, pd.DataFrame]:
-        """Load dataframes from session data"""
-        dataframes = {}
+    def _load_session_profiles(self, session_data: Dict) -> Dict[str, Dict[str, Any]]:
+        """Upload-time column profiles of session files, keyed by filename"""
+        profiles = {}
+        for file_info in session_data.get('uploaded_files', []):
+            profile = load_profile(file_info)
+            if profile is not None:
+                profiles[file_info['filename']] = profile
+        return profiles
+    
+    def _extract_findings_chart_data(self, query: str, session_data: Dict,
+                                     schemas: Dict[str, pd.DataFrame]) -> Optional[Dict[str, Any]]:
+        """Resolve the query against the precomputed wide view of a findings domain"""
+        if not schemas:
+            return None
+        filename = list(schemas.keys())[0]
+        file_info = next((info for info in session_data.get('uploaded_files', [])
+                          if info['filename'] == filename), None)
+        pivot = file_info.get('findings_pivot') if file_info else None
+        if not pivot:
+            return None
+        
+        wide_schema = load_file_schema(pivot)
+        if wide_schema is None:
+            return None
+        resolver = load_column_resolver(pivot, wide_schema.columns.tolist())
+        chart_data = self._extract_chart_data(query, {filename: wide_schema}, None, {filename: resolver})
+        if chart_data:
+            chart_data['view'] = 'wide'
+        return chart_data
+    
+    def _load_session_resolvers(self, session_data: Dict,
+                                schemas: Dict[str, pd.DataFrame]) -> Dict[str, ColumnResolver]:
+        """Upload-time column resolvers of session files, keyed by filename"""
+        resolvers = {}
+        for file_info in session_data.get('uploaded_files', []):
+            schema = schemas.get(file_info['filename'])
+            if schema is None:
+                continue
+            resolver = load_column_resolver(file_info, schema.columns.tolist())
+            if resolver is not None:
+                resolvers[file_info['filename']] = resolver
+        return resolvers
+    
+    def _load_session_schemas(self, session_data: Dict) -> Dict[str, pd.DataFrame]:
+        """Load zero-row schema frames (columns and dtypes) for session files"""
+        schemas = {}
         
         if 'uploaded_files' in session_data:
             for file_info in session_data['uploaded_files']:
                 try:
-                    df = pd.read_csv(file_info['file_path'])
-                    dataframes[file_info['filename']] = df
+                    schema = load_file_schema(file_info)
+                    if schema is None:
+                        raise FileNotFoundError(file_info['file_path'])
+                    schemas[file_info['filename']] = schema
                 except Exception as e:
                     print(f"Error loading {file_info['filename']}: {e}")
         
-        return dataframes 
\ No newline at end of file
+        return schemas
+    
+    def _chart_columns(self, chart_data: Dict[str, Any], chart_type: str) -> List[str]:
+        """Columns of the resolved file a chart reads"""
+        schema = chart_data['dataframe']
+        columns = list(dict.fromkeys(chart_data['columns']))
+        if chart_type == 'heatmap':
+            # Correlation heatmaps use every numeric column
+            numeric_cols = schema.select_dtypes(include=[np.number]).columns.tolist()
+            columns += [col for col in numeric_cols if col not in columns]
+        return columns
+    
+    def _load_chart_columns(self, session_data: Dict, chart_data: Dict[str, Any],
+                            chart_type: str) -> pd.DataFrame:
+        """Read only the columns the chart needs from the resolved file"""
+        schema = chart_data['dataframe']
+        columns = self._chart_columns(chart_data, chart_type)
+        
+        files = {file_info['filename']: file_info for file_info in session_data['uploaded_files']}
+        if chart_data['filename'] not in files:
+            raise FileNotFoundError(chart_data['filename'])
+        
+        if chart_data.get('view') == 'wide':
+            return load_file_dataframe(files[chart_data['filename']]['findings_pivot'], columns=columns)
+        
+        joined_columns = chart_data.get('joined_columns') or {}
+        if not joined_columns:
+            return load_file_dataframe(files[chart_data['filename']], columns=columns)
+        
+        # Cross-domain chart: join on subject through the persisted indexes
+        base_info = files[chart_data['filename']]
+        base_index = load_subject_index(base_info)
+        if base_index is None:
+            raise FileNotFoundError(f"Subject index for {chart_data['filename']}")
+        base_columns = [col for col in columns if col in schema.columns]
+        df = load_file_dataframe(base_info, columns=list(dict.fromkeys(base_columns + [base_index.key])))
+        
+        (other_name, other_columns), = joined_columns.items()
+        other_index = load_subject_index(files[other_name])
+        if other_index is None:
+            raise FileNotFoundError(f"Subject index for {other_name}")
+        other_df = load_file_dataframe(files[other_name],
+                                       columns=list(dict.fromkeys(other_columns + [other_index.key])))
+        df = join_on_subject(df, base_index, other_df, other_index)
+        print(f"Joined {other_columns} from {other_name} on {base_index.key}: {df.shape}")
+        
+        return df
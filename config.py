@@ -5,10 +5,47 @@ load_dotenv()
 
 class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'dev-secret-key-change-in-production'
-    MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max file size
+    MAX_CONTENT_LENGTH = int(os.environ.get('MAX_UPLOAD_MB', 16)) * 1024 * 1024  # 16MB default max file size
     UPLOAD_FOLDER = 'app/static/uploads'
     ALLOWED_EXTENSIONS = {'csv'}
+    CSV_VALIDATION_CHUNK_SIZE = 50000  # Rows parsed per chunk when validating/converting uploads
     OPENAI_API_KEY = os.environ.get('OPENAI_API_KEY')
+    OPENAI_MODEL = os.environ.get('OPENAI_MODEL', 'gpt-4o-mini')
     
     # Session configuration
-    PERMANENT_SESSION_LIFETIME = 3600  # 1 hour session timeout 
\ No newline at end of file
+    PERMANENT_SESSION_LIFETIME = 3600  # 1 hour session timeout
+    SESSION_BACKEND = os.environ.get('SESSION_BACKEND', 'sqlite')  # 'sqlite' or 'filesystem'
+    SESSION_SQLITE_PATH = 'instance/sessions.db'
+    SESSION_FILE_DIR = 'instance/sessions'
+    
+    # Parsed DataFrame cache shared by preview, query and visualization
+    DATAFRAME_CACHE_MAX_BYTES = 256 * 1024 * 1024  # 256MB memory budget
+    
+    # Natural-language query result cache (memory LRU + on-disk tier)
+    QUERY_CACHE_DIR = 'instance/query_cache'
+    QUERY_CACHE_TTL = 24 * 3600  # 24 hours
+    QUERY_CACHE_MAX_ENTRIES = 500
+    QUERY_CACHE_MAX_DISK_ENTRIES = 5000
+    GENERATED_CODE_CACHE_DIR = 'instance/code_cache'
+    CHART_CACHE_DIR = 'instance/chart_cache'
+    
+    # Background job pool for async /query and /visualize requests
+    JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 4))
+    JOB_MAX_PENDING = 64
+    JOB_RESULT_TTL = 600  # seconds a finished job's result stays available
+    
+    # Scatter/line charts above this many points are downsampled server-side
+    CHART_POINT_BUDGET = int(os.environ.get('CHART_POINT_BUDGET', 5000))
+    
+    # Most rows returned by one /preview page
+    PREVIEW_MAX_ROWS = 500
+    
+    # Chart images written by generated code (exports/charts)
+    CHART_RETENTION_SECONDS = 24 * 3600  # matches QUERY_CACHE_TTL so cached results keep their image
+    CHART_MAX_FILES = 1000  # charts pinned to dashboards are copied out and never pruned
+    CHART_PRUNE_INTERVAL = 300  # seconds between retention sweeps
+    
+    # Let the front proxy send chart files: X-Sendfile (Apache/lighttpd) or
+    # an nginx internal location mapped to exports/charts for X-Accel-Redirect
+    USE_X_SENDFILE = os.environ.get('USE_X_SENDFILE', '').lower() in ('1', 'true', 'yes')
+    CHART_ACCEL_REDIRECT_PREFIX = os.environ.get('CHART_ACCEL_REDIRECT_PREFIX')
\ No newline at end of file
@@ -0,0 +1,42 @@
+"""
+Shared fixtures for tests that drive the app in-process through Flask's test client
+"""
+
+import io
+import os
+import shutil
+import tempfile
+
+import pytest
+
+from app import create_app
+from config import Config
+
+
+@pytest.fixture
+def client():
+    """Test client of an app whose uploads, sessions and caches live in a temporary directory"""
+    root = tempfile.mkdtemp(prefix='sigmatic-test-')
+
+    class TestConfig(Config):
+        TESTING = True
+        SESSION_BACKEND = 'sqlite'
+        UPLOAD_FOLDER = os.path.join(root, 'uploads')
+        SESSION_SQLITE_PATH = os.path.join(root, 'sessions.db')
+        QUERY_CACHE_DIR = os.path.join(root, 'query_cache')
+        GENERATED_CODE_CACHE_DIR = os.path.join(root, 'code_cache')
+        CHART_CACHE_DIR = os.path.join(root, 'chart_cache')
+
+    app = create_app(TestConfig)
+    with app.test_client() as test_client:
+        yield test_client
+    shutil.rmtree(root, ignore_errors=True)
+
+
+def upload_csv(client, filename, content, **fields):
+    """Upload CSV text (or bytes) and return the JSON response"""
+    if isinstance(content, str):
+        content = content.encode('utf-8')
+    data = dict(fields, file=(io.BytesIO(content), filename))
+    response = client.post('/upload', data=data, content_type='multipart/form-data')
+    return response.get_json()
@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+Test script for appending a data cut to an uploaded dataset
+"""
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.utils.dataset_profile import (DISTINCT_SKETCH_SIZE, TRACKED_VALUES, column_state,
+                                       profile_from_state, update_column_state)
+from conftest import upload_csv
+
+VS_PATH = 'sample_data/vs.csv'
+FIRST_CUT_ROWS = 6000
+CHART_SPECS = [
+    {'chart_type': 'bar', 'x_column': 'VSTESTCD', 'y_column': 'VSSTRESN'},
+    {'chart_type': 'pie', 'x_column': 'VSPOS', 'y_column': 'VSSTRESN'},
+    {'chart_type': 'histogram', 'x_column': 'VISIT', 'y_column': 'VSSTRESN'},
+]
+
+
+def _vs_cuts():
+    with open(VS_PATH, 'r', encoding='utf-8') as f:
+        lines = f.read().splitlines(keepends=True)
+    header, rows = lines[0], lines[1:]
+    return header, header + ''.join(rows[:FIRST_CUT_ROWS]), header + ''.join(rows[FIRST_CUT_ROWS:])
+
+
+def _pin(client, file_info, chart):
+    spec = dict(chart, kind='visualization', query=f"{chart['chart_type']} of {chart['x_column']}",
+                filename=file_info['filename'], content_hash=file_info['content_hash'], view=None,
+                columns=[chart['x_column'], chart['y_column']], joined_columns={})
+    result = client.post('/dashboard/pin', json={'spec': spec, 'title': spec['query']}).get_json()
+    assert result['success'], result
+    return result['chart_id']
+
+
+def _chart(client, chart_id):
+    result = client.get(f'/dashboard/charts/{chart_id}').get_json()
+    assert result['success'], result
+    return result['chart']
+
+
+def _profile(client, filename):
+    return client.get(f'/preview/{filename}').get_json()['profile']
+
+
+def test_append_matches_fresh_upload(client):
+    print("🧪 Testing Incremental Append")
+    print("=" * 50)
+    _, first_cut, second_cut = _vs_cuts()
+    full = first_cut + second_cut.split('\n', 1)[1]
+
+    base = upload_csv(client, 'vs.csv', first_cut)
+    assert base['success'], base
+    chart_ids = [_pin(client, base['file_info'], chart) for chart in CHART_SPECS]
+    for chart_id in chart_ids:
+        _chart(client, chart_id)  # rendered (and cached) before the append
+
+    appended = upload_csv(client, 'vs_cut2.csv', second_cut, append_to='vs.csv')
+    assert appended['success'], appended
+    assert appended['appended_rows'] == full.count('\n') - 1 - FIRST_CUT_ROWS
+    assert appended['updated_charts'] == len(CHART_SPECS)
+    assert appended['widened_columns'] == []
+    print(f"✅ Appended {appended['appended_rows']} rows, {appended['updated_charts']} charts updated")
+
+    fresh = upload_csv(client, 'vs_full.csv', full)
+    assert fresh['success'], fresh
+    assert fresh['file_info']['rows'] == appended['file_info']['rows']
+    assert fresh['file_info']['data_types'] == appended['file_info']['data_types']
+    assert fresh['file_info']['subject_count'] == appended['file_info']['subject_count']
+
+    # Profile: Chan-merged moments, extended histograms, merged value counts and distinct sketches
+    merged, rebuilt = _profile(client, 'vs.csv'), _profile(client, 'vs_full.csv')
+    assert merged['rows'] == rebuilt['rows']
+    for col, expected in rebuilt['columns'].items():
+        actual = merged['columns'][col]
+        for key in ('mean', 'std'):
+            if expected.get(key) is not None:
+                assert actual[key] == pytest.approx(expected[key], rel=1e-9), (col, key)
+        for key in ('type', 'null_count', 'unique_values', 'min', 'max'):
+            assert actual.get(key) == expected.get(key), (col, key)
+        if expected['unique_values'] <= TRACKED_VALUES:
+            assert actual['top_values'] == expected['top_values'], col
+        if 'histogram' in expected:
+            # The grid may be coarser than a fresh one, but every value sits in its bin exactly
+            values = pd.read_csv(VS_PATH, usecols=[col])[col].dropna().to_numpy(dtype=float)
+            edges = actual['histogram']['bin_edges']
+            assert len(edges) <= 21 and edges[0] <= expected['min'] and edges[-1] >= expected['max']
+            assert actual['histogram']['counts'] == np.histogram(values, bins=edges)[0].tolist(), col
+    print("✅ Profile matches a fresh upload of the combined file")
+
+    # Subject index: the text subject key is ordered through it
+    for offset in (0, 4000, 9000):
+        query = f'offset={offset}&limit=300&sort=USUBJID'
+        assert (client.get(f'/preview/vs.csv?{query}').get_json()['data']
+                == client.get(f'/preview/vs_full.csv?{query}').get_json()['data'])
+    print("✅ Subject order matches")
+
+    # Charts carried over from aggregates equal fresh renders of the combined file
+    for chart, chart_id in zip(CHART_SPECS, chart_ids):
+        fresh_id = _pin(client, fresh['file_info'], chart)
+        carried, rendered = _chart(client, chart_id), _chart(client, fresh_id)
+        assert json.loads(json.dumps(carried))['data'] == json.loads(json.dumps(rendered))['data'], chart
+    print("✅ Updated charts match fresh renders")
+
+    # What the UI calls after an append: every pin re-rendered from the combined data
+    refreshed = client.post('/dashboard/refresh', json={'chart_ids': chart_ids}).get_json()
+    assert refreshed['success'] and [chart['id'] for chart in refreshed['charts']] == chart_ids
+    for chart in refreshed['charts']:
+        assert chart['success'] and chart['spec']['content_hash'] == appended['file_info']['content_hash']
+        assert chart['chart'] == _chart(client, chart['id'])
+    print("✅ Dashboard refresh re-renders the pins against the appended data")
+
+
+def test_column_state_merges_like_one_pass():
+    rng = np.random.default_rng(7)
+    # Float throughout: a widened dtype is re-profiled in full rather than merged
+    cuts = [rng.integers(40, 60, 500), rng.integers(0, 200, 800), rng.integers(-500, 61, 300),
+            rng.normal(1e6, 1, 3000).round(3)]
+    cuts = [cut.astype(float) for cut in cuts]
+    state = column_state(pd.Series(cuts[0]))
+    for cut in cuts[1:]:
+        state = update_column_state(state, pd.Series(cut))
+    values = np.concatenate(cuts)
+    merged, fresh = profile_from_state(state), profile_from_state(column_state(pd.Series(values)))
+
+    assert merged['mean'] == pytest.approx(fresh['mean'], rel=1e-12)
+    assert merged['std'] == pytest.approx(fresh['std'], rel=1e-9)
+    assert (merged['min'], merged['max']) == (fresh['min'], fresh['max'])
+    edges = merged['histogram']['bin_edges']
+    assert len(edges) <= 21
+    # Integer data sits on bin edges, including the closed upper edge of earlier grids
+    assert merged['histogram']['counts'] == np.histogram(values, bins=edges)[0].tolist()
+
+    # Distinct sketches of the cuts merge into the sketch of all the values
+    assert len(state['sketch']) == DISTINCT_SKETCH_SIZE
+    assert state['sketch'] == column_state(pd.Series(values))['sketch']
+    assert merged['unique_values'] == fresh['unique_values']
+    assert merged['unique_values'] == pytest.approx(len(np.unique(values)), rel=0.1)
+    print("✅ Moments, histogram and distinct sketch merge exactly")
+
+
+def test_append_rejects_other_header(client):
+    header, first_cut, second_cut = _vs_cuts()
+    assert upload_csv(client, 'vs.csv', first_cut)['success']
+    blob_dir = os.path.join(client.application.config['UPLOAD_FOLDER'], 'blobs')
+    blobs = sorted(os.listdir(blob_dir))
+
+    columns = header.rstrip('\n').split(',')
+    reordered = ','.join([columns[1], columns[0]] + columns[2:]) + '\n'
+    for bad_header in (reordered, ','.join(columns[:-1]) + '\n'):
+        result = upload_csv(client, 'vs_cut2.csv', bad_header + second_cut.split('\n', 1)[1],
+                            append_to='vs.csv')
+        assert not result['success']
+        assert 'same columns' in result['error']
+
+    files = client.get('/files').get_json()['files']
+    assert [info['rows'] for info in files] == [FIRST_CUT_ROWS]
+    assert sorted(os.listdir(blob_dir)) == blobs  # rejected before the base was copied
+    print("✅ Appends with another header are rejected")
+
+
+def test_append_widens_column_type(client):
+    header, first_cut, _ = _vs_cuts()
+    assert upload_csv(client, 'vs.csv', first_cut)['success']
+
+    columns = header.rstrip('\n').split(',')
+    row = first_cut.splitlines()[1].split(',')
+    row[columns.index('VSSTRESN')] = 'high'
+    result = upload_csv(client, 'vs_cut2.csv', header + ','.join(row) + '\n', append_to='vs.csv')
+    assert result['success'], result
+    assert result['widened_columns'] == ['VSSTRESN']
+    assert 'VSSTRESN' in result['message']
+    assert result['file_info']['data_types']['VSSTRESN'] == 'object'
+
+    profile = _profile(client, 'vs.csv')['columns']['VSSTRESN']
+    assert profile['type'] == 'object' and not profile['numeric']
+    page = client.get('/preview/vs.csv?offset=6000&limit=1&columns=VSSTRESN').get_json()
+    assert page['data'] == [{'VSSTRESN': 'high'}]
+    print("✅ Text appended to a numeric column widens it to object and is reported")
+
+
+def test_append_merges_boolean_flags(client):
+    base = 'ID,FLAG,N\n' + ''.join(f"{i},{'True' if i % 2 else 'False'},{i % 2}\n" for i in range(6))
+    result = upload_csv(client, 'flags.csv', base)
+    assert result['file_info']['data_types'] == {'ID': 'int64', 'FLAG': 'bool', 'N': 'int64'}
+
+    # Blanks and 0/1 in a boolean column, booleans in a 0/1 column
+    result = upload_csv(client, 'flags_cut2.csv', 'ID,FLAG,N\n6,,True\n7,1,False\n', append_to='flags.csv')
+    assert result['success'], result
+    assert result['file_info']['data_types'] == {'ID': 'int64', 'FLAG': 'boolean', 'N': 'boolean'}
+    page = client.get('/preview/flags.csv?offset=4').get_json()['data']
+    assert page == [{'ID': 4, 'FLAG': False, 'N': False}, {'ID': 5, 'FLAG': True, 'N': True},
+                    {'ID': 6, 'FLAG': None, 'N': True}, {'ID': 7, 'FLAG': True, 'N': False}]
+    profile = _profile(client, 'flags.csv')['columns']['FLAG']
+    assert profile['top_values'] == [[True, 4], [False, 3]] and profile['null_count'] == 1
+
+    # Other numbers do not fit a flag column
+    result = upload_csv(client, 'flags_cut3.csv', 'ID,FLAG,N\n8,True,2\n', append_to='flags.csv')
+    assert result['file_info']['data_types']['N'] == 'object'
+    assert result['file_info']['data_types']['FLAG'] == 'boolean'
+    print("✅ Boolean and 0/1 cuts merge to a nullable boolean column")
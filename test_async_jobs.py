@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Test script for asynchronous query jobs (submit, poll, stream)
+"""
+
+import json
+import time
+
+from conftest import upload_csv
+
+
+def _wait_for_job(client, status_url, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        response = client.get(status_url)
+        assert response.status_code == 200
+        status = response.get_json()
+        if status['status'] in ('done', 'failed'):
+            return status
+        time.sleep(0.05)
+    raise AssertionError(f"Job did not finish: {status['status']}")
+
+
+def _stream_events(client, events_url):
+    """(stage, data) of every Server-Sent Event, read until the stream ends"""
+    response = client.get(events_url)
+    assert response.status_code == 200 and response.mimetype == 'text/event-stream'
+    events = []
+    for block in response.get_data(as_text=True).split('\n\n'):
+        lines = dict(line.split(': ', 1) for line in block.splitlines() if not line.startswith(':'))
+        if 'event' in lines:
+            events.append((lines['event'], json.loads(lines['data'])))
+    return events
+
+
+def test_async_jobs(client):
+    print("🧪 Testing Async Query Jobs")
+    print("=" * 50)
+    with open('sample_data/dm.csv', 'r', encoding='utf-8') as f:
+        assert upload_csv(client, 'dm.csv', f.read())['success']
+
+    # Submission answers at once with the job's id and status URLs
+    response = client.post('/visualize', json={'query': 'bar chart of AGE by SEX', 'async': True})
+    assert response.status_code == 202
+    job = response.get_json()
+    assert job['success'] and job['status'] == 'queued' and job['job_id']
+    assert job['status_url'] == f"/jobs/{job['job_id']}"
+    assert job['events_url'] == f"/jobs/{job['job_id']}/events"
+    print(f"✅ Job submitted: {job['job_id']}")
+
+    # Polling reaches done with the processor's result
+    status = _wait_for_job(client, job['status_url'])
+    assert status['status'] == 'done', status
+    assert status['job_id'] == job['job_id'] and status['kind'] == 'visualize'
+    result = status['result']
+    assert result['success'], result
+    assert result['chart_type'] == 'bar' and result['spec']['columns'] == ['AGE', 'SEX']
+    print("✅ Job finished with its chart")
+
+    # The event stream replays queued -> running -> done, the result on the last event
+    events = _stream_events(client, job['events_url'])
+    stages = [stage for stage, _ in events]
+    assert stages[:2] == ['queued', 'running'] and stages[-1] == 'done'
+    assert stages.count('done') == 1 and 'failed' not in stages
+    assert events[-1][1]['result'] == result
+    print(f"✅ Event stream replayed: {stages}")
+
+    # Another session (its own cookie jar) cannot see the job
+    other = client.application.test_client()
+    assert other.get(job['status_url']).status_code == 404
+    assert other.get(job['events_url']).status_code == 404
+    assert client.get('/jobs/not-a-job').status_code == 404
+    print("✅ Job hidden from other sessions")
+
+
+def test_async_query_needs_data(client):
+    response = client.post('/query', json={'query': 'how many subjects are there', 'async': True})
+    assert response.status_code == 200
+    assert not response.get_json()['success']
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+Test script for server-side histogram, bar and pie aggregation
+"""
+
+import numpy as np
+import pandas as pd
+
+from app.utils.chart_aggregation import (MAX_HISTOGRAM_BINS, auto_bin_count, category_counts,
+                                         grouped_sums, histogram_bins)
+
+
+def test_histogram_bins_follow_auto_rule():
+    print("🧪 Testing Histogram Binning")
+    print("=" * 50)
+    rng = np.random.default_rng(0)
+    for values in (rng.normal(0, 1, 1000), rng.exponential(1, 50), rng.integers(0, 5, 10000).astype(float)):
+        assert auto_bin_count(values) == len(np.histogram_bin_edges(values, bins='auto')) - 1
+        centers, counts, widths = histogram_bins(pd.Series(values))
+        assert len(centers) == auto_bin_count(values)
+        assert counts.sum() == len(values)
+        assert np.allclose(widths, widths[0])
+    print("✅ Bin counts match NumPy's 'auto' rule")
+
+
+def test_histogram_bins_are_capped():
+    rng = np.random.default_rng(1)
+    # One far outlier makes 'auto' ask for billions of bins
+    values = np.r_[rng.normal(0, 1, 100000), 1e9]
+    assert auto_bin_count(values) > 10 ** 9
+    centers, counts, _ = histogram_bins(pd.Series(values))
+    assert len(centers) == MAX_HISTOGRAM_BINS
+    assert counts.sum() == len(values) and counts[-1] == 1
+
+    centers, counts, _ = histogram_bins(pd.Series(rng.normal(0, 1, 100000)), max_bins=10)
+    assert len(centers) == 10
+    print("✅ Bin count capped before edges are built")
+
+
+def test_histogram_bins_edge_cases():
+    centers, counts, widths = histogram_bins(pd.Series([np.nan, np.inf, -np.inf]))
+    assert len(centers) == len(counts) == len(widths) == 0
+
+    centers, counts, widths = histogram_bins(pd.Series([3.0] * 7 + [np.nan, np.inf]))
+    assert centers.tolist() == [3.0] and counts.tolist() == [7] and widths.tolist() == [1.0]
+    print("✅ Missing, infinite and constant values handled")
+
+
+def test_category_counts_and_sums():
+    series = pd.Series(['b', 'a', 'c', 'a', 'b', None, 'd'])
+    counts = category_counts(series)
+    # Most frequent first, ties by value
+    assert list(counts.items()) == [('a', 2), ('b', 2), ('c', 1), ('d', 1)]
+
+    df = pd.DataFrame({'ARM': ['B', 'A', 'B', None], 'AGE': [30, 40, 50, 60]})
+    assert grouped_sums(df, 'ARM', 'AGE').to_dict() == {'A': 40, 'B': 80}
+    print("✅ Category counts and grouped sums")
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Test script for content-hashed chart image URLs
+"""
+
+import os
+import time
+import uuid
+
+from app.utils.chart_artifacts import (CHART_DIGEST_EXTENSION, CHART_DIRECTORY, CHART_KEEP_EXTENSION,
+                                       ChartRetention, chart_asset_url, keep_chart)
+
+
+def test_chart_url_serves_only_its_recorded_digest(client):
+    print("🧪 Testing Chart Asset URLs")
+    print("=" * 50)
+
+    filename = f"temp_chart_{uuid.uuid4()}.png"
+    path = os.path.join(CHART_DIRECTORY, filename)
+    with open(path, 'wb') as f:
+        f.write(b'\x89PNG\r\n\x1a\n' + os.urandom(64))
+    try:
+        url = chart_asset_url(filename)
+        digest = url.split('/')[2]
+
+        response = client.get(url)
+        assert response.status_code == 200
+        assert 'immutable' in response.headers['Cache-Control']
+        assert response.headers['ETag'] == f'"{digest}"'
+        print("✅ Recorded digest served with an immutable cache header")
+
+        assert client.get(url, headers={'If-None-Match': f'"{digest}"'}).status_code == 304
+
+        # Any other well-formed digest, with or without a matching If-None-Match
+        wrong = ('0' if digest[0] != '0' else '1') + digest[1:]
+        for headers in ({}, {'If-None-Match': f'"{wrong}"'}):
+            response = client.get(f'/charts/{wrong}/{filename}', headers=headers)
+            assert response.status_code == 404
+            assert 'immutable' not in response.headers.get('Cache-Control', '')
+        print("✅ Wrong digests are not served or cached")
+
+        # Charts without a recorded digest (e.g. pruned records) are not served either
+        os.remove(path + CHART_DIGEST_EXTENSION)
+        assert client.get(url).status_code == 404
+        assert client.get(f'/charts/{digest}/..%2Fsecret.png').status_code == 404
+        print("✅ Unrecorded charts return 404")
+    finally:
+        for leftover in (path, path + CHART_DIGEST_EXTENSION):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+
+
+def test_pinned_and_kept_charts_survive_pruning(client, tmp_path, monkeypatch):
+    from app import routes
+    from app.utils import chart_artifacts
+    monkeypatch.setattr(chart_artifacts, 'CHART_DIRECTORY', str(tmp_path))
+    monkeypatch.setattr(routes, 'CHART_DIRECTORY', str(tmp_path))
+
+    def write_chart(name):
+        with open(tmp_path / name, 'wb') as f:
+            f.write(b'\x89PNG\r\n\x1a\n' + os.urandom(64))
+        return chart_asset_url(name)
+
+    pinned_url = write_chart('pinned.png')
+    write_chart('cached.png')
+    write_chart('stale.png')
+    write_chart('stale_kept.png')
+
+    chart = {'chart_type': 'png', 'image_path': 'pinned.png', 'image_url': pinned_url}
+    result = client.post('/dashboard/pin', json={'chart': chart, 'title': 'Pinned'}).get_json()
+    assert result['success'], result
+    keep_chart('cached.png', time.time() + 3600)
+    keep_chart('stale_kept.png', time.time() - 1)
+
+    # Every chart is over age and over the count limit
+    removed = ChartRetention(directory=str(tmp_path), max_age=0, max_files=0).prune()
+    assert removed == 3
+    assert sorted(os.listdir(tmp_path)) == sorted(['cached.png', 'cached.png' + CHART_DIGEST_EXTENSION,
+                                                  'cached.png' + CHART_KEEP_EXTENSION, 'pinned'])
+    print("✅ Pruning spares pinned copies and charts of cached answers")
+
+    # The pin still renders, from its content-hashed copy
+    pin = client.get(f"/dashboard/charts/{result['chart_id']}").get_json()
+    assert pin['success'] and pin['chart']['image_url'].startswith('/charts/pinned/')
+    response = client.get(pin['chart']['image_url'])
+    assert response.status_code == 200 and response.data.startswith(b'\x89PNG')
+    assert 'immutable' in response.headers['Cache-Control']
+    assert client.get('/charts/pinned/..%2Fcached.png').status_code == 404
+
+    # A chart that is gone cannot be pinned
+    chart = {'chart_type': 'png', 'image_path': 'stale.png', 'image_url': None}
+    assert not client.post('/dashboard/pin', json={'chart': chart}).get_json()['success']
+    print("✅ Pinned chart served after its original was pruned")
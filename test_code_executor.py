@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Test script for re-running cached PandasAI-generated code
+"""
+
+import threading
+
+import matplotlib.pyplot as plt
+import pandas as pd
+import pytest
+
+from app.utils.code_executor import (LazyTables, UntrustedCodeError, execute_generated_code,
+                                     generated_code_entry, schema_fingerprint, verify_generated_code)
+
+SECRET = 'test-secret'
+CODE = ("df = execute_sql_query('SELECT COUNT(*) AS n FROM dm WHERE AGE >= 40')\n"
+        "result = {'type': 'number', 'value': int(df['n'][0])}")
+
+
+def test_verified_code_reruns_against_tables():
+    print("🧪 Testing Cached Code Re-execution")
+    print("=" * 50)
+    dm = pd.DataFrame({'USUBJID': ['S-1', 'S-2', 'S-3'], 'AGE': [35, 40, 62]})
+    fingerprint = schema_fingerprint({'dm': dm.iloc[:0]})
+    entry = generated_code_entry(CODE, fingerprint, SECRET)
+
+    tables = LazyTables({'dm': lambda: dm})
+    try:
+        response = execute_generated_code(verify_generated_code(entry, fingerprint, SECRET), tables)
+    finally:
+        tables.close()
+    assert response.value == 2 and tables.loaded == ['dm']
+    print("✅ Signed code for the same schema re-runs")
+
+
+def test_untrusted_entries_are_rejected():
+    dm = pd.DataFrame({'USUBJID': ['S-1'], 'AGE': [35]})
+    fingerprint = schema_fingerprint({'dm': dm})
+    entry = generated_code_entry(CODE, fingerprint, SECRET)
+
+    rejected = [
+        dict(entry, code=CODE + "\nimport os"),                      # edited in the cache directory
+        {'code': CODE},                                               # unsigned (older entries)
+        generated_code_entry(CODE, fingerprint, 'another-secret'),    # signed with another key
+    ]
+    for bad in rejected:
+        with pytest.raises(UntrustedCodeError):
+            verify_generated_code(bad, fingerprint, SECRET)
+
+    # The same code for a table whose columns changed type
+    other_schema = schema_fingerprint({'dm': dm.astype({'AGE': float})})
+    with pytest.raises(UntrustedCodeError):
+        verify_generated_code(entry, other_schema, SECRET)
+    print("✅ Edited, unsigned and other-schema entries are rejected")
+
+
+def test_generated_code_runs_one_job_at_a_time():
+    # Each run draws on pyplot's current figure while others start theirs
+    code = ("import time\nimport matplotlib.pyplot as plt\n"
+            "plt.figure()\nplt.plot([1, 2])\ntime.sleep(0.02)\n"
+            "result = {'type': 'number', 'value': len(plt.gcf().axes[0].lines)}")
+    results = []
+
+    def run():
+        tables = LazyTables({})
+        try:
+            results.append(execute_generated_code(code, tables).value)
+        finally:
+            tables.close()
+
+    threads = [threading.Thread(target=run) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == [1] * 6
+    assert plt.get_fignums() == []
+    print("✅ Concurrent runs never share a pyplot figure")
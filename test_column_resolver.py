@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+"""
+Test script for resolving query words to dataset columns
+"""
+
+import pandas as pd
+
+from app.utils.column_resolver import MIN_SCORE, ColumnResolver
+
+
+def _columns(domain):
+    columns = pd.read_csv(f'sample_data/{domain}.csv', nrows=0).columns.tolist()
+    if domain == 'ae':
+        # The sample AE file has no severity column; most AE datasets do
+        columns.insert(columns.index('AESER'), 'AESEV')
+    return columns
+
+
+# (domain, query, leading columns by score; [] when nothing should resolve)
+CASES = [
+    ('dm', 'heart rate over time', []),
+    ('vs', 'heart rate over time', []),
+    ('ae', 'serious adverse events by severity', ['AESEV', 'AESER']),
+    ('ae', 'adverse events by severity', ['AESEV']),
+    ('ae', 'events by outcome', ['AEOUT']),
+    ('dm', 'age by sex', ['AGE', 'SEX']),
+    ('dm', 'subjects by treatment group', ['ARM', 'USUBJID']),
+    ('dm', 'reference start time', ['RFSTDTC']),
+    ('vs', 'blood pressure by visit', ['VISIT']),
+]
+
+
+def test_resolver_cases():
+    print("🧪 Testing Column Resolution")
+    print("=" * 50)
+    resolvers = {}
+    for domain, query, expected in CASES:
+        if domain not in resolvers:
+            resolvers[domain] = ColumnResolver.from_columns(_columns(domain))
+        matches = resolvers[domain].resolve(query)
+        assert all(match['score'] >= MIN_SCORE for match in matches)
+        found = [match['column'] for match in matches[:len(expected)]]
+        assert found == expected and (expected or not matches), (domain, query, matches[:4])
+        print(f"✅ {domain}: {query!r} -> {found or 'no match'}")
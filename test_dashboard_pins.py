@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""
+Test script for pinning query charts to the dashboard
+"""
+
+import os
+
+import plotly.graph_objects as go
+from pandasai.core.response.chart import ChartResponse
+
+from app import routes
+from app.utils import chart_artifacts
+from app.utils.query_cache import chart_cache
+from app.utils.query_processor import QueryProcessor
+
+
+def test_query_png_is_pinned_by_spec(client, tmp_path, monkeypatch):
+    print("🧪 Testing Dashboard Pins")
+    print("=" * 50)
+    monkeypatch.setattr(chart_artifacts, 'CHART_DIRECTORY', str(tmp_path))
+    monkeypatch.setattr(routes, 'CHART_DIRECTORY', str(tmp_path))
+    path = tmp_path / 'temp_chart_query.png'
+    path.write_bytes(b'\x89PNG\r\n\x1a\n' + os.urandom(64))
+
+    result = QueryProcessor()._convert_pandasai_response(ChartResponse(str(path), ''))
+    spec = result['spec']
+    assert spec == dict(result['chart'], kind='image')
+
+    pinned = client.post('/dashboard/pin', json={'spec': spec, 'title': 'Ages'}).get_json()
+    assert pinned['success'], pinned
+    entry = client.get('/dashboard').get_json()['charts'][0]
+    assert entry['kind'] == 'image' and entry['chart_type'] == 'png'
+    chart = client.get(entry['chart_url']).get_json()['chart']
+    assert chart['image_url'].startswith('/charts/pinned/')
+    print("✅ /query PNG results carry a spec the dashboard pins")
+
+
+def test_figure_pins_outlive_the_chart_cache(client, monkeypatch):
+    fig = go.Figure(go.Bar(x=['F', 'M'], y=[20, 24]))
+    result = QueryProcessor()._convert_pandasai_response(ChartResponse(fig, ''))
+    assert 'spec' not in result
+
+    pinned = client.post('/dashboard/pin', json={'chart': result['chart'], 'title': 'Sex'}).get_json()
+    assert pinned['success'], pinned
+
+    # Every chart cache entry has expired
+    monkeypatch.setattr(chart_cache, 'ttl', 0)
+    body = client.get(f"/dashboard/charts/{pinned['chart_id']}").get_json()
+    assert body['success'], body
+    assert body['chart']['chart_type'] == 'plotly'
+    assert body['chart']['data']['data'][0]['y'] == [20, 24]
+    print("✅ Pinned figures live in the dashboard record")
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Test script for the paged, sorted and filtered data preview
+"""
+
+import glob
+import io
+import itertools
+import os
+
+import numpy as np
+import pandas as pd
+
+from app.utils.data_preview import PreviewError, parse_filter
+from conftest import upload_csv
+
+
+def _sample_csv():
+    rng = np.random.default_rng(3)
+    rows = ["USUBJID,AGE,ARM"]
+    for i in range(40):
+        subject = '' if i % 13 == 5 else f"S-{rng.integers(1, 15)}"
+        age = '' if i % 7 == 3 else str(rng.choice([35, 40, 50, 50, 62]))
+        arm = rng.choice(['Placebo', 'Drug A', 'Drug B', ''])
+        rows.append(f"{subject},{age},{arm}")
+    return '\n'.join(rows) + '\n'
+
+
+def _expected_page(df, sort, descending, filters, offset, limit):
+    mask = np.ones(len(df), dtype=bool)
+    for column, op, value in filters:
+        series = df[column]
+        if op == 'null':
+            mask &= series.isna().to_numpy()
+            continue
+        if pd.api.types.is_numeric_dtype(series):
+            value = float(value)
+        compare = {'eq': series.eq, 'ne': series.ne, 'ge': series.ge, 'lt': series.lt}[op]
+        mask &= (compare(value) & series.notna()).to_numpy()
+    rows = df[mask]
+    if sort:
+        rows = rows.sort_values(sort, ascending=not descending, kind='stable', na_position='last')
+    page = rows.iloc[offset:offset + limit]
+    return page.astype(object).where(page.notna(), None).to_dict('records'), int(mask.sum())
+
+
+def test_preview_pages_match_pandas(client):
+    print("🧪 Testing Paged Preview")
+    print("=" * 50)
+    content = _sample_csv()
+    assert upload_csv(client, 'dm.csv', content)['success']
+    df = pd.read_csv(io.StringIO(content))
+
+    filter_sets = [[], [('AGE', 'ge', '40')], [('ARM', 'eq', 'Placebo'), ('AGE', 'ne', '50')],
+                   [('AGE', 'null', None)], [('USUBJID', 'lt', 'S-5')]]
+    windows = [(0, 5), (7, 10), (30, 20), (100, 5)]
+    for sort, descending, filters, (offset, limit) in itertools.product(
+            [None, 'AGE', 'ARM', 'USUBJID'], [False, True], filter_sets, windows):
+        params = [('offset', offset), ('limit', limit)]
+        if sort:
+            params += [('sort', sort), ('desc', '1' if descending else '0')]
+        params += [('filter', ':'.join(part for part in f if part is not None)) for f in filters]
+        body = client.get('/preview/dm.csv', query_string=params).get_json()
+        assert body['success'], body
+
+        expected, matched = _expected_page(df, sort, descending and bool(sort), filters, offset, limit)
+        assert body['data'] == expected, (sort, descending, filters, offset)
+        assert body['matched_rows'] == matched and body['total_rows'] == len(df)
+        assert ('profile' in body) == (offset == 0)
+    print("✅ Sort, desc=1, filters and offset/limit match pandas")
+
+
+def test_preview_projection_and_limits(client):
+    assert upload_csv(client, 'dm.csv', _sample_csv())['success']
+
+    body = client.get('/preview/dm.csv?columns=ARM,AGE&limit=3').get_json()
+    assert body['columns'] == ['ARM', 'AGE'] and len(body['data']) == 3
+    assert set(body['data'][0]) == {'ARM', 'AGE'}
+
+    max_rows = client.application.config['PREVIEW_MAX_ROWS']
+    body = client.get(f'/preview/dm.csv?limit={max_rows * 10}').get_json()
+    assert body['limit'] == max_rows
+
+    for query in ('sort=NOPE', 'columns=AGE,NOPE', 'filter=AGE:between:1', 'filter=AGE:eq',
+                  'filter=AGE:gt:old'):
+        response = client.get(f'/preview/dm.csv?{query}')
+        assert response.status_code == 400 and not response.get_json()['success'], query
+    print("✅ Projection, row cap and invalid requests")
+
+
+def test_sort_orders_are_stored_and_reused(client):
+    result = upload_csv(client, 'dm.csv', _sample_csv())
+    assert result['success']
+    assert result['file_info']['subject_key'] == 'USUBJID'
+    blob = os.path.splitext(result['file_info']['columnar_path'])[0]
+
+    # The text subject key is ordered by the subject index, with no sort file
+    client.get('/preview/dm.csv?sort=USUBJID')
+    assert glob.glob(blob + '.sort.*.npz') == []
+
+    first = client.get('/preview/dm.csv?sort=AGE&limit=40').get_json()['data']
+    sort_files = glob.glob(blob + '.sort.*.npz')
+    assert len(sort_files) == 1
+
+    # A stored order is read back as is: replace it and the page follows
+    with np.load(sort_files[0]) as data:
+        order, valid, groups = data['order'], data['valid'], data['groups']
+    mtime_ns = os.stat(sort_files[0]).st_mtime_ns
+    np.savez(sort_files[0].replace('.npz', ''), order=order[::-1].copy(), valid=valid, groups=groups)
+    os.utime(sort_files[0], ns=(mtime_ns + 10 ** 9, mtime_ns + 10 ** 9))  # coarse clocks
+    reused = client.get('/preview/dm.csv?sort=AGE&limit=40').get_json()['data']
+    assert reused == first[::-1]
+    assert len(glob.glob(blob + '.sort.*.npz')) == 1
+    print("✅ Sort orders stored next to the upload and reused")
+
+
+def test_parse_filter():
+    assert parse_filter('VSTESTCD:eq:PULSE') == ('VSTESTCD', 'eq', 'PULSE')
+    assert parse_filter('VSDTC:lt:2013-07-03T10:00') == ('VSDTC', 'lt', '2013-07-03T10:00')
+    assert parse_filter('AESER:notnull') == ('AESER', 'notnull', None)
+    for text in ('AGE', 'AGE:like:4', 'AGE:gt'):
+        try:
+            parse_filter(text)
+        except PreviewError:
+            continue
+        raise AssertionError(f"{text!r} should be rejected")
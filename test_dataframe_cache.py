@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Test script for the process-wide DataFrame cache
+"""
+
+import threading
+import time
+
+import pandas as pd
+
+from app.utils.dataframe_cache import DataFrameCache
+
+
+class _SlowLoader:
+    """Loader that counts calls and the most loads seen running at once"""
+
+    def __init__(self, delay=0.05):
+        self.delay = delay
+        self.calls = 0
+        self.active = 0
+        self.max_active = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, file_path, columns):
+        with self._lock:
+            self.calls += 1
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        time.sleep(self.delay)
+        with self._lock:
+            self.active -= 1
+        return pd.DataFrame({'AGE': range(1000)})
+
+
+def _run_threads(count, target, stagger=0.0):
+    threads = [threading.Thread(target=target) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+        time.sleep(stagger)
+    for thread in threads:
+        thread.join()
+
+
+def test_concurrent_misses_load_once(tmp_path):
+    print("🧪 Testing DataFrame Cache Loads")
+    print("=" * 50)
+    path = tmp_path / 'dm.csv'
+    path.write_text('AGE\n1\n')
+    cache = DataFrameCache()
+    loader = _SlowLoader()
+    results = []
+    start = threading.Barrier(16)
+
+    def read():
+        start.wait()
+        results.append(cache.get(str(path), loader))
+
+    _run_threads(16, read)
+    assert loader.calls == 1
+    assert len(results) == 16 and all(df is results[0] for df in results)
+    assert cache.stats()['misses'] == 1
+    print("✅ 16 concurrent misses parsed the file once")
+
+
+def test_uncached_loads_never_overlap(tmp_path):
+    # Frames over the budget are not kept, so every thread loads in turn;
+    # threads arriving while earlier ones still wait must join the same lock
+    path = tmp_path / 'dm.csv'
+    path.write_text('AGE\n1\n')
+    cache = DataFrameCache(max_bytes=1)
+    loader = _SlowLoader(delay=0.02)
+
+    _run_threads(8, lambda: cache.get(str(path), loader), stagger=0.01)
+    assert loader.calls == 8
+    assert loader.max_active == 1
+    assert cache.stats()['entries'] == 0 and cache._load_locks == {}
+    print("✅ Loads of one key never ran in parallel")
@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+"""
+Test script for the upload-time dataset profile
+"""
+
+import json
+
+import numpy as np
+import pandas as pd
+
+from app.utils.dataset_profile import column_state, profile_from_state, update_column_state
+from conftest import upload_csv
+
+
+def _reject_constant(name):
+    raise ValueError(f"Non-standard JSON constant {name}")
+
+
+def test_infinite_values_keep_preview_json_strict(client):
+    print("🧪 Testing Profile of a Column with inf")
+    print("=" * 50)
+
+    result = upload_csv(client, 'vitals.csv', "USUBJID,VSSTRESN\nS1,1.5\nS2,inf\nS3,2.5\n")
+    assert result['success'], result
+
+    # Page 0 carries the rows and the profile; both must be strict JSON
+    response = client.get('/preview/vitals.csv')
+    body = json.loads(response.get_data(as_text=True), parse_constant=_reject_constant)
+    assert body['success']
+    assert body['data'][1]['VSSTRESN'] is None
+
+    profile = body['profile']['columns']['VSSTRESN']
+    assert profile['mean'] == 2.0
+    assert profile['min'] == 1.5 and profile['max'] == 2.5
+    assert profile['std'] == np.std([1.5, 2.5], ddof=1)
+    assert profile['non_finite_count'] == 1
+    assert [1.5, 1] in profile['top_values'] and [None, 1] not in profile['top_values']
+    print("✅ inf left out of moments and counted separately")
+
+
+def test_appended_infinite_values_are_counted():
+    state = update_column_state(column_state(pd.Series([1.0, -np.inf])),
+                                pd.Series([np.inf, 3.0]))
+    profile = profile_from_state(state)
+    assert profile['non_finite_count'] == 2
+    assert profile['mean'] == 2.0
+    assert sum(profile['histogram']['counts']) == 2
+    print("✅ Appended inf merged into the column state")
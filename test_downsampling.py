@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Test script for server-side downsampling of large scatter and line charts
+"""
+
+import numpy as np
+import pandas as pd
+
+from app.utils.downsampling import (SCATTER_GRID_SIZE, density_sample_indices, downsample_line,
+                                    lttb_indices)
+from conftest import upload_csv
+
+
+def test_lttb_keeps_one_point_per_bucket():
+    print("🧪 Testing LTTB")
+    print("=" * 50)
+    rng = np.random.default_rng(0)
+    n, threshold = 1003, 50
+    x = np.arange(n, dtype=float)
+    y = rng.normal(0, 1, n)
+    y[517] = 40.0  # a spike must survive
+
+    selected = lttb_indices(x, y, threshold)
+    assert len(selected) == threshold
+    assert selected[0] == 0 and selected[-1] == n - 1
+    assert np.all(np.diff(selected) > 0)
+    # Bucket i (of threshold - 2 between the end points) covers [edges[i], edges[i + 1])
+    edges = np.floor(np.linspace(1, n - 1, threshold - 1)).astype(int)
+    for i, position in enumerate(selected[1:-1]):
+        assert edges[i] <= position < edges[i + 1]
+    assert 517 in selected
+    print("✅ First, last and one point per bucket, spike kept")
+
+
+def test_lttb_small_inputs():
+    x = np.arange(10, dtype=float)
+    assert lttb_indices(x, x, 10).tolist() == list(range(10))
+    assert lttb_indices(x, x, 20).tolist() == list(range(10))
+    assert lttb_indices(x, x, 2).tolist() == list(range(10))
+    # Buckets of a single point when the threshold is just below the length
+    assert lttb_indices(x, x ** 2, 9).tolist() == [0, 1, 2, 3, 4, 5, 6, 7, 9]
+
+
+def test_downsample_line_sorts_and_drops_missing():
+    df = pd.DataFrame({'DAY': np.r_[np.arange(3000, 0, -1), [np.nan] * 10],
+                       'VALUE': np.r_[np.sin(np.arange(3000) / 50), np.ones(10)]})
+    reduced, sampling = downsample_line(df, 'DAY', 'VALUE', 500)
+    assert len(reduced) == 500
+    assert sampling == {'applied': True, 'method': 'lttb', 'original_points': 3010, 'returned_points': 500}
+    assert reduced['DAY'].is_monotonic_increasing and reduced['DAY'].notna().all()
+    assert (reduced['DAY'].iloc[0], reduced['DAY'].iloc[-1]) == (1, 3000)
+
+    unchanged, sampling = downsample_line(df.head(100), 'DAY', 'VALUE', 500)
+    assert len(unchanged) == 100 and not sampling['applied']
+
+
+def test_density_sample_keeps_sparse_cells():
+    rng = np.random.default_rng(1)
+    x = np.r_[rng.normal(0, 0.01, 20000), [5.0, -5.0]]
+    y = np.r_[rng.normal(0, 0.01, 20000), [5.0, -5.0]]
+    selected = density_sample_indices(x, y, 1000)
+    assert len(selected) == 1000 and len(np.unique(selected)) == 1000
+    assert np.all(np.diff(selected) > 0)
+    assert 20000 in selected and 20001 in selected  # outliers in cells of their own
+    assert np.array_equal(selected, density_sample_indices(x, y, 1000))  # stable between requests
+
+    # Every occupied grid cell keeps at least one point
+    def cells(values):
+        return ((values - values.min()) / (values.max() - values.min()) * (SCATTER_GRID_SIZE - 1)).astype(int)
+    occupied = set(zip(cells(x), cells(y)))
+    assert set(zip(cells(x)[selected], cells(y)[selected])) == occupied
+    print("✅ Density sampling keeps outliers and is deterministic")
+
+
+def test_chart_point_counts(client):
+    client.application.config['CHART_POINT_BUDGET'] = 2000
+    result = upload_csv(client, 'vs.csv', open('sample_data/vs.csv', encoding='utf-8').read())
+    assert result['success'], result
+    file_info = result['file_info']
+
+    for chart_type, x_col, y_col, original in (('scatter', 'VSDY', 'VSSTRESN', None),
+                                               ('line', 'VSDTC', 'VSSTRESN', file_info['rows'])):
+        spec = {'kind': 'visualization', 'query': f'{chart_type} of {y_col} by {x_col}',
+                'filename': 'vs.csv', 'content_hash': file_info['content_hash'], 'view': None,
+                'x_column': x_col, 'y_column': y_col, 'columns': [x_col, y_col],
+                'joined_columns': {}, 'chart_type': chart_type}
+        chart_id = client.post('/dashboard/pin', json={'spec': spec}).get_json()['chart_id']
+        chart = client.get(f'/dashboard/charts/{chart_id}').get_json()['chart']
+
+        sampling = chart['sampling']
+        assert sampling['applied'] and sampling['returned_points'] == 2000
+        if original is not None:
+            assert sampling['original_points'] == original
+        assert sum(len(trace['x']) for trace in chart['data']['data']) == 2000
+        print(f"✅ {chart_type}: {sampling['original_points']} points reduced to 2000")
@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+"""
+Test script for converting and caching PandasAI query results
+"""
+
+import json
+
+import plotly.graph_objects as go
+from flask import jsonify
+from pandasai.core.response.chart import ChartResponse
+
+from app.utils.query_cache import query_cache
+from app.utils.query_processor import QueryProcessor
+from app.utils.raw_json import RawJSON
+
+
+def test_plotly_chart_is_serialized_once(client):
+    print("🧪 Testing Plotly Query Results")
+    print("=" * 50)
+    fig = go.Figure(go.Bar(x=['F', 'M'], y=[20, 24]))
+    processor = QueryProcessor()
+    result = processor._convert_pandasai_response(ChartResponse(fig, ''))
+
+    assert result['chart_type'] == 'plotly'
+    assert isinstance(result['chart']['data'], RawJSON)
+    with client.application.app_context():
+        body = json.loads(jsonify({'success': True, 'result': result}).get_data(as_text=True))
+    assert body['result']['chart']['data'] == json.loads(fig.to_json())
+    print("✅ Figure embedded verbatim, as for /visualize")
+
+    # A disk-tier hit gives the figure back as a string; it is embedded, not quoted
+    query_cache.set('plotly-result', {'success': True, 'result': result})
+    query_cache._entries.clear()
+    cached = processor._get_cached_result('plotly-result')
+    assert cached['cached'] and isinstance(cached['result']['chart']['data'], RawJSON)
+    with client.application.app_context():
+        body = json.loads(jsonify(cached).get_data(as_text=True))
+    assert body['result']['chart']['data'] == json.loads(fig.to_json())
+    print("✅ Cached figures keep the pre-serialized path")
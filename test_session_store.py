@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""
+Test script for the server-side session store backends
+"""
+
+import time
+
+import pytest
+
+from app.utils.session_store import FileSystemSessionStore, SessionStore, SQLiteSessionStore
+
+
+def test_incomplete_backend_fails_at_construction():
+    class NoCleanupStore(SessionStore):
+        def load(self, sid):
+            return None
+
+        def save(self, sid, data, expires_at):
+            pass
+
+        def touch(self, sid, expires_at):
+            pass
+
+        def delete(self, sid):
+            pass
+
+    with pytest.raises(TypeError, match='cleanup'):
+        NoCleanupStore()
+    print("✅ Backends missing a method cannot be constructed")
+
+
+@pytest.mark.parametrize('make_store', [lambda root: SQLiteSessionStore(str(root / 'sessions.db')),
+                                        lambda root: FileSystemSessionStore(str(root / 'sessions'))])
+def test_backend_round_trip(tmp_path, make_store):
+    store = make_store(tmp_path)
+    now = time.time()
+    store.save('live', {'uploaded_files': [{'filename': 'dm.csv'}], 'pair': (1, 2)}, now + 60)
+    store.save('stale', {}, now + 60)
+    store.touch('stale', now - 1)
+
+    data, expires_at = store.load('live')
+    assert data == {'uploaded_files': [{'filename': 'dm.csv'}], 'pair': (1, 2)}
+    assert expires_at == pytest.approx(now + 60, abs=1)
+    assert store.load('stale') is None and store.cleanup() == ['stale']
+
+    store.delete('live')
+    assert store.load('live') is None